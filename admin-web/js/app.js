@@ -15,7 +15,7 @@ async function apiRequest(url, options = {}) {
     };
     
     if (currentUser) {
-        headers['X-User-Id'] = currentUser.id;
+        headers['Authorization'] = `Bearer ${currentUser.token}`;
     }
     
     try {
@@ -71,6 +71,19 @@ $('#loginForm').addEventListener('submit', async (e) => {
 
 // 退出登录
 $('#logoutBtn').addEventListener('click', () => {
+    // 吊销服务端令牌（失败不影响本地退出）
+    if (currentUser) {
+        fetch(`${API_BASE_URL}/auth/logout`, {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${currentUser.token}` }
+        }).catch(() => {});
+    }
+    
+    if (statsStream) {
+        statsStream.close();
+        statsStream = null;
+    }
+    
     currentUser = null;
     $('#userName').textContent = '未登录';
     $('#logoutBtn').style.display = 'none';
@@ -265,7 +278,7 @@ async function loadMenus() {
                             <td>${m.canteen_name}</td>
                             <td>${m.menu_date}</td>
                             <td>${mealTypeMap[m.meal_type]}</td>
-                            <td><span class="status-badge status-${m.status}">${m.status === 'active' ? '启用' : '禁用'}</span></td>
+                            <td><span class="status-badge status-${m.status}">${{ active: '启用', closed: '已结束' }[m.status] || '禁用'}</span></td>
                             <td>
                                 <div class="action-buttons">
                                     <button class="btn-view" onclick="viewMenu(${m.id})">查看详情</button>
@@ -285,6 +298,36 @@ async function loadMenus() {
 
 $('#filterMenusBtn').addEventListener('click', loadMenus);
 
+// 复制一段日期的菜单（含菜品和数量），食堂取菜单筛选中的食堂，不选则复制全部食堂
+$('#cloneMenusBtn').addEventListener('click', async () => {
+    const sourceStart = $('#cloneSourceStart').value;
+    const sourceEnd = $('#cloneSourceEnd').value || sourceStart;
+    const targetStart = $('#cloneTargetStart').value;
+    const canteenId = $('#menuCanteenFilter').value;
+    
+    if (!sourceStart || !targetStart) {
+        alert('请选择源日期和目标日期');
+        return;
+    }
+    
+    try {
+        const result = await apiRequest('/menus/clone', {
+            method: 'POST',
+            body: JSON.stringify({
+                source_start: sourceStart,
+                source_end: sourceEnd,
+                target_start: targetStart,
+                canteen_id: canteenId ? parseInt(canteenId) : null
+            })
+        });
+        
+        alert(`复制成功：${result.menus} 个菜单，${result.items} 个菜品`);
+        loadMenus();
+    } catch (error) {
+        // 错误已处理
+    }
+});
+
 // 查看菜单详情
 async function viewMenu(menuId) {
     try {
@@ -325,37 +368,66 @@ async function viewMenu(menuId) {
     }
 }
 
-// 加载订单列表
+// 加载订单列表（按游标分页，点击“加载更多”追加下一页）
+let ordersQuery = '';
+let ordersCursor = null;
+
+function renderOrderRows(orders) {
+    const mealTypeMap = {
+        'breakfast': '早餐',
+        'lunch': '午餐',
+        'dinner': '晚餐'
+    };
+    
+    const statusMap = {
+        'placed': '已下单',
+        'cancelled': '已取消',
+        'completed': '已完成'
+    };
+    
+    return orders.map(o => `
+        <tr>
+            <td>${o.order_no}</td>
+            <td>${o.user_name}</td>
+            <td>${o.employee_id}</td>
+            <td>${o.order_date}</td>
+            <td>${mealTypeMap[o.meal_type]}</td>
+            <td>¥${o.total_amount.toFixed(2)}</td>
+            <td><span class="status-badge status-${o.status}">${statusMap[o.status]}</span></td>
+            <td>
+                <div class="action-buttons">
+                    <button class="btn-view" onclick="viewOrder(${o.id})">查看详情</button>
+                </div>
+            </td>
+        </tr>
+    `).join('');
+}
+
 async function loadOrders() {
     const canteenId = $('#orderCanteenFilter').value;
     const orderDate = $('#orderDateFilter').value;
     const mealType = $('#orderMealTypeFilter').value;
+    const status = $('#orderStatusFilter').value;
+    
+    $('#ordersMore').style.display = 'none';
     
     if (!canteenId) {
         $('#ordersList').innerHTML = '<div class="empty-state">请选择食堂</div>';
         return;
     }
     
-    let url = `/orders/canteen/${canteenId}?`;
-    if (orderDate) url += `order_date=${orderDate}&`;
-    if (mealType) url += `meal_type=${mealType}&`;
+    ordersQuery = `/orders/canteen/${canteenId}?`;
+    if (orderDate) ordersQuery += `order_date=${orderDate}&`;
+    if (mealType) ordersQuery += `meal_type=${mealType}&`;
+    if (status) ordersQuery += `status=${status}&`;
     
     try {
-        const orders = await apiRequest(url);
-        
-        const mealTypeMap = {
-            'breakfast': '早餐',
-            'lunch': '午餐',
-            'dinner': '晚餐'
-        };
-        
-        const statusMap = {
-            'placed': '已下单',
-            'cancelled': '已取消',
-            'completed': '已完成'
-        };
+        // 总数只在第一页统计
+        const page = await apiRequest(`${ordersQuery}with_total=1`);
+        ordersCursor = page.next_cursor;
         
         const html = `
+            <p>共 ${page.total} 条订单</p>
             <table>
                 <thead>
                     <tr>
@@ -369,33 +441,69 @@ async function loadOrders() {
                         <th>操作</th>
                     </tr>
                 </thead>
-                <tbody>
-                    ${orders.map(o => `
-                        <tr>
-                            <td>${o.order_no}</td>
-                            <td>${o.user_name}</td>
-                            <td>${o.employee_id}</td>
-                            <td>${o.order_date}</td>
-                            <td>${mealTypeMap[o.meal_type]}</td>
-                            <td>¥${o.total_amount.toFixed(2)}</td>
-                            <td><span class="status-badge status-${o.status}">${statusMap[o.status]}</span></td>
-                            <td>
-                                <div class="action-buttons">
-                                    <button class="btn-view" onclick="viewOrder(${o.id})">查看详情</button>
-                                </div>
-                            </td>
-                        </tr>
-                    `).join('')}
+                <tbody id="ordersTableBody">
+                    ${renderOrderRows(page.orders)}
                 </tbody>
             </table>
         `;
         
-        $('#ordersList').innerHTML = orders.length > 0 ? html : '<div class="empty-state">暂无订单数据</div>';
+        $('#ordersList').innerHTML = page.orders.length > 0 ? html : '<div class="empty-state">暂无订单数据</div>';
+        $('#ordersMore').style.display = ordersCursor ? 'block' : 'none';
+    } catch (error) {
+        // 错误已处理
+    }
+}
+
+async function loadMoreOrders() {
+    if (!ordersCursor) return;
+    
+    try {
+        const page = await apiRequest(`${ordersQuery}cursor=${encodeURIComponent(ordersCursor)}`);
+        ordersCursor = page.next_cursor;
+        $('#ordersTableBody').insertAdjacentHTML('beforeend', renderOrderRows(page.orders));
+        $('#ordersMore').style.display = ordersCursor ? 'block' : 'none';
     } catch (error) {
         // 错误已处理
     }
 }
 
+$('#loadMoreOrdersBtn').addEventListener('click', loadMoreOrders);
+
+// 导出订单明细或餐次统计（食堂取订单筛选中的食堂）
+$('#exportBtn').addEventListener('click', async () => {
+    const canteenId = $('#orderCanteenFilter').value;
+    const startDate = $('#exportStartDate').value;
+    const endDate = $('#exportEndDate').value || startDate;
+    const type = $('#exportType').value;
+    const format = $('#exportFormat').value;
+    
+    if (!canteenId || !startDate) {
+        alert('请选择食堂和导出日期');
+        return;
+    }
+    
+    try {
+        const response = await fetch(
+            `${API_BASE_URL}/export/${type}?canteen_id=${canteenId}&start_date=${startDate}&end_date=${endDate}&format=${format}`,
+            { headers: { 'Authorization': `Bearer ${currentUser.token}` } }
+        );
+        
+        // 参数错误时返回JSON
+        if ((response.headers.get('Content-Type') || '').startsWith('application/json')) {
+            const data = await response.json();
+            throw new Error(data.message);
+        }
+        
+        const blob = await response.blob();
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = `${type}_${canteenId}_${startDate}_${endDate}.${format}`;
+        link.click();
+        URL.revokeObjectURL(link.href);
+    } catch (error) {
+        alert(`导出失败: ${error.message}`);
+    }
+});
 $('#filterOrdersBtn').addEventListener('click', loadOrders);
 
 // 查看订单详情
@@ -409,7 +517,131 @@ async function viewOrder(orderId) {
 }
 
 // 获取餐次统计
-$('#getStatsBtn').addEventListener('click', async () => {
+// 实时统计：先收到snapshot，之后按delta增量更新
+let statsStream = null;
+let statsState = null;
+
+function renderStatistics() {
+    const dishes = Object.values(statsState.dishes)
+        .filter(d => d.order_count > 0)
+        .sort((a, b) => b.total_quantity - a.total_quantity || a.dish_id - b.dish_id);
+    
+    const dishStatsHtml = `
+        <table>
+            <thead>
+                <tr>
+                    <th>菜品名称</th>
+                    <th>订单数</th>
+                    <th>总数量</th>
+                </tr>
+            </thead>
+            <tbody>
+                ${dishes.map(d => `
+                    <tr>
+                        <td>${d.dish_name}</td>
+                        <td>${d.order_count}</td>
+                        <td>${d.total_quantity}</td>
+                    </tr>
+                `).join('')}
+            </tbody>
+        </table>
+    `;
+    
+    const userStatsHtml = `
+        <table>
+            <thead>
+                <tr>
+                    <th>工号</th>
+                    <th>姓名</th>
+                    <th>订单号</th>
+                    <th>下单时间</th>
+                </tr>
+            </thead>
+            <tbody>
+                ${statsState.users.map(u => `
+                    <tr>
+                        <td>${u.employee_id}</td>
+                        <td>${u.full_name}</td>
+                        <td>${u.order_no}</td>
+                        <td>${u.created_at}</td>
+                    </tr>
+                `).join('')}
+            </tbody>
+        </table>
+    `;
+    
+    const html = `
+        <div class="stats-card">
+            <h3>订单总数: ${statsState.total_orders}</h3>
+        </div>
+        <div class="stats-section">
+            <h3>按菜品统计</h3>
+            ${dishStatsHtml}
+        </div>
+        <div class="stats-section">
+            <h3>按员工统计</h3>
+            ${userStatsHtml}
+        </div>
+    `;
+    
+    $('#statisticsContent').innerHTML = html;
+}
+
+function applyStatsDelta(change) {
+    statsState.total_orders += change.order_delta;
+    change.dishes.forEach(d => {
+        const dish = statsState.dishes[d.dish_id] || { dish_id: d.dish_id, total_quantity: 0, order_count: 0 };
+        dish.dish_name = d.dish_name;
+        dish.total_quantity += d.quantity_delta;
+        dish.order_count += d.order_count_delta;
+        statsState.dishes[d.dish_id] = dish;
+    });
+    
+    const order = change.order || {};
+    if (order.action === 'placed' && !statsState.users.some(u => u.order_no === order.order_no)) {
+        statsState.users.push(order);
+    } else if (order.action === 'cancelled') {
+        statsState.users = statsState.users.filter(u => u.order_no !== order.order_no);
+    }
+}
+
+function openStatsStream(query) {
+    if (statsStream) {
+        statsStream.close();
+    }
+    
+    const url = `${API_BASE_URL}/statistics/meal/stream?${query}&access_token=${encodeURIComponent(currentUser.token)}`;
+    const stream = new EventSource(url);
+    statsStream = stream;
+    
+    stream.addEventListener('snapshot', (event) => {
+        const stats = JSON.parse(event.data);
+        statsState = {
+            dishes: {},
+            users: stats.user_statistics,
+            total_orders: stats.total_orders
+        };
+        stats.dish_statistics.forEach(d => {
+            statsState.dishes[d.dish_id] = d;
+        });
+        renderStatistics();
+    });
+    
+    stream.addEventListener('delta', (event) => {
+        if (!statsState) return;
+        applyStatsDelta(JSON.parse(event.data));
+        renderStatistics();
+    });
+    
+    // 服务端缓冲区已覆盖错过的事件，重新连接获取快照
+    stream.addEventListener('reset', () => {
+        if (statsStream === stream) {
+            openStatsStream(query);
+        }
+    });
+}
+
+$('#getStatsBtn').addEventListener('click', () => {
     const canteenId = $('#statsCanteenFilter').value;
     const orderDate = $('#statsDateFilter').value || new Date().toISOString().split('T')[0];
     const mealType = $('#statsMealTypeFilter').value;
@@ -419,77 +651,16 @@ $('#getStatsBtn').addEventListener('click', async () => {
         return;
     }
     
-    try {
-        const stats = await apiRequest(`/statistics/meal?canteen_id=${canteenId}&order_date=${orderDate}&meal_type=${mealType}`);
-        
-        const dishStatsHtml = `
-            <table>
-                <thead>
-                    <tr>
-                        <th>菜品名称</th>
-                        <th>订单数</th>
-                        <th>总数量</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    ${stats.dish_statistics.map(d => `
-                        <tr>
-                            <td>${d.dish_name}</td>
-                            <td>${d.order_count}</td>
-                            <td>${d.total_quantity}</td>
-                        </tr>
-                    `).join('')}
-                </tbody>
-            </table>
-        `;
-        
-        const userStatsHtml = `
-            <table>
-                <thead>
-                    <tr>
-                        <th>工号</th>
-                        <th>姓名</th>
-                        <th>订单号</th>
-                        <th>下单时间</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    ${stats.user_statistics.map(u => `
-                        <tr>
-                            <td>${u.employee_id}</td>
-                            <td>${u.full_name}</td>
-                            <td>${u.order_no}</td>
-                            <td>${u.created_at}</td>
-                        </tr>
-                    `).join('')}
-                </tbody>
-            </table>
-        `;
-        
-        const html = `
-            <div class="stats-card">
-                <h3>订单总数: ${stats.total_orders}</h3>
-            </div>
-            <div class="stats-section">
-                <h3>按菜品统计</h3>
-                ${dishStatsHtml}
-            </div>
-            <div class="stats-section">
-                <h3>按员工统计</h3>
-                ${userStatsHtml}
-            </div>
-        `;
-        
-        $('#statisticsContent').innerHTML = html;
-    } catch (error) {
-        // 错误已处理
-    }
+    statsState = null;
+    openStatsStream(`canteen_id=${canteenId}&order_date=${orderDate}&meal_type=${mealType}`);
 });
 
 // 设置默认日期
 const today = new Date().toISOString().split('T')[0];
 $('#menuDateFilter').value = today;
 $('#orderDateFilter').value = today;
+$('#exportStartDate').value = today;
+$('#exportEndDate').value = today;
 $('#statsDateFilter').value = today;
 
 // 占位函数
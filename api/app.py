@@ -1,24 +1,89 @@
 # Flask API服务主程序
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import sys
 import os
+import json
+import hmac
+from datetime import datetime
 
 # 导入配置和工具
 import config
-from utils.helpers import (success_response, error_response, require_auth, 
-                           require_role, get_current_date)
+from utils.helpers import (success_response, error_response, require_auth, authenticate,
+                           require_role, get_current_date, get_request_token, get_page_params,
+                           get_export_params, next_meal_close, identity_cache)
+from utils.auth_token import issue_token, verify_token, revoke_token, check_secret_keys
+from utils.conditional import conditional
+from utils.idempotency import idempotent, init_idempotency, idempotency_stats
+from utils.admission import admit, admission_stats
+from utils.scheduler import scheduler, init_scheduler
+from utils import db_pool, storage, stock_ledger, metrics, slow_query, order_no, archive, versions
+from utils.pubsub import hub
+from utils.streaming import export_response
 
 # 导入服务
 from services.auth_service import AuthService
 from services.canteen_service import CanteenService
 from services.dish_service import DishService
-from services.menu_service import MenuService
+from services.menu_service import MenuService, menu_cache
 from services.order_service import OrderService
+from services.meal_stats_service import MealStatsService
+from services.export_service import ExportService, ORDER_ITEM_COLUMNS, MEAL_STATISTICS_COLUMNS
 
 app = Flask(__name__)
-CORS(app)  # 允许跨域请求
+# 允许跨域请求；前端跨域读取重试间隔、ETag和幂等重放标记需要显式暴露这些响应头
+CORS(app, expose_headers=['Retry-After', 'ETag', 'Idempotent-Replayed'])
+db_pool.init_app(app)  # 请求结束时归还数据库连接
+metrics.init_app(app)  # 记录请求耗时
+
+
+def close_ended_meals():
+    """餐次结束：有效订单标记为已完成，菜单关闭"""
+    now = datetime.now()
+    return {
+        'orders_completed': OrderService().complete_ended_orders(now),
+        'menus_closed': MenuService().close_ended_menus(now)
+    }
+
+
+_services_started = False
+
+
+def init_services():
+    """
+    初始化存储并启动后台线程（检查点、库存账本、幂等键清理、定时任务）
+
+    只在处理请求的进程中调用：server.py的worker在fork之后调用，开发模式下只在
+    重载器派生的服务进程中调用。导入本模块不会启动任何后台线程，重复调用无效果。
+    """
+    global _services_started
+    if _services_started:
+        return
+    _services_started = True
+    
+    storage.init_storage()  # 启用WAL并启动后台检查点
+    archive.init_archive()  # 创建或补齐归档库表结构
+    stock_ledger.init_ledger()  # 从数据库恢复当日菜单库存
+    init_idempotency()  # 启动过期幂等键清理
+    
+    scheduler.register('close_meals', close_ended_meals, next_meal_close,
+                       description='餐次结束后完成订单、关闭菜单', run_on_start=True)
+    if config.ARCHIVE_ENABLED:
+        scheduler.register('archive_orders', archive.archive_orders, archive.next_archive_run,
+                           description=f'已结束超过{config.ARCHIVE_RETENTION_DAYS}天的订单移入归档库')
+    init_scheduler()  # 启动定时任务
+
+# 在 /api/metrics 输出时取值的状态指标
+metrics.gauge('db_pool_connections_open', '连接池当前打开的连接数', lambda: db_pool.get_pool().stats()['open'])
+metrics.gauge('db_pool_connections_in_use', '连接池当前借出的连接数', lambda: db_pool.get_pool().stats()['in_use'])
+metrics.gauge('db_write_queue_length', '写线程队列中等待的任务数', lambda: storage.storage_stats()['write_queue'])
+metrics.gauge('event_hub_subscribers', '实时推送的订阅连接数', lambda: hub.subscribers)
+for _group in config.ADMISSION_LIMITS:
+    metrics.gauge(f'admission_{_group}_active', f'准入分组{_group}执行中的请求数',
+                  lambda group=_group: admission_stats()['concurrency'][group]['active'])
+    metrics.gauge(f'admission_{_group}_waiting', f'准入分组{_group}排队中的请求数',
+                  lambda group=_group: admission_stats()['concurrency'][group]['waiting'])
 
 # ============================================
 # 认证相关API
@@ -37,6 +102,7 @@ def login():
         
         auth_service = AuthService()
         user = auth_service.login(employee_id, password)
+        user['token'], user['token_expires_at'] = issue_token(user['id'], user['role'])
         
         return jsonify(success_response(user, '登录成功'))
     
@@ -46,6 +112,17 @@ def login():
         return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
 
+@app.route('/api/auth/logout', methods=['POST'])
+@require_auth
+def logout(current_user_id):
+    """退出登录（吊销当前令牌）"""
+    token = get_request_token()
+    if token:
+        revoke_token(verify_token(token))
+    
+    return jsonify(success_response(None, '已退出登录'))
+
+
 @app.route('/api/auth/user-info', methods=['GET'])
 @require_auth
 def get_user_info(current_user_id):
@@ -63,11 +140,55 @@ def get_user_info(current_user_id):
         return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
 
+@app.route('/api/admin/users/<int:user_id>/role', methods=['PUT'])
+@require_role(config.ROLE_ADMIN)
+def update_user_role(user_id, current_user_id, current_user_role):
+    """修改用户角色（该用户已签发的令牌随即失效，需重新登录）"""
+    try:
+        if user_id == current_user_id:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '不能修改自己的角色'))
+        
+        data = request.json
+        AuthService().update_user_role(user_id, data.get('role'))
+        
+        return jsonify(success_response(None, '更新成功'))
+    
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
+@app.route('/api/admin/users/<int:user_id>/status', methods=['PUT'])
+@require_role(config.ROLE_ADMIN)
+def update_user_status(user_id, current_user_id, current_user_role):
+    """启用/禁用用户（禁用后该用户已签发的令牌随即失效）"""
+    try:
+        if user_id == current_user_id:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '不能修改自己的状态'))
+        
+        data = request.json
+        is_active = data.get('is_active')
+        
+        if not isinstance(is_active, bool):
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '状态值无效'))
+        
+        AuthService().set_user_active(user_id, is_active)
+        
+        return jsonify(success_response(None, '更新成功'))
+    
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
 # ============================================
 # 食堂相关API
 # ============================================
 
 @app.route('/api/canteens', methods=['GET'])
+@conditional('canteens', max_age=config.REFERENCE_CACHE_MAX_AGE)
 def get_canteens():
     """获取食堂列表"""
     try:
@@ -82,6 +203,7 @@ def get_canteens():
 
 
 @app.route('/api/canteens/<int:canteen_id>', methods=['GET'])
+@conditional('canteens', max_age=config.REFERENCE_CACHE_MAX_AGE)
 def get_canteen(canteen_id):
     """获取食堂详情"""
     try:
@@ -162,6 +284,7 @@ def delete_canteen(canteen_id, current_user_id, current_user_role):
 # ============================================
 
 @app.route('/api/dishes', methods=['GET'])
+@conditional('dishes', 'dish_categories', max_age=config.REFERENCE_CACHE_MAX_AGE)
 def get_dishes():
     """获取菜品列表"""
     try:
@@ -179,6 +302,7 @@ def get_dishes():
 
 
 @app.route('/api/dishes/<int:dish_id>', methods=['GET'])
+@conditional('dishes', 'dish_categories', max_age=config.REFERENCE_CACHE_MAX_AGE)
 def get_dish(dish_id):
     """获取菜品详情"""
     try:
@@ -264,6 +388,7 @@ def update_dish_status(dish_id, current_user_id, current_user_role):
 
 
 @app.route('/api/dish-categories', methods=['GET'])
+@conditional('dish_categories', max_age=config.REFERENCE_CACHE_MAX_AGE)
 def get_dish_categories():
     """获取菜品分类列表"""
     try:
@@ -281,6 +406,7 @@ def get_dish_categories():
 # ============================================
 
 @app.route('/api/menus', methods=['GET'])
+@conditional('menus', 'canteens')
 def get_menus():
     """获取菜单列表"""
     try:
@@ -298,6 +424,7 @@ def get_menus():
 
 
 @app.route('/api/menus/<int:menu_id>', methods=['GET'])
+@conditional('menu:{menu_id}', 'stock:{menu_id}', 'dishes', 'dish_categories', 'canteens')
 def get_menu(menu_id):
     """获取菜单详情（包含菜单项）"""
     try:
@@ -313,6 +440,33 @@ def get_menu(menu_id):
         return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
 
+@app.route('/api/calendar', methods=['GET'])
+@require_auth
+@admit('read')
+def get_calendar(current_user_id):
+    """获取多天各餐次的可订情况（首页日历）"""
+    try:
+        start_date = request.args.get('start_date') or get_current_date()
+        days = request.args.get('days', config.CALENDAR_DEFAULT_DAYS, type=int)
+        canteen_id = request.args.get('canteen_id', type=int)
+        
+        if days < 1 or days > config.CALENDAR_MAX_DAYS:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, f'天数必须在1到{config.CALENDAR_MAX_DAYS}之间'))
+        
+        try:
+            datetime.strptime(start_date, '%Y-%m-%d')
+        except ValueError:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '日期格式错误'))
+        
+        menu_service = MenuService()
+        calendar = menu_service.get_calendar(current_user_id, start_date, days, canteen_id)
+        
+        return jsonify(success_response(calendar))
+    
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
 @app.route('/api/menus', methods=['POST'])
 @require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
 def create_menu(current_user_id, current_user_role):
@@ -337,6 +491,65 @@ def create_menu(current_user_id, current_user_role):
         return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
 
+@app.route('/api/menus/bulk', methods=['POST'])
+@require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
+def bulk_upsert_menus(current_user_id, current_user_role):
+    """批量创建菜单并设置菜单项（单个事务，任一条目失败整体回滚）"""
+    try:
+        data = request.json or {}
+        menus = data.get('menus')
+        
+        if not isinstance(menus, list) or not menus:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '菜单列表不能为空'))
+        
+        if len(menus) > config.MENU_BULK_MAX_MENUS:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, f'单次最多{config.MENU_BULK_MAX_MENUS}个菜单'))
+        
+        menu_service = MenuService()
+        result = menu_service.bulk_upsert_menus(menus)
+        
+        return jsonify(success_response(result, '保存成功'))
+    
+    except (KeyError, TypeError):
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, '菜单数据格式错误'))
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
+@app.route('/api/menus/clone', methods=['POST'])
+@require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
+def clone_menus(current_user_id, current_user_role):
+    """复制一段日期的菜单到另一段日期"""
+    try:
+        data = request.json or {}
+        source_start = data.get('source_start')
+        source_end = data.get('source_end') or source_start
+        target_start = data.get('target_start')
+        canteen_id = data.get('canteen_id')
+        
+        if not source_start or not target_start:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '源日期和目标日期不能为空'))
+        
+        try:
+            datetime.strptime(source_start, '%Y-%m-%d')
+            datetime.strptime(source_end, '%Y-%m-%d')
+            datetime.strptime(target_start, '%Y-%m-%d')
+        except ValueError:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '日期格式错误'))
+        
+        menu_service = MenuService()
+        result = menu_service.clone_menus(source_start, source_end, target_start, canteen_id)
+        
+        return jsonify(success_response(result, '复制成功'))
+    
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
 @app.route('/api/menus/<int:menu_id>/items', methods=['POST'])
 @require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
 def add_menu_item(menu_id, current_user_id, current_user_role):
@@ -364,6 +577,8 @@ def add_menu_item(menu_id, current_user_id, current_user_role):
 
 @app.route('/api/orders', methods=['POST'])
 @require_role(config.ROLE_EMPLOYEE)
+@idempotent
+@admit('order_write')
 def create_order(current_user_id, current_user_role):
     """创建订单"""
     try:
@@ -399,6 +614,7 @@ def create_order(current_user_id, current_user_role):
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
 @require_auth
+@admit('read')
 def get_order(order_id, current_user_id):
     """获取订单详情"""
     try:
@@ -416,22 +632,28 @@ def get_order(order_id, current_user_id):
 
 @app.route('/api/orders/my', methods=['GET'])
 @require_role(config.ROLE_EMPLOYEE)
+@admit('read')
 def get_my_orders(current_user_id, current_user_role):
-    """获取我的订单列表"""
+    """获取我的订单列表（分页）"""
     try:
         status = request.args.get('status')
+        limit, cursor, with_total = get_page_params()
         
         order_service = OrderService()
-        orders = order_service.get_user_orders(current_user_id, status)
+        page = order_service.get_user_orders(current_user_id, status, limit, cursor, with_total)
         
-        return jsonify(success_response(orders))
+        return jsonify(success_response(page))
     
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
     except Exception as e:
         return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
 
 @app.route('/api/orders/<int:order_id>', methods=['PUT'])
 @require_role(config.ROLE_EMPLOYEE)
+@idempotent
+@admit('order_write')
 def update_order(order_id, current_user_id, current_user_role):
     """修改订单"""
     try:
@@ -459,6 +681,8 @@ def update_order(order_id, current_user_id, current_user_role):
 
 @app.route('/api/orders/<int:order_id>/cancel', methods=['POST'])
 @require_role(config.ROLE_EMPLOYEE)
+@idempotent
+@admit('order_write')
 def cancel_order(order_id, current_user_id, current_user_role):
     """取消订单"""
     try:
@@ -478,18 +702,25 @@ def cancel_order(order_id, current_user_id, current_user_role):
 
 @app.route('/api/orders/canteen/<int:canteen_id>', methods=['GET'])
 @require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
+@admit('read')
 def get_canteen_orders(canteen_id, current_user_id, current_user_role):
-    """获取食堂订单列表"""
+    """获取食堂订单列表（分页）"""
     try:
         order_date = request.args.get('order_date')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
         meal_type = request.args.get('meal_type')
         status = request.args.get('status')
+        limit, cursor, with_total = get_page_params()
         
         order_service = OrderService()
-        orders = order_service.get_canteen_orders(canteen_id, order_date, meal_type, status)
+        page = order_service.get_canteen_orders(canteen_id, order_date, meal_type, status,
+                                                start_date, end_date, limit, cursor, with_total)
         
-        return jsonify(success_response(orders))
+        return jsonify(success_response(page))
     
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
     except Exception as e:
         return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
@@ -515,6 +746,116 @@ def get_meal_statistics(current_user_id, current_user_role):
         return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
 
+@app.route('/api/statistics/meal/stream', methods=['GET'])
+@require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
+def stream_meal_statistics(current_user_id, current_user_role):
+    """
+    餐次统计实时推送（Server-Sent Events，备餐看板）
+    
+    首先推送snapshot事件（与 /api/statistics/meal 相同的数据），之后每次下单、
+    修改、取消推送delta事件。断线重连时浏览器带上 Last-Event-ID，缓冲区
+    中仍有错过的事件则直接补发，否则重新推送快照。
+    """
+    try:
+        canteen_id = request.args.get('canteen_id', type=int)
+        order_date = request.args.get('order_date', get_current_date())
+        meal_type = request.args.get('meal_type')
+        
+        if not canteen_id or not meal_type:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '食堂ID和餐次类型不能为空'))
+        
+        topic = MealStatsService.topic(canteen_id, order_date, meal_type)
+        
+        if versions.shared():
+            # 多进程服务：变更可能发生在其他worker，按共享版本号轮询，有变化时重新推送快照
+            seen = versions.get_version(topic)
+            stats = OrderService().get_meal_statistics(canteen_id, order_date, meal_type)
+            head = f'event: snapshot\ndata: {json.dumps(stats, ensure_ascii=False)}\n\n'
+            
+            def generate():
+                yield head
+                yield from hub.poll(topic, lambda: OrderService().get_meal_statistics(
+                    canteen_id, order_date, meal_type), seen, stats['version'])
+            
+            return Response(generate(), mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        after_seq = hub.parse_id(last_event_id)
+        
+        if after_seq is not None and hub.can_replay(after_seq):
+            head = ''
+            min_version = None
+        else:
+            # 先记下序号再读快照：快照之后发布的事件都不会漏掉，
+            # 已包含在快照中的事件按版本号跳过
+            after_seq = hub.current_seq()
+            stats = OrderService().get_meal_statistics(canteen_id, order_date, meal_type)
+            head = (f'id: {hub.format_id(after_seq)}\n'
+                    f'event: snapshot\n'
+                    f'data: {json.dumps(stats, ensure_ascii=False)}\n\n')
+            min_version = stats['version']
+        
+        def generate():
+            if head:
+                yield head
+            yield from hub.listen(topic, after_seq, min_version)
+        
+        # 不使用 stream_with_context，推送期间不占用请求的数据库连接
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+    
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
+# ============================================
+# 数据导出API
+# ============================================
+
+@app.route('/api/export/orders', methods=['GET'])
+@require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
+def export_orders(current_user_id, current_user_role):
+    """导出订单明细（每个订单项一行，用于结算）"""
+    try:
+        canteen_id, start_date, end_date, fmt = get_export_params()
+        status = request.args.get('status')
+        
+        export_service = ExportService()
+        batches = export_service.iter_order_items(canteen_id, start_date, end_date, status)
+        
+        return export_response(ORDER_ITEM_COLUMNS, batches, fmt,
+                               f'orders_{canteen_id}_{start_date}_{end_date}')
+    
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
+@app.route('/api/export/meal-statistics', methods=['GET'])
+@require_role(config.ROLE_ADMIN, config.ROLE_CANTEEN_STAFF)
+def export_meal_statistics(current_user_id, current_user_role):
+    """导出餐次统计（按日期、餐次、菜品汇总）"""
+    try:
+        canteen_id, start_date, end_date, fmt = get_export_params()
+        
+        export_service = ExportService()
+        batches = export_service.iter_meal_statistics(canteen_id, start_date, end_date)
+        
+        return export_response(MEAL_STATISTICS_COLUMNS, batches, fmt,
+                               f'meal_statistics_{canteen_id}_{start_date}_{end_date}')
+    
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
 # ============================================
 # 健康检查
 # ============================================
@@ -522,7 +863,107 @@ def get_meal_statistics(current_user_id, current_user_role):
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
-    return jsonify(success_response({'status': 'ok'}))
+    return jsonify(success_response({
+        'status': 'ok',
+        'worker': {'id': storage.worker_id(), 'pid': os.getpid()},
+        'db_pool': db_pool.get_pool().stats(),
+        'storage': storage.storage_stats(),
+        'stock_ledger': stock_ledger.get_ledger().stats() if stock_ledger.get_ledger() else None,
+        'identity_cache': identity_cache.stats(),
+        'menu_cache': menu_cache.stats(),
+        'event_hub': hub.stats(),
+        'idempotency': idempotency_stats(),
+        'admission': admission_stats(),
+        'order_no': order_no.get_generator().stats(),
+        'archive': archive.archive_stats()
+    }))
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    运行指标（Prometheus文本格式）
+
+    请求头 Authorization: Bearer 带 config.METRICS_TOKEN 时直接放行（供抓取程序使用），
+    否则要求管理员登录。
+    """
+    token = get_request_token()
+    if not (config.METRICS_TOKEN and token
+            and hmac.compare_digest(token.encode('utf-8'), config.METRICS_TOKEN.encode('utf-8'))):
+        _, role, error = authenticate()
+        if error:
+            return error
+        if role != config.ROLE_ADMIN:
+            return jsonify(error_response(config.ERROR_FORBIDDEN, '无权限访问')), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+@require_role(config.ROLE_ADMIN)
+def get_slow_queries(current_user_id, current_user_role):
+    """最慢SQL汇总（按语句）"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        sort = request.args.get('sort', 'total')
+
+        if limit < 1 or limit > config.SLOW_QUERY_MAX_STATEMENTS:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM,
+                                          f'条数必须在1到{config.SLOW_QUERY_MAX_STATEMENTS}之间'))
+
+        return jsonify(success_response({
+            'threshold_ms': config.SLOW_QUERY_MS,
+            'statements': slow_query.top(limit, sort)
+        }))
+
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+@require_role(config.ROLE_ADMIN)
+def reset_slow_queries(current_user_id, current_user_role):
+    """清空最慢SQL汇总"""
+    slow_query.reset()
+    return jsonify(success_response(None, '已清空'))
+
+
+@app.route('/api/admin/jobs', methods=['GET'])
+@require_role(config.ROLE_ADMIN)
+def get_jobs(current_user_id, current_user_role):
+    """定时任务及执行记录"""
+    try:
+        job = request.args.get('job')
+        limit = request.args.get('limit', 50, type=int)
+
+        if limit < 1 or limit > 500:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '条数必须在1到500之间'))
+
+        return jsonify(success_response({
+            'scheduler': {'worker': storage.worker_id(), 'pid': os.getpid(), 'running': scheduler.started},
+            'jobs': scheduler.jobs(),
+            'runs': scheduler.history(job, limit)
+        }))
+
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
+
+
+@app.route('/api/admin/jobs/<name>/run', methods=['POST'])
+@require_role(config.ROLE_ADMIN)
+def run_job(name, current_user_id, current_user_role):
+    """立即执行定时任务"""
+    try:
+        run = scheduler.run_job(name)
+        return jsonify(success_response(run, '执行成功' if run['status'] == 'success' else '执行失败'))
+
+    except KeyError:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, '任务不存在'))
+    except ValueError as e:
+        return jsonify(error_response(config.ERROR_INVALID_PARAM, str(e)))
+    except Exception as e:
+        return jsonify(error_response(config.ERROR_SYSTEM, f'系统错误: {str(e)}'))
 
 
 # ============================================
@@ -530,6 +971,12 @@ def health_check():
 # ============================================
 
 if __name__ == '__main__':
+    try:
+        # 开发模式（DEBUG）是唯一允许不设置令牌密钥的启动方式
+        check_secret_keys(allow_dev=config.DEBUG)
+    except RuntimeError as e:
+        sys.exit(f'错误: {e}')
+    
     print('=' * 60)
     print('集团员工内部用餐点餐平台 API 服务')
     print('=' * 60)
@@ -537,8 +984,15 @@ if __name__ == '__main__':
     print(f'数据库路径: {config.DB_PATH}')
     print('=' * 60)
     
+    # DEBUG时Werkzeug重载器在监视进程和服务进程中都会执行本模块，
+    # 监视进程不处理请求，后台线程只在服务进程（WERKZEUG_RUN_MAIN=true）中启动
+    use_reloader = config.DEBUG
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_services()
+    
     app.run(
         host=config.API_HOST,
         port=config.API_PORT,
-        debug=config.DEBUG
+        debug=config.DEBUG,
+        use_reloader=use_reloader
     )
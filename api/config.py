@@ -5,10 +5,130 @@ import os
 # 数据库配置
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'ordering_system.db')
 
+# 数据库连接池配置
+DB_POOL_SIZE = 16  # 每个进程最多打开的连接数
+DB_POOL_TIMEOUT = 5  # 连接池耗尽时的最长等待时间（秒）
+DB_POOL_RECYCLE = 300  # 连接空闲超过该秒数后，复用前先做健康检查
+DB_PRAGMAS = {  # 每个新连接执行的PRAGMA
+    'temp_store': 'MEMORY'
+}
+
+# 存储配置
+DB_JOURNAL_MODE = 'WAL'  # WAL模式下读写互不阻塞
+DB_SYNCHRONOUS = 'NORMAL'  # WAL下NORMAL即可保证一致性，仅在检查点时fsync
+DB_BUSY_TIMEOUT = 5000  # 等待数据库锁的最长时间（毫秒）
+DB_MMAP_SIZE = 256 * 1024 * 1024  # 内存映射读取的最大字节数
+DB_CACHE_SIZE = -32000  # 每个连接的页缓存，负数表示KiB
+DB_CHECKPOINT_INTERVAL = 60  # 后台WAL检查点间隔（秒），0表示只依赖自动检查点
+DB_CHECKPOINT_MODE = 'PASSIVE'
+DB_WRITE_BATCH_SIZE = 64  # 写线程一次事务最多合并的写任务数，1表示每个任务单独提交
+DB_WRITE_BATCH_WAIT = 0  # 凑批的额外等待时间（秒），0表示只合并已在排队的任务
+
+# 当日菜单内存库存账本
+STOCK_LEDGER_ENABLED = True  # 当日菜单在内存中扣减库存，异步批量回写数据库
+STOCK_LEDGER_FLUSH_INTERVAL = 1  # 回写间隔（秒）
+
 # API配置
 API_HOST = '0.0.0.0'
 API_PORT = 8082
-DEBUG = True
+DEBUG = True  # 仅对开发模式（python app.py）生效
+
+# 服务进程（server.py）
+# prefork: 预派生多进程，用于生产；dev: Flask开发服务器（python app.py）
+SERVER_MODE = os.environ.get('ORDERING_SERVER_MODE', 'prefork')
+SERVER_WORKERS = 4  # worker进程数；大于1时自动关闭内存库存账本（账本只在单进程内有效）
+SERVER_THREADED = True  # 每个worker是否为每个请求启动一个线程（实时推送的长连接需要开启）
+SERVER_MAX_REQUESTS = 10000  # worker处理该数量的请求后退出并由主进程重新派生，0表示不回收
+SERVER_MAX_REQUESTS_JITTER = 1000  # 回收阈值的随机增量，避免所有worker同时回收
+SERVER_GRACEFUL_TIMEOUT = 30  # 停止或回收时等待进行中请求完成的最长秒数
+SERVER_BACKLOG = 1024  # 监听队列长度
+VERSION_SLOTS = 65536  # 多进程共享的数据版本号槽位数
+
+# 登录令牌
+# 签名密钥：key_id -> 密钥。轮换时新增密钥并切换TOKEN_ACTIVE_KEY_ID，
+# 旧密钥保留到其签发的令牌全部过期后再删除。
+# 密钥必须通过环境变量 ORDERING_TOKEN_SECRET 设置，未设置时服务拒绝启动
+TOKEN_SECRET_KEYS = {
+    'k1': os.environ.get('ORDERING_TOKEN_SECRET')
+}
+TOKEN_DEV_SECRET = 'dev-secret-change-me'  # 仅开发模式（python app.py 且 DEBUG）在未设置密钥时使用
+TOKEN_ACTIVE_KEY_ID = 'k1'
+TOKEN_TTL = 12 * 3600  # 令牌有效期（秒）
+AUTH_ALLOW_USER_ID_HEADER = False  # 是否兼容旧的 X-User-Id 请求头认证
+
+# 用户身份缓存
+IDENTITY_CACHE_SIZE = 10000  # 最多缓存的用户数
+IDENTITY_CACHE_TTL = 60  # 缓存有效期（秒），兜底直接修改数据库等未经服务层的变更
+
+# 菜单缓存（键带数据版本号，写操作递增版本即失效）
+MENU_CACHE_SIZE = 2048  # 最多缓存的条目数
+MENU_CACHE_TTL = 300  # 缓存有效期（秒），兜底直接修改数据库等未经服务层的变更
+
+# HTTP缓存：食堂、菜品、分类等基础数据允许客户端直接缓存的秒数（菜单每次重新验证）
+REFERENCE_CACHE_MAX_AGE = 60
+
+# 实时推送（SSE）
+SSE_HEARTBEAT_INTERVAL = 15  # 心跳间隔（秒）
+EVENT_BUFFER_SIZE = 1000  # 用于断线重连补发的事件缓冲条数
+SSE_POLL_INTERVAL = 1  # 多进程服务中订阅者检查其他worker变更的间隔（秒）
+
+# 订单列表分页
+ORDER_PAGE_SIZE = 50  # 默认每页条数
+ORDER_PAGE_MAX = 200  # 每页最大条数
+
+# 幂等键（下单、改单、取消的 Idempotency-Key 请求头）
+IDEMPOTENCY_TTL = 24 * 3600  # 保存响应的时长（秒）
+IDEMPOTENCY_CACHE_SIZE = 10000  # 内存中缓存的响应数
+IDEMPOTENCY_KEY_MAX_LENGTH = 128  # 幂等键最大长度
+IDEMPOTENCY_WAIT_TIMEOUT = 10  # 重复请求等待第一次请求完成的最长秒数
+IDEMPOTENCY_SWEEP_INTERVAL = 300  # 清理过期记录的间隔（秒）
+IDEMPOTENCY_SWEEP_BATCH = 1000  # 每个清理事务删除的最大行数
+
+# 准入控制（每个worker各自计数）
+ADMISSION_ENABLED = True
+ADMISSION_LIMITS = {  # 分组 -> 同时执行的请求数上限、排队上限、排队最长等待（秒）
+    # 写请求最终由写线程串行提交，并发上限与写批量相当即可让每批凑满
+    'order_write': {'concurrency': 64, 'queue': 256, 'timeout': 3},
+    'read': {'concurrency': 32, 'queue': 128, 'timeout': 1}
+}
+RATE_LIMITS = {  # 分组 -> 每用户令牌桶（每秒补充令牌数, 桶容量）
+    'order_write': (1, 10),
+    'read': (10, 50)
+}
+RATE_LIMIT_MAX_USERS = 100000  # 内存中最多保留的用户令牌桶数，超过后淘汰最久未访问的
+ADMISSION_RETRY_AFTER = 1  # 服务繁忙时建议客户端的重试间隔（秒），实际值加随机抖动
+
+# 批量排菜
+MENU_BULK_MAX_MENUS = 200  # 单次批量写入的最大菜单数
+MENU_CLONE_MAX_DAYS = 31  # 单次复制的最大天数
+
+# 数据导出
+EXPORT_FETCH_SIZE = 1000  # 每批从数据库读取的行数
+EXPORT_MAX_DAYS = 366  # 单次导出的最大日期跨度
+EXPORT_GZIP_LEVEL = 6  # gzip压缩级别
+
+# 运行指标（/api/metrics）
+METRICS_ENABLED = True  # 记录请求耗时、SQL语句耗时和事务计数
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)  # 耗时直方图分桶（秒）
+METRICS_MAX_STATEMENTS = 500  # 按语句分组的上限，超出后归入other
+METRICS_TOKEN = os.environ.get('ORDERING_METRICS_TOKEN')  # 抓取 /api/metrics 用的令牌，未设置时只允许管理员访问
+
+# 慢查询日志
+SLOW_QUERY_MS = 100  # 超过该毫秒数的SQL写入慢查询日志，0表示关闭
+SLOW_QUERY_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs', 'slow_query.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024  # 单个日志文件大小上限，超过后滚动
+SLOW_QUERY_LOG_BACKUPS = 5  # 保留的历史日志文件数
+SLOW_QUERY_LOG_PARAMS = True  # 是否记录参数
+SLOW_QUERY_MAX_STATEMENTS = 200  # 汇总的不同语句数上限
+
+# 订单号（Snowflake式：毫秒时间戳 + 节点号 + 序号）
+ORDER_NO_PREFIX = 'ORD'
+ORDER_NO_EPOCH = 1704067200000  # 时间戳起点：2024-01-01 00:00:00 UTC（毫秒），可用约69年，上线后不可修改
+ORDER_NO_NODE_ID = None  # 单进程运行时的节点号（0~1023），None表示由进程号推出；多进程服务自动分配
+
+# 首页日历
+CALENDAR_DEFAULT_DAYS = 7  # 默认展示天数
+CALENDAR_MAX_DAYS = 31  # 单次最多查询天数
 
 # 餐次时间限制
 MEAL_TIME_LIMITS = {
@@ -17,6 +137,22 @@ MEAL_TIME_LIMITS = {
     'dinner': '17:00'
 }
 
+# 餐次结束（定时任务）
+MEAL_CLOSE_DELAY = 120  # 点餐截止后多少分钟餐次结束：有效订单自动完成、菜单关闭
+MEAL_CLOSE_BATCH_SIZE = 500  # 每个事务最多更新的行数，分批执行不长时间占用写线程
+
+# 订单归档（冷热分离）
+ARCHIVE_ENABLED = True  # 是否将旧订单移入归档库
+ARCHIVE_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'ordering_archive.db')
+ARCHIVE_RETENTION_DAYS = 90  # 已完成、已取消的订单在热库中保留的天数
+ARCHIVE_BATCH_SIZE = 500  # 每批移动的订单数（每批一个复制事务和一个删除事务）
+ARCHIVE_RUN_AT = '03:30'  # 每天执行归档的时间
+ARCHIVE_SYNCHRONOUS = 'FULL'  # 归档库的synchronous，复制提交后才删除热库中的订单
+
+# 定时任务
+SCHEDULER_ENABLED = True  # 是否在本进程运行定时任务（多进程部署时只由0号worker运行）
+SCHEDULER_HISTORY_DAYS = 30  # 任务执行记录保留天数
+
 # 订单状态
 ORDER_STATUS_PLACED = 'placed'      # 已下单
 ORDER_STATUS_CANCELLED = 'cancelled'  # 已取消
@@ -26,6 +162,11 @@ ORDER_STATUS_COMPLETED = 'completed'  # 已完成
 DISH_STATUS_ACTIVE = 'active'      # 已上架
 DISH_STATUS_INACTIVE = 'inactive'  # 已下架
 
+# 菜单状态
+MENU_STATUS_ACTIVE = 'active'      # 启用
+MENU_STATUS_INACTIVE = 'inactive'  # 禁用
+MENU_STATUS_CLOSED = 'closed'      # 餐次已结束
+
 # 用户角色
 ROLE_EMPLOYEE = 'employee'         # 员工
 ROLE_CANTEEN_STAFF = 'canteen_staff'  # 食堂人员
@@ -36,6 +177,9 @@ ERROR_SUCCESS = 0
 ERROR_SYSTEM = 1000
 ERROR_DATABASE = 1001
 ERROR_INVALID_PARAM = 1002
+ERROR_IDEMPOTENCY_CONFLICT = 1003  # 幂等键已用于其他请求，或相同请求仍在处理中
+ERROR_RATE_LIMITED = 1004  # 请求过于频繁（HTTP 429）
+ERROR_SERVER_BUSY = 1005  # 服务繁忙（HTTP 503）
 
 ERROR_TIME_LIMIT = 2001  # 超过时间限制
 ERROR_DUPLICATE_ORDER = 2002  # 重复订单
@@ -4,6 +4,8 @@ import sqlite3
 import os
 import sys
 
+from utils.migrations import migrate
+
 def init_database():
     """初始化数据库"""
     
@@ -21,6 +23,11 @@ def init_database():
         os.remove(db_path)
         print(f'删除旧数据库: {db_path}')
     
+    # 同时删除WAL模式遗留的日志文件，避免被应用到新数据库
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    
     # 读取SQL脚本
     sql_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'init-db.sql')
     
@@ -42,7 +49,11 @@ def init_database():
         conn.commit()
         conn.close()
         
+        # 执行结构迁移（索引等）
+        applied = migrate(db_path)
+        
         print(f'数据库初始化成功: {db_path}')
+        print(f'已应用迁移: {applied}')
         print('-' * 60)
         print('测试账号信息：')
         print('管理员 - 工号: ADMIN001, 密码: admin123')
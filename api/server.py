@@ -0,0 +1,281 @@
+# 生产环境服务入口：预派生（pre-fork）多进程，每个worker可按请求开线程
+#
+# 用法:
+#   python server.py                                  # 按config.py中的SERVER_*配置启动
+#   python server.py --workers 8 --max-requests 5000  # 命令行参数覆盖配置
+#
+# 信号（发给主进程，PID见 pids/api.pid）:
+#   TERM/INT  优雅停止：worker不再接受新连接，进行中的请求完成后退出
+#   HUP       平滑重启：逐个派生新worker替换旧worker，重新加载业务代码
+#             （主进程已加载的config.py等模块不会重新加载，修改配置需完全重启）
+#
+# 主进程只负责监听端口、执行数据库迁移和管理worker，不处理请求；
+# 数据库连接、写线程、检查点线程都在worker中创建，不会跨fork共享。
+
+import argparse
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+import config
+# 以下模块在派生前导入，所有worker共享同一启动标识（ETag）和共享内存中的数据版本号
+from utils import conditional, order_no, storage, versions  # noqa: F401
+from utils.auth_token import check_secret_keys
+
+
+class RequestCounter:
+    """
+    统计进行中和已处理请求数的WSGI中间件
+
+    已处理请求数达到上限时通知worker回收。流式响应在关闭时才算完成。
+    """
+
+    def __init__(self, app, max_requests, on_limit):
+        self.app = app
+        self.max_requests = max_requests
+        self.on_limit = on_limit
+        self.active = 0
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.active += 1
+            self.served += 1
+            served = self.served
+        if self.max_requests and served == self.max_requests:
+            self.on_limit()
+        try:
+            iterable = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return ClosingIterator(iterable, self._done)
+
+    def _done(self):
+        with self._lock:
+            self.active -= 1
+
+
+class Worker:
+    """worker进程：在主进程的监听套接字上接受连接并处理请求"""
+
+    def __init__(self, sock, slot, node, threaded, max_requests):
+        self.sock = sock
+        self.slot = slot
+        self.node = node
+        self.threaded = threaded
+        self.max_requests = max_requests
+        self.master_pid = os.getppid()
+        self._stop = threading.Event()
+
+    def run(self):
+        os.environ['ORDERING_WORKER_ID'] = str(self.slot)
+        os.environ['ORDERING_NODE_ID'] = str(self.node)
+        random.seed()
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: self._stop.set())
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        # fork之后才导入应用并启动后台线程：连接池、写线程、库存账本都属于本进程
+        from app import app, init_services
+        from utils import stock_ledger
+        init_services()
+
+        max_requests = self.max_requests
+        if max_requests and config.SERVER_MAX_REQUESTS_JITTER:
+            max_requests += random.randint(0, config.SERVER_MAX_REQUESTS_JITTER)
+        counter = RequestCounter(app, max_requests, self._stop.set)
+
+        server = make_server(config.API_HOST, config.API_PORT, counter,
+                             threaded=self.threaded, fd=self.sock.fileno())
+        # 多个worker在同一套接字上等待，没抢到连接的accept()立即返回而不是阻塞
+        server.socket.setblocking(False)
+
+        threading.Thread(target=self._watch, args=(server,), name='worker-watchdog', daemon=True).start()
+        server.serve_forever(poll_interval=0.5)
+
+        # 等待进行中的请求完成（实时推送等长连接最多等到超时）
+        deadline = time.monotonic() + config.SERVER_GRACEFUL_TIMEOUT
+        while counter.active and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        ledger = stock_ledger.get_ledger()
+        if ledger:
+            ledger.stop()
+
+    def _watch(self, server):
+        """收到停止信号、达到回收阈值或主进程退出时停止接受新连接"""
+        while not self._stop.wait(1):
+            if os.getppid() != self.master_pid:
+                break
+        server.shutdown()
+
+
+class Master:
+    """主进程：派生worker，回收退出的worker并按需补充"""
+
+    def __init__(self, workers, threaded, max_requests):
+        self.num_workers = workers
+        self.threaded = threaded
+        self.max_requests = max_requests
+        self.workers = {}  # pid -> 槽位
+        self.nodes = {}  # pid -> 订单号节点号（平滑重启时新旧worker同槽位并存，节点号必须不同）
+        self.sock = None
+        self._stopping = False
+        self._reloading = False
+        self._spawned_at = {}  # 槽位 -> 最近一次派生时间
+
+    def run(self):
+        # 迁移和journal_mode在派生前完成一次，worker启动时只需确认
+        storage.migrate()
+        storage.configure_database()
+        if self.num_workers > 1:
+            config.STOCK_LEDGER_ENABLED = False
+        versions.share_between_processes()
+
+        self.sock = socket.create_server((config.API_HOST, config.API_PORT),
+                                         backlog=config.SERVER_BACKLOG)
+        print(f'主进程 {os.getpid()} 监听 http://{config.API_HOST}:{config.API_PORT}，'
+              f'worker数 {self.num_workers}，'
+              f'库存账本{"开启" if config.STOCK_LEDGER_ENABLED else "关闭"}', flush=True)
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        for slot in range(self.num_workers):
+            self.spawn(slot)
+
+        while not self._stopping:
+            self.reap()
+            if self._reloading:
+                self._reloading = False
+                self.reload()
+            self.fill()
+            time.sleep(0.5)
+
+        self.stop()
+
+    def spawn(self, slot):
+        """派生一个worker"""
+        self._spawned_at[slot] = time.monotonic()
+        used = set(self.nodes.values())
+        node = next(node for node in range(order_no.MAX_NODE_ID + 1) if node not in used)
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = slot
+            self.nodes[pid] = node
+            return pid
+
+        code = 0
+        try:
+            Worker(self.sock, slot, node, self.threaded, self.max_requests).run()
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def reap(self):
+        """回收已退出的worker"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            slot = self.workers.pop(pid, None)
+            self.nodes.pop(pid, None)
+            if slot is not None and not self._stopping and os.waitstatus_to_exitcode(status):
+                print(f'worker {slot} (PID {pid}) 异常退出: {os.waitstatus_to_exitcode(status)}', flush=True)
+
+    def fill(self):
+        """补足缺少的worker（启动后立即退出的worker至少间隔1秒再派生，避免反复崩溃占满CPU）"""
+        running = set(self.workers.values())
+        for slot in range(self.num_workers):
+            if slot not in running and time.monotonic() - self._spawned_at.get(slot, 0) >= 1:
+                self.spawn(slot)
+
+    def reload(self):
+        """逐个替换worker"""
+        print('平滑重启worker', flush=True)
+        for pid, slot in list(self.workers.items()):
+            if config.STOCK_LEDGER_ENABLED:
+                # 库存账本只在单进程内有效，新旧worker不能同时运行
+                self._terminate([pid], config.SERVER_GRACEFUL_TIMEOUT + 5)
+                self.spawn(slot)
+            else:
+                self.spawn(slot)
+                self._terminate([pid], config.SERVER_GRACEFUL_TIMEOUT + 5)
+
+    def stop(self):
+        """停止全部worker"""
+        print('停止服务', flush=True)
+        self._terminate(list(self.workers), config.SERVER_GRACEFUL_TIMEOUT + 5)
+        self.sock.close()
+
+    def _terminate(self, pids, timeout):
+        """发送TERM并等待退出，超时后强制结束"""
+        for pid in pids:
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while any(pid in self.workers for pid in pids) and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        for pid in pids:
+            if pid in self.workers:
+                self._kill(pid, signal.SIGKILL)
+        while any(pid in self.workers for pid in pids):
+            time.sleep(0.1)
+            self.reap()
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            self.workers.pop(pid, None)
+            self.nodes.pop(pid, None)
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reloading = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='点餐平台API服务（多进程）')
+    parser.add_argument('--workers', type=int, default=config.SERVER_WORKERS, help='worker进程数')
+    parser.add_argument('--threaded', action=argparse.BooleanOptionalAction, default=config.SERVER_THREADED,
+                        help='worker是否为每个请求启动一个线程')
+    parser.add_argument('--max-requests', type=int, default=config.SERVER_MAX_REQUESTS,
+                        help='worker处理该数量的请求后回收，0表示不回收')
+    parser.add_argument('--host', default=config.API_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=config.API_PORT, help='监听端口')
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error('worker进程数至少为1')
+    config.API_HOST = args.host
+    config.API_PORT = args.port
+    try:
+        check_secret_keys()
+    except RuntimeError as e:
+        sys.exit(f'错误: {e}')
+
+    Master(args.workers, args.threaded, args.max_requests).run()
+
+
+if __name__ == '__main__':
+    main()
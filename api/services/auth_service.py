@@ -4,7 +4,9 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from utils.helpers import get_db_connection, verify_password, dict_from_row
+from utils.helpers import (get_db_connection, get_current_datetime, verify_password,
+                           dict_from_row, invalidate_user)
+from utils.storage import execute_write
 import config
 
 
@@ -82,3 +84,43 @@ class AuthService:
         conn.close()
         
         return dict_from_row(user)
+    
+    def update_user_role(self, user_id, role):
+        """
+        修改用户角色
+        
+        Args:
+            user_id (int): 用户ID
+            role (str): 新角色
+        
+        Raises:
+            ValueError: 角色无效或用户不存在
+        """
+        if role not in (config.ROLE_EMPLOYEE, config.ROLE_CANTEEN_STAFF, config.ROLE_ADMIN):
+            raise ValueError('角色无效')
+        self._update_user(user_id, 'role', role)
+    
+    def set_user_active(self, user_id, is_active):
+        """
+        启用/禁用用户
+        
+        Args:
+            user_id (int): 用户ID
+            is_active (bool): 是否启用
+        
+        Raises:
+            ValueError: 用户不存在
+        """
+        self._update_user(user_id, 'is_active', 1 if is_active else 0)
+    
+    def _update_user(self, user_id, column, value):
+        """更新用户的权限相关字段，提交后使身份缓存失效并吊销该用户已签发的令牌"""
+        def update(conn):
+            return conn.execute(f'''
+                UPDATE users SET {column} = ?, updated_at = ? WHERE id = ?
+            ''', (value, get_current_datetime(), user_id)).rowcount
+        
+        if not execute_write(update):
+            raise ValueError('用户不存在')
+        
+        invalidate_user(user_id)
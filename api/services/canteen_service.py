@@ -5,6 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from utils.helpers import get_db_connection, get_current_datetime, dict_from_row, list_from_rows
+from utils.versions import bump
 import config
 
 
@@ -80,6 +81,7 @@ class CanteenService:
             conn.commit()
             conn.close()
             
+            bump('canteens')
             return canteen_id
         except Exception as e:
             conn.rollback()
@@ -110,6 +112,7 @@ class CanteenService:
             
             conn.commit()
             conn.close()
+            bump('canteens')
         except Exception as e:
             conn.rollback()
             conn.close()
@@ -148,6 +151,7 @@ class CanteenService:
             cursor.execute('DELETE FROM canteens WHERE id = ?', (canteen_id,))
             conn.commit()
             conn.close()
+            bump('canteens')
         except Exception as e:
             conn.rollback()
             conn.close()
@@ -5,6 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from utils.helpers import get_db_connection, get_current_datetime, dict_from_row, list_from_rows
+from utils.versions import bump
 import config
 
 
@@ -110,6 +111,7 @@ class DishService:
             conn.commit()
             conn.close()
             
+            bump('dishes')
             return dish_id
         except Exception as e:
             conn.rollback()
@@ -143,6 +145,7 @@ class DishService:
             
             conn.commit()
             conn.close()
+            bump('dishes')
         except Exception as e:
             conn.rollback()
             conn.close()
@@ -170,6 +173,7 @@ class DishService:
             
             conn.commit()
             conn.close()
+            bump('dishes')
         except Exception as e:
             conn.rollback()
             conn.close()
@@ -200,6 +204,7 @@ class DishService:
             cursor.execute('DELETE FROM dishes WHERE id = ?', (dish_id,))
             conn.commit()
             conn.close()
+            bump('dishes')
         except Exception as e:
             conn.rollback()
             conn.close()
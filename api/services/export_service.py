@@ -0,0 +1,116 @@
+# 数据导出服务
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.db_pool import get_pool
+from utils import archive
+import config
+
+# 导出列：(列名, 表头)
+ORDER_ITEM_COLUMNS = [
+    ('order_no', '订单号'),
+    ('order_date', '日期'),
+    ('meal_type', '餐次'),
+    ('status', '状态'),
+    ('employee_id', '工号'),
+    ('full_name', '姓名'),
+    ('dish_id', '菜品ID'),
+    ('dish_name', '菜品名称'),
+    ('dish_price', '单价'),
+    ('quantity', '数量'),
+    ('subtotal', '小计'),
+    ('created_at', '下单时间'),
+]
+
+MEAL_STATISTICS_COLUMNS = [
+    ('order_date', '日期'),
+    ('meal_type', '餐次'),
+    ('dish_id', '菜品ID'),
+    ('dish_name', '菜品名称'),
+    ('total_quantity', '总数量'),
+    ('order_count', '订单数'),
+]
+
+
+class ExportService:
+    """
+    数据导出服务类
+
+    查询结果通过 fetchmany 分批读取并逐批产出，不在内存中构建完整列表，
+    导出行数再多内存占用也保持不变。生成器在响应发送期间执行，已脱离
+    Flask请求上下文，因此单独从连接池借出连接，生成器结束（或客户端断开）
+    时归还。
+    """
+
+    def iter_order_items(self, canteen_id, start_date, end_date, status=None):
+        """
+        按订单项导出订单明细（日期倒序，与订单列表一致；日期范围涉及归档订单时合并归档库）
+
+        Args:
+            canteen_id (int): 食堂ID
+            start_date (str): 开始日期（含）
+            end_date (str): 结束日期（含）
+            status (str): 订单状态过滤
+
+        Returns:
+            generator: 每次产出一批行（元组列表），列顺序同 ORDER_ITEM_COLUMNS
+        """
+        query = '''
+            SELECT o.order_no, o.order_date, o.meal_type, o.status, u.employee_id, u.full_name,
+                   oi.dish_id, oi.dish_name, oi.dish_price, oi.quantity, oi.subtotal, o.created_at
+            FROM {schema}.orders o
+            JOIN {schema}.order_items oi ON oi.order_id = o.id
+            LEFT JOIN users u ON u.id = o.user_id
+        '''
+        where = 'o.canteen_id = ? AND o.order_date BETWEEN ? AND ?'
+        params = [canteen_id, start_date, end_date]
+
+        if status:
+            where += ' AND o.status = ?'
+            params.append(status)
+
+        if archive.reaches(start_date):
+            # 两个库各自按索引顺序读取后归并；结果中没有订单ID，同一时刻下单的按订单号排列
+            return self._iter_batches(
+                archive.union_query(query, where, 'o.order_date DESC, o.meal_type, o.created_at, o.order_no'),
+                params + params)
+
+        # 与索引顺序一致，SQLite边扫描边返回，无需排序缓冲
+        query = (f"{query.format(schema='main')} WHERE {where} "
+                 'ORDER BY o.order_date DESC, o.meal_type, o.created_at, o.id')
+        return self._iter_batches(query, params)
+
+    def iter_meal_statistics(self, canteen_id, start_date, end_date):
+        """
+        按日期、餐次、菜品导出餐次统计
+
+        Args:
+            canteen_id (int): 食堂ID
+            start_date (str): 开始日期（含）
+            end_date (str): 结束日期（含）
+
+        Returns:
+            generator: 每次产出一批行（元组列表），列顺序同 MEAL_STATISTICS_COLUMNS
+        """
+        query = '''
+            SELECT order_date, meal_type, dish_id, dish_name, total_quantity, order_count
+            FROM meal_dish_totals
+            WHERE canteen_id = ? AND order_date BETWEEN ? AND ? AND order_count > 0
+            ORDER BY order_date, meal_type, dish_id
+        '''
+        return self._iter_batches(query, [canteen_id, start_date, end_date])
+
+    def _iter_batches(self, query, params):
+        """执行查询并按 config.EXPORT_FETCH_SIZE 分批产出"""
+        conn = get_pool().acquire()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(config.EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+        finally:
+            conn.close()
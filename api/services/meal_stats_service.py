@@ -0,0 +1,294 @@
+# 餐次统计汇总服务
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.helpers import get_db_connection, list_from_rows
+from utils.pubsub import hub
+from utils.versions import bump
+from utils import archive
+
+# 从订单明细重新计算汇总的SQL，条件由调用方拼接
+_DISH_TOTALS_SQL = '''
+    SELECT o.canteen_id, o.order_date, o.meal_type, oi.dish_id, MAX(oi.dish_name) as dish_name,
+           SUM(oi.quantity) as total_quantity, COUNT(DISTINCT o.id) as order_count
+    FROM {schema}.orders o
+    JOIN {schema}.order_items oi ON oi.order_id = o.id
+    WHERE o.status IN ('placed', 'completed') {where}
+    GROUP BY o.canteen_id, o.order_date, o.meal_type, oi.dish_id
+'''
+
+_ORDER_TOTALS_SQL = '''
+    SELECT o.canteen_id, o.order_date, o.meal_type, COUNT(*) as total_orders,
+           COALESCE(SUM((SELECT SUM(quantity) FROM {schema}.order_items WHERE order_id = o.id)), 0)
+               as total_quantity
+    FROM {schema}.orders o
+    WHERE o.status IN ('placed', 'completed') {where}
+    GROUP BY o.canteen_id, o.order_date, o.meal_type
+'''
+
+# 热库与归档库分别汇总后再合并：(分组列, 合并后的汇总列)
+_DISH_TOTALS_MERGE = ('canteen_id, order_date, meal_type, dish_id',
+                      'MAX(dish_name) as dish_name, SUM(total_quantity) as total_quantity, '
+                      'SUM(order_count) as order_count')
+_ORDER_TOTALS_MERGE = ('canteen_id, order_date, meal_type',
+                       'SUM(total_orders) as total_orders, SUM(total_quantity) as total_quantity')
+
+
+def _totals_sql(sql, merge, where, params, order_date=None):
+    """
+    汇总SQL；涉及已归档的日期时合并归档库（每个订单只在一个库中计入）
+
+    Returns:
+        tuple: (SQL, 参数)
+    """
+    if not archive.reaches(order_date):
+        return sql.format(schema='main', where=where), params
+    key, sums = merge
+    hot = sql.format(schema='main', where=where)
+    cold = sql.format(schema='archive', where=f'{where} AND {archive.NOT_IN_HOT}')
+    return f'SELECT {key}, {sums} FROM ({hot} UNION ALL {cold}) GROUP BY {key}', params + params
+
+
+class MealStatsService:
+    """
+    餐次统计汇总服务类
+
+    meal_dish_totals 按 (食堂, 日期, 餐次, 菜品) 保存份数和订单数，
+    meal_order_totals 按 (食堂, 日期, 餐次) 保存有效订单数和总份数。
+    下单、修改、取消时在同一写事务内以增量方式更新，统计时直接读取。
+    每次变更递增 meal_order_totals.version，实时推送据此与快照去重。
+    """
+
+    @staticmethod
+    def topic(canteen_id, order_date, meal_type):
+        """餐次统计的推送主题"""
+        return f'meal:{canteen_id}:{order_date}:{meal_type}'
+
+    def apply_order_change(self, cursor, canteen_id, order_date, meal_type,
+                           old_items, new_items, order_delta):
+        """
+        按订单变更更新汇总（在调用方的写事务内执行）
+
+        Args:
+            cursor: 数据库游标
+            canteen_id (int): 食堂ID
+            order_date (str): 订餐日期
+            meal_type (str): 餐次类型
+            old_items (list): 变更前的订单项 (dish_id, dish_name, quantity)
+            new_items (list): 变更后的订单项 (dish_id, dish_name, quantity)
+            order_delta (int): 有效订单数变化（下单+1，取消-1，修改0）
+
+        Returns:
+            dict: 本次变更（用于提交后推送），没有变化时返回None
+        """
+        old = self._merge(old_items)
+        new = self._merge(new_items)
+
+        rows = []
+        for dish_id in list(old) + [dish_id for dish_id in new if dish_id not in old]:
+            old_name, old_quantity = old.get(dish_id, (None, 0))
+            new_name, new_quantity = new.get(dish_id, (None, 0))
+            count_delta = (dish_id in new) - (dish_id in old)
+            quantity_delta = new_quantity - old_quantity
+            if quantity_delta or count_delta:
+                rows.append((canteen_id, order_date, meal_type, dish_id, new_name or old_name,
+                             quantity_delta, count_delta))
+
+        if rows:
+            cursor.executemany('''
+                INSERT INTO meal_dish_totals (canteen_id, order_date, meal_type, dish_id, dish_name,
+                                              total_quantity, order_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (canteen_id, order_date, meal_type, dish_id) DO UPDATE SET
+                    dish_name = excluded.dish_name,
+                    total_quantity = total_quantity + excluded.total_quantity,
+                    order_count = order_count + excluded.order_count
+            ''', rows)
+
+        quantity_delta = sum(quantity for _, quantity in new.values()) - \
+            sum(quantity for _, quantity in old.values())
+        if not rows and not order_delta:
+            return None
+
+        cursor.execute('''
+            INSERT INTO meal_order_totals (canteen_id, order_date, meal_type, total_orders,
+                                           total_quantity, version)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (canteen_id, order_date, meal_type) DO UPDATE SET
+                total_orders = total_orders + excluded.total_orders,
+                total_quantity = total_quantity + excluded.total_quantity,
+                version = version + 1
+            RETURNING version
+        ''', (canteen_id, order_date, meal_type, order_delta, quantity_delta))
+        version = cursor.fetchone()[0]
+
+        return {
+            'canteen_id': canteen_id,
+            'order_date': order_date,
+            'meal_type': meal_type,
+            'version': version,
+            'order_delta': order_delta,
+            'quantity_delta': quantity_delta,
+            'dishes': [
+                {'dish_id': row[3], 'dish_name': row[4], 'quantity_delta': row[5], 'order_count_delta': row[6]}
+                for row in rows
+            ]
+        }
+
+    def publish(self, change):
+        """
+        推送已提交的变更
+
+        Args:
+            change (dict): apply_order_change 的返回值（可附带订单信息）
+        """
+        topic = self.topic(change['canteen_id'], change['order_date'], change['meal_type'])
+        hub.publish(topic, 'delta', change, version=change['version'])
+        # 其他worker的订阅者据此发现变更（见 EventHub.poll）
+        bump(topic)
+
+    def get_totals(self, canteen_id, order_date, meal_type):
+        """
+        读取餐次汇总
+
+        Args:
+            canteen_id (int): 食堂ID
+            order_date (str): 日期
+            meal_type (str): 餐次类型
+
+        Returns:
+            dict: {'dish_statistics': 按份数降序的菜品汇总, 'total_orders', 'total_quantity', 'version'}
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT dish_id, dish_name, total_quantity, order_count
+            FROM meal_dish_totals
+            WHERE canteen_id = ? AND order_date = ? AND meal_type = ? AND order_count > 0
+            ORDER BY total_quantity DESC, dish_id
+        ''', (canteen_id, order_date, meal_type))
+        dish_stats = cursor.fetchall()
+
+        cursor.execute('''
+            SELECT total_orders, total_quantity, version
+            FROM meal_order_totals
+            WHERE canteen_id = ? AND order_date = ? AND meal_type = ?
+        ''', (canteen_id, order_date, meal_type))
+        totals = cursor.fetchone()
+        conn.close()
+
+        return {
+            'dish_statistics': list_from_rows(dish_stats),
+            'total_orders': totals['total_orders'] if totals else 0,
+            'total_quantity': totals['total_quantity'] if totals else 0,
+            'version': totals['version'] if totals else 0
+        }
+
+    def rebuild(self, conn, order_date=None):
+        """
+        根据订单明细重新计算汇总（在写事务内执行）
+
+        Args:
+            conn: 数据库连接
+            order_date (str): 只重建该日期，默认全部
+
+        Returns:
+            int: 重建后的菜品汇总行数
+        """
+        where, params = self._date_filter(order_date)
+        delete_where = 'WHERE order_date = ?' if order_date else ''
+
+        conn.execute(f'DELETE FROM meal_dish_totals {delete_where}', params)
+        totals_sql, totals_params = _totals_sql(_DISH_TOTALS_SQL, _DISH_TOTALS_MERGE, where, params, order_date)
+        conn.execute(f'''
+            INSERT INTO meal_dish_totals (canteen_id, order_date, meal_type, dish_id, dish_name,
+                                          total_quantity, order_count)
+            {totals_sql}
+        ''', totals_params)
+
+        # 餐次汇总保留并递增版本号，版本号必须单调递增
+        conn.execute(f'''
+            UPDATE meal_order_totals SET total_orders = 0, total_quantity = 0, version = version + 1
+            {delete_where}
+        ''', params)
+        totals_sql, totals_params = _totals_sql(_ORDER_TOTALS_SQL, _ORDER_TOTALS_MERGE, where, params, order_date)
+        conn.execute(f'''
+            INSERT INTO meal_order_totals (canteen_id, order_date, meal_type, total_orders, total_quantity)
+            {totals_sql}
+            ON CONFLICT (canteen_id, order_date, meal_type) DO UPDATE SET
+                total_orders = excluded.total_orders,
+                total_quantity = excluded.total_quantity
+        ''', totals_params)
+
+        count_sql = 'SELECT COUNT(*) FROM meal_dish_totals ' + delete_where
+        return conn.execute(count_sql, params).fetchone()[0]
+
+    def check_drift(self, conn, order_date=None):
+        """
+        比较汇总表与订单明细重新计算的结果
+
+        Args:
+            conn: 数据库连接
+            order_date (str): 只检查该日期，默认全部
+
+        Returns:
+            list: 不一致的记录 {'table', 'key', 'stored', 'expected'}
+        """
+        where, params = self._date_filter(order_date)
+        date_where = 'AND order_date = ?' if order_date else ''
+        drift = []
+
+        expected = {
+            (row['canteen_id'], row['order_date'], row['meal_type'], row['dish_id']):
+                (row['total_quantity'], row['order_count'])
+            for row in conn.execute(*_totals_sql(_DISH_TOTALS_SQL, _DISH_TOTALS_MERGE, where, params, order_date))
+        }
+        stored = {
+            (row['canteen_id'], row['order_date'], row['meal_type'], row['dish_id']):
+                (row['total_quantity'], row['order_count'])
+            for row in conn.execute(f'''
+                SELECT * FROM meal_dish_totals
+                WHERE (order_count != 0 OR total_quantity != 0) {date_where}
+            ''', params)
+        }
+        drift.extend(self._diff('meal_dish_totals', stored, expected))
+
+        expected = {
+            (row['canteen_id'], row['order_date'], row['meal_type']):
+                (row['total_orders'], row['total_quantity'])
+            for row in conn.execute(*_totals_sql(_ORDER_TOTALS_SQL, _ORDER_TOTALS_MERGE, where, params, order_date))
+        }
+        stored = {
+            (row['canteen_id'], row['order_date'], row['meal_type']):
+                (row['total_orders'], row['total_quantity'])
+            for row in conn.execute(f'''
+                SELECT * FROM meal_order_totals
+                WHERE (total_orders != 0 OR total_quantity != 0) {date_where}
+            ''', params)
+        }
+        drift.extend(self._diff('meal_order_totals', stored, expected))
+
+        return drift
+
+    def _merge(self, items):
+        """合并同一菜品的订单项：菜品ID -> (菜品名称, 总数量)"""
+        merged = {}
+        for dish_id, dish_name, quantity in items:
+            _, total = merged.get(dish_id, (None, 0))
+            merged[dish_id] = (dish_name, total + quantity)
+        return merged
+
+    def _date_filter(self, order_date):
+        if order_date:
+            return 'AND o.order_date = ?', [order_date]
+        return '', []
+
+    def _diff(self, table, stored, expected):
+        return [
+            {'table': table, 'key': key, 'stored': stored.get(key), 'expected': expected.get(key)}
+            for key in sorted(set(stored) | set(expected))
+            if stored.get(key) != expected.get(key)
+        ]
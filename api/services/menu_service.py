@@ -4,16 +4,28 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from utils.helpers import get_db_connection, get_current_datetime, dict_from_row, list_from_rows
+from datetime import datetime, timedelta
+from utils.helpers import (get_db_connection, get_current_datetime, check_time_limit,
+                           ended_meals, dict_from_row, list_from_rows)
+from utils.storage import execute_write
+from utils.stock_ledger import get_ledger
+from utils.cache import LRUCache
+from utils.versions import get_version, get_versions, bump
+from utils import archive
 import config
 
 
+# 菜单缓存：菜单列表、菜单静态信息和非当日菜单的可用数量。
+# 键中带有相关数据的版本号，数据变更时递增版本即可使旧条目失效
+menu_cache = LRUCache(config.MENU_CACHE_SIZE, config.MENU_CACHE_TTL)
+
+
 class MenuService:
     """菜单服务类"""
     
     def get_menu_list(self, canteen_id=None, menu_date=None, meal_type=None):
         """
-        获取菜单列表
+        获取菜单列表（读穿透缓存）
         
         Args:
             canteen_id (int): 食堂ID
@@ -23,6 +35,16 @@ class MenuService:
         Returns:
             list: 菜单列表
         """
+        key = ('list', canteen_id, menu_date, meal_type, get_versions('menus', 'canteens'))
+        menus = menu_cache.get(key)
+        if menus is None:
+            menus = self._query_menu_list(canteen_id, menu_date, meal_type)
+            menu_cache.set(key, menus)
+        
+        return [dict(menu) for menu in menus]
+    
+    def _query_menu_list(self, canteen_id, menu_date, meal_type):
+        """从数据库查询菜单列表"""
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -58,12 +80,36 @@ class MenuService:
         """
         获取菜单详情（包含菜单项）
         
+        菜单和菜品信息来自缓存，可用数量单独获取：
+        当日菜单读内存库存账本，其他菜单读按库存版本缓存的数量。
+        
         Args:
             menu_id (int): 菜单ID
         
         Returns:
             dict: 菜单信息（包含items）
         """
+        menu = self._get_menu_static(menu_id)
+        if not menu:
+            return None
+        
+        available = self._get_menu_stock(menu_id)
+        
+        menu_dict = dict(menu)
+        menu_dict['items'] = [
+            dict(item, available_quantity=available.get(item['dish_id'], item['available_quantity']))
+            for item in menu['items']
+        ]
+        
+        return menu_dict
+    
+    def _get_menu_static(self, menu_id):
+        """获取菜单及菜单项的静态信息（菜品名称、价格、分类），结果可缓存"""
+        key = ('menu', menu_id, get_versions(f'menu:{menu_id}', 'dishes', 'dish_categories', 'canteens'))
+        menu = menu_cache.get(key)
+        if menu is not None:
+            return menu
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -98,9 +144,131 @@ class MenuService:
         conn.close()
         
         menu_dict['items'] = list_from_rows(items)
+        menu_cache.set(key, menu_dict)
         
         return menu_dict
     
+    def _get_menu_stock(self, menu_id):
+        """
+        获取菜单内各菜品的可用数量
+        
+        Args:
+            menu_id (int): 菜单ID
+        
+        Returns:
+            dict: 菜品ID -> 可用数量
+        """
+        # 当日菜单的可用数量以内存账本为准（数据库中的值异步回写）
+        ledger = get_ledger()
+        available = ledger.get_available(menu_id) if ledger else None
+        if available is not None:
+            return available
+        
+        key = ('stock', menu_id, get_version(f'stock:{menu_id}'))
+        available = menu_cache.get(key)
+        if available is None:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT dish_id, available_quantity FROM menu_items WHERE menu_id = ?
+            ''', (menu_id,))
+            available = {row['dish_id']: row['available_quantity'] for row in cursor.fetchall()}
+            conn.close()
+            menu_cache.set(key, available)
+        
+        return available
+    
+    def get_calendar(self, user_id, start_date, days, canteen_id=None):
+        """
+        获取连续多天各餐次的可订情况（首页日历）
+        
+        一次查询取出日期范围内所有菜单的剩余库存合计以及该用户的有效订单，
+        当日菜单的剩余库存以内存账本为准。
+        
+        Args:
+            user_id (int): 用户ID
+            start_date (str): 开始日期 (YYYY-MM-DD)
+            days (int): 天数
+            canteen_id (int): 食堂ID，不传时汇总全部食堂
+        
+        Returns:
+            list: 每天一项 {'date', 'meals': {餐次: {'menus', 'available_quantity', 'can_order', 'order'}}}
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # 菜单按 (日期, 餐次) 索引取出，剩余库存用相关子查询按菜单求和，不对菜单分组；
+        # 订单按 (用户, 日期, 餐次) 定位，同一用户同一餐次至多一个有效订单，不会产生重复行
+        query = '''
+            SELECT m.id as menu_id, m.canteen_id, c.name as canteen_name, m.menu_date, m.meal_type,
+                   (SELECT COALESCE(SUM(mi.available_quantity), 0) FROM menu_items mi
+                    WHERE mi.menu_id = m.id) as available_quantity,
+                   o.id as order_id, o.order_no, o.status as order_status
+            FROM menus m
+            LEFT JOIN canteens c ON m.canteen_id = c.id
+            LEFT JOIN orders o ON o.user_id = ? AND o.order_date = m.menu_date AND o.meal_type = m.meal_type
+                              AND o.menu_id = m.id AND o.status IN (?, ?)
+            WHERE m.menu_date BETWEEN ? AND ? AND m.status IN (?, ?)
+        '''
+        # 当天已结束餐次的菜单已关闭，仍然展示（含用户已完成的订单）
+        params = [user_id, config.ORDER_STATUS_PLACED, config.ORDER_STATUS_COMPLETED, dates[0], dates[-1],
+                  config.MENU_STATUS_ACTIVE, config.MENU_STATUS_CLOSED]
+        
+        if canteen_id:
+            query += ' AND m.canteen_id = ?'
+            params.append(canteen_id)
+        
+        query += ' ORDER BY m.menu_date, m.canteen_id'
+        
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        calendar = {
+            date: {
+                meal_type: {
+                    'menus': [],
+                    'available_quantity': 0,
+                    'can_order': check_time_limit(meal_type, date),
+                    'order': None
+                }
+                for meal_type in config.MEAL_TIME_LIMITS
+            }
+            for date in dates
+        }
+        
+        ledger = get_ledger()
+        for row in rows:
+            meal = calendar[row['menu_date']].get(row['meal_type'])
+            if meal is None:
+                continue
+            
+            available = row['available_quantity']
+            ledger_available = ledger.get_available(row['menu_id']) if ledger else None
+            if ledger_available is not None:
+                available = sum(ledger_available.values())
+            
+            meal['menus'].append({
+                'menu_id': row['menu_id'],
+                'canteen_id': row['canteen_id'],
+                'canteen_name': row['canteen_name'],
+                'available_quantity': available
+            })
+            meal['available_quantity'] += available
+            
+            if row['order_id']:
+                meal['order'] = {
+                    'order_id': row['order_id'],
+                    'order_no': row['order_no'],
+                    'status': row['order_status'],
+                    'menu_id': row['menu_id']
+                }
+        
+        return [{'date': date, 'meals': calendar[date]} for date in dates]
+    
     def create_menu(self, canteen_id, menu_date, meal_type):
         """
         创建菜单
@@ -142,6 +310,7 @@ class MenuService:
             conn.commit()
             conn.close()
             
+            bump('menus', f'menu:{menu_id}')
             return menu_id
         except Exception as e:
             conn.rollback()
@@ -160,46 +329,60 @@ class MenuService:
         Returns:
             int: 新创建的菜单项ID
         """
-        conn = get_db_connection()
+        ledger_ops = []
+        try:
+            item_id = execute_write(lambda conn: self._add_menu_item(conn, menu_id, dish_id, quantity, ledger_ops))
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        bump(f'menu:{menu_id}', f'stock:{menu_id}')
+        return item_id
+    
+    def _add_menu_item(self, conn, menu_id, dish_id, quantity, ledger_ops):
+        """添加菜单项（在写事务内执行，已应用的账本调整追加到ledger_ops）"""
         cursor = conn.cursor()
         
         now = get_current_datetime()
         
-        try:
-            # 检查菜单项是否已存在
+        # 检查菜单项是否已存在
+        cursor.execute('''
+            SELECT id FROM menu_items
+            WHERE menu_id = ? AND dish_id = ?
+        ''', (menu_id, dish_id))
+        
+        existing = cursor.fetchone()
+        
+        if existing:
+            # 更新数量
             cursor.execute('''
-                SELECT id FROM menu_items
-                WHERE menu_id = ? AND dish_id = ?
-            ''', (menu_id, dish_id))
-            
-            existing = cursor.fetchone()
-            
-            if existing:
-                # 更新数量
-                cursor.execute('''
-                    UPDATE menu_items
-                    SET quantity = quantity + ?, available_quantity = available_quantity + ?, updated_at = ?
-                    WHERE id = ?
-                ''', (quantity, quantity, now, existing['id']))
-                
-                item_id = existing['id']
-            else:
-                # 新增
-                cursor.execute('''
-                    INSERT INTO menu_items (menu_id, dish_id, quantity, available_quantity, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (menu_id, dish_id, quantity, quantity, now, now))
-                
-                item_id = cursor.lastrowid
+                UPDATE menu_items
+                SET quantity = quantity + ?, available_quantity = available_quantity + ?, updated_at = ?
+                WHERE id = ?
+            ''', (quantity, quantity, now, existing['id']))
             
-            conn.commit()
-            conn.close()
+            item_id = existing['id']
+        else:
+            # 新增
+            cursor.execute('''
+                INSERT INTO menu_items (menu_id, dish_id, quantity, available_quantity, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (menu_id, dish_id, quantity, quantity, now, now))
             
-            return item_id
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            item_id = cursor.lastrowid
+        
+        # 当日菜单同步调整内存库存账本
+        ledger = get_ledger()
+        if ledger and ledger.get_available(menu_id) is not None:
+            name = None
+            if not existing:
+                cursor.execute('SELECT name FROM dishes WHERE id = ?', (dish_id,))
+                dish = cursor.fetchone()
+                name = dish['name'] if dish else None
+            ledger.adjust(menu_id, dish_id, quantity, name=name, quantity_delta=quantity)
+            # 新增的条目无法反向调整，回滚时重新加载整个菜单
+            ledger_ops.append((menu_id, dish_id if existing else None, quantity))
+        
+        return item_id
     
     def update_menu_item_quantity(self, menu_item_id, quantity):
         """
@@ -209,44 +392,56 @@ class MenuService:
             menu_item_id (int): 菜单项ID
             quantity (int): 新数量
         """
-        conn = get_db_connection()
+        ledger_ops = []
+        try:
+            menu_id = execute_write(lambda conn: self._update_menu_item_quantity(
+                conn, menu_item_id, quantity, ledger_ops))
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        bump(f'menu:{menu_id}', f'stock:{menu_id}')
+    
+    def _update_menu_item_quantity(self, conn, menu_item_id, quantity, ledger_ops):
+        """更新菜单项数量（在写事务内执行，已应用的账本调整追加到ledger_ops）"""
         cursor = conn.cursor()
         
         now = get_current_datetime()
         
-        try:
-            # 获取当前数量和可用数量
-            cursor.execute('''
-                SELECT quantity, available_quantity
-                FROM menu_items
-                WHERE id = ?
-            ''', (menu_item_id,))
-            
-            item = cursor.fetchone()
-            if not item:
-                conn.close()
-                raise ValueError('菜单项不存在')
-            
+        # 获取当前数量和可用数量
+        cursor.execute('''
+            SELECT menu_id, dish_id, quantity, available_quantity
+            FROM menu_items
+            WHERE id = ?
+        ''', (menu_item_id,))
+        
+        item = cursor.fetchone()
+        if not item:
+            raise ValueError('菜单项不存在')
+        
+        ledger = get_ledger()
+        available = ledger.get_available(item['menu_id']) if ledger else None
+        
+        if available is not None:
+            # 账本中的可用数量才是最新值
+            delta = quantity - item['quantity']
+            ledger.adjust(item['menu_id'], item['dish_id'], delta, quantity_delta=delta)
+            ledger_ops.append((item['menu_id'], item['dish_id'], delta))
+            new_available = ledger.get_available(item['menu_id'])[item['dish_id']]
+        else:
             # 计算已使用数量
             used = item['quantity'] - item['available_quantity']
             new_available = quantity - used
             
             if new_available < 0:
-                conn.close()
                 raise ValueError('新数量不能小于已使用数量')
-            
-            cursor.execute('''
-                UPDATE menu_items
-                SET quantity = ?, available_quantity = ?, updated_at = ?
-                WHERE id = ?
-            ''', (quantity, new_available, now, menu_item_id))
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+        
+        cursor.execute('''
+            UPDATE menu_items
+            SET quantity = ?, available_quantity = ?, updated_at = ?
+            WHERE id = ?
+        ''', (quantity, new_available, now, menu_item_id))
+        
+        return item['menu_id']
     
     def delete_menu_item(self, menu_item_id):
         """
@@ -255,17 +450,27 @@ class MenuService:
         Args:
             menu_item_id (int): 菜单项ID
         """
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        ledger_ops = []
+        
+        def delete(conn):
+            item = conn.execute('SELECT menu_id, dish_id FROM menu_items WHERE id = ?',
+                                (menu_item_id,)).fetchone()
+            conn.execute('DELETE FROM menu_items WHERE id = ?', (menu_item_id,))
+            
+            ledger = get_ledger()
+            if ledger and item and ledger.get_available(item['menu_id']) is not None:
+                ledger.discard(item['menu_id'], item['dish_id'])
+                ledger_ops.append((item['menu_id'], None, 0))
+            
+            return item['menu_id'] if item else None
         
         try:
-            cursor.execute('DELETE FROM menu_items WHERE id = ?', (menu_item_id,))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            menu_id = execute_write(delete)
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        if menu_id:
+            bump(f'menu:{menu_id}', f'stock:{menu_id}')
     
     def delete_menu(self, menu_id):
         """
@@ -277,25 +482,313 @@ class MenuService:
         Raises:
             ValueError: 当菜单有关联订单时
         """
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        ledger_ops = []
         
-        # 检查是否有关联的订单
-        cursor.execute('SELECT COUNT(*) as count FROM orders WHERE menu_id = ?', (menu_id,))
-        order_count = cursor.fetchone()['count']
+        def delete(conn):
+            # 检查是否有关联的订单（包括已归档的）
+            cursor = conn.execute(f"SELECT COUNT(*) as count FROM {archive.source('orders')} WHERE menu_id = ?",
+                                  (menu_id,))
+            order_count = cursor.fetchone()['count']
+            
+            if order_count > 0:
+                raise ValueError('该菜单有关联订单，无法删除')
+            
+            conn.execute('DELETE FROM menus WHERE id = ?', (menu_id,))
+            
+            ledger = get_ledger()
+            if ledger and ledger.get_available(menu_id) is not None:
+                ledger.drop_menu(menu_id)
+                ledger_ops.append((menu_id, None, 0))
         
-        if order_count > 0:
-            conn.close()
-            raise ValueError('该菜单有关联订单，无法删除')
+        try:
+            execute_write(delete)
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        bump('menus', f'menu:{menu_id}', f'stock:{menu_id}')
+    
+    def close_ended_menus(self, now=None):
+        """
+        关闭已结束餐次的菜单
+        
+        按 config.MEAL_CLOSE_BATCH_SIZE 分批更新，关闭的菜单移出库存账本并使菜单缓存失效。
         
+        Args:
+            now (datetime): 以该时刻判断餐次是否结束，默认当前时间
+        
+        Returns:
+            int: 关闭的菜单数
+        """
+        today, meal_types = ended_meals(now)
+        placeholders = ','.join('?' * len(meal_types)) or 'NULL'
+        
+        def close(conn):
+            rows = conn.execute(f'''
+                UPDATE menus SET status = ?, updated_at = ?
+                WHERE id IN (
+                    SELECT id FROM menus
+                    WHERE status = 'active' AND menu_date <= ?
+                      AND (menu_date < ? OR meal_type IN ({placeholders}))
+                    LIMIT ?
+                )
+                RETURNING id
+            ''', [config.MENU_STATUS_CLOSED, get_current_datetime(), today, today, *meal_types,
+                  config.MEAL_CLOSE_BATCH_SIZE]).fetchall()
+            return [row['id'] for row in rows]
+        
+        total = 0
+        ledger = get_ledger()
+        while True:
+            menu_ids = execute_write(close)
+            if menu_ids:
+                bump('menus', *[f'menu:{menu_id}' for menu_id in menu_ids])
+                if ledger:
+                    for menu_id in menu_ids:
+                        ledger.drop_menu(menu_id)
+            total += len(menu_ids)
+            if len(menu_ids) < config.MEAL_CLOSE_BATCH_SIZE:
+                return total
+    
+    def bulk_upsert_menus(self, menus):
+        """
+        批量创建菜单并设置菜单项（单个写事务）
+        
+        菜单不存在时创建，已存在时沿用；菜单项按 (菜单, 菜品) 写入，
+        已存在的菜单项把总数量设置为新值，可用数量按差值调整。
+        任一条目校验失败时整体回滚。
+        
+        Args:
+            menus (list): [{'canteen_id', 'menu_date', 'meal_type', 'items': [{'dish_id', 'quantity'}]}]
+        
+        Returns:
+            dict: {'menus': [{'menu_id', 'canteen_id', 'menu_date', 'meal_type'}], 'items': 写入的菜单项数}
+        
+        Raises:
+            ValueError: 参数无效、菜品不属于该食堂或新数量小于已订数量
+        """
+        ledger_ops = []
         try:
-            cursor.execute('DELETE FROM menus WHERE id = ?', (menu_id,))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            result = execute_write(lambda conn: self._bulk_upsert_menus(conn, menus, ledger_ops))
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        
+        menu_ids = [menu['menu_id'] for menu in result['menus']]
+        bump('menus', *[f'menu:{menu_id}' for menu_id in menu_ids],
+             *[f'stock:{menu_id}' for menu_id in menu_ids])
+        return result
+    
+    def _revert_ledger(self, ledger_ops):
+        """
+        写事务失败时撤销已在账本中完成的调整
+        
+        ledger_ops 中每项为 (菜单ID, 菜品ID, 可用数量变化)：按相反顺序反向调整；
+        菜品ID为None表示条目已移除或新增，此时从数据库重新加载整个菜单。
+        """
+        ledger = get_ledger()
+        for menu_id, dish_id, delta in reversed(ledger_ops):
+            if dish_id is None:
+                ledger.reload_menu(menu_id)
+            else:
+                ledger.adjust(menu_id, dish_id, -delta, quantity_delta=-delta, check=False)
+        ledger_ops.clear()
+    
+    def _bulk_upsert_menus(self, conn, menus, ledger_ops):
+        """批量创建菜单并设置菜单项（在写事务内执行，已应用的账本调整追加到ledger_ops）"""
+        cursor = conn.cursor()
+        now = get_current_datetime()
+        today = datetime.now().strftime('%Y-%m-%d')
+        
+        keys = []
+        for menu in menus:
+            key = (int(menu['canteen_id']), menu['menu_date'], menu['meal_type'])
+            if key[2] not in config.MEAL_TIME_LIMITS:
+                raise ValueError(f'餐次类型无效: {key[2]}')
+            try:
+                datetime.strptime(key[1], '%Y-%m-%d')
+            except (TypeError, ValueError):
+                raise ValueError(f'日期格式错误: {key[1]}')
+            if key[1] < today:
+                raise ValueError(f'不能安排过去日期的菜单: {key[1]}')
+            if key in keys:
+                raise ValueError(f'菜单重复: {key[1]} {key[2]}')
+            keys.append(key)
+        
+        # 菜品必须属于对应食堂且为上架状态
+        rows = []
+        dish_ids = {int(item['dish_id']) for menu in menus for item in menu.get('items', [])}
+        dishes = {}
+        if dish_ids:
+            placeholders = ','.join('?' * len(dish_ids))
+            cursor.execute(f'''
+                SELECT id, name, canteen_id, status FROM dishes WHERE id IN ({placeholders})
+            ''', list(dish_ids))
+            dishes = {row['id']: row for row in cursor.fetchall()}
+        
+        for key, menu in zip(keys, menus):
+            for item in menu.get('items', []):
+                dish = dishes.get(int(item['dish_id']))
+                quantity = item.get('quantity')
+                if not dish or dish['canteen_id'] != key[0] or dish['status'] != config.DISH_STATUS_ACTIVE:
+                    raise ValueError(f'菜品ID {item["dish_id"]} 不存在或不属于该食堂')
+                if not isinstance(quantity, int) or quantity <= 0:
+                    raise ValueError(f'菜品ID {item["dish_id"]} 的数量必须为正整数')
+                rows.append((key, dish['id'], quantity))
+        
+        # 创建缺少的菜单，再按日期范围一次取回全部菜单ID
+        cursor.executemany('''
+            INSERT INTO menus (canteen_id, menu_date, meal_type, status, created_at, updated_at)
+            VALUES (?, ?, ?, 'active', ?, ?)
+            ON CONFLICT (canteen_id, menu_date, meal_type) DO NOTHING
+        ''', [key + (now, now) for key in keys])
+        
+        cursor.execute('''
+            SELECT id, canteen_id, menu_date, meal_type FROM menus
+            WHERE menu_date BETWEEN ? AND ?
+        ''', (min(key[1] for key in keys), max(key[1] for key in keys)))
+        menu_ids = {(row['canteen_id'], row['menu_date'], row['meal_type']): row['id']
+                    for row in cursor.fetchall()}
+        
+        # 当日菜单以账本为准：先加载账本（读到写入前的快照），写入后按差值调整
+        ledger = get_ledger()
+        tracked = {menu_ids[key] for key in keys
+                   if ledger and ledger.tracks(menu_ids[key], key[1])}
+        
+        old_quantities = {}
+        if tracked:
+            placeholders = ','.join('?' * len(tracked))
+            cursor.execute(f'''
+                SELECT menu_id, dish_id, quantity FROM menu_items WHERE menu_id IN ({placeholders})
+            ''', list(tracked))
+            old_quantities = {(row['menu_id'], row['dish_id']): row['quantity'] for row in cursor.fetchall()}
+        
+        cursor.executemany('''
+            INSERT INTO menu_items (menu_id, dish_id, quantity, available_quantity, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (menu_id, dish_id) DO UPDATE SET
+                available_quantity = available_quantity + excluded.quantity - quantity,
+                quantity = excluded.quantity,
+                updated_at = excluded.updated_at
+        ''', [(menu_ids[key], dish_id, quantity, quantity, now, now) for key, dish_id, quantity in rows])
+        
+        untracked = [menu_ids[key] for key in keys if menu_ids[key] not in tracked]
+        if untracked:
+            placeholders = ','.join('?' * len(untracked))
+            cursor.execute(f'''
+                SELECT 1 FROM menu_items WHERE menu_id IN ({placeholders}) AND available_quantity < 0 LIMIT 1
+            ''', untracked)
+            if cursor.fetchone():
+                raise ValueError('新数量不能小于已使用数量')
+        
+        for key, dish_id, quantity in rows:
+            menu_id = menu_ids[key]
+            if menu_id in tracked:
+                delta = quantity - old_quantities.get((menu_id, dish_id), 0)
+                ledger.adjust(menu_id, dish_id, delta, name=dishes[dish_id]['name'], quantity_delta=delta)
+                ledger_ops.append((menu_id, dish_id, delta))
+        
+        return {
+            'menus': [
+                {'menu_id': menu_ids[key], 'canteen_id': key[0], 'menu_date': key[1], 'meal_type': key[2]}
+                for key in keys
+            ],
+            'items': len(rows)
+        }
+    
+    def clone_menus(self, source_start, source_end, target_start, canteen_id=None):
+        """
+        将一段日期的菜单（含菜单项和数量）复制到另一段日期（单个写事务）
+        
+        目标日期与源日期按相同偏移对应；目标菜单已存在时沿用并把数量设置为源菜单的数量，
+        源菜单中已下架的菜品不复制。
+        
+        Args:
+            source_start (str): 源开始日期（含）
+            source_end (str): 源结束日期（含）
+            target_start (str): 目标开始日期，必须晚于今天且目标范围不能与源范围重叠
+            canteen_id (int): 只复制该食堂，默认全部食堂
+        
+        Returns:
+            dict: {'menus': 复制的菜单数, 'items': 复制的菜单项数}
+        
+        Raises:
+            ValueError: 日期范围无效或新数量小于已订数量
+        """
+        start = datetime.strptime(source_start, '%Y-%m-%d')
+        end = datetime.strptime(source_end, '%Y-%m-%d')
+        target = datetime.strptime(target_start, '%Y-%m-%d')
+        days = (end - start).days + 1
+        offset = (target - start).days
+        
+        if days < 1 or days > config.MENU_CLONE_MAX_DAYS:
+            raise ValueError(f'复制范围必须在1到{config.MENU_CLONE_MAX_DAYS}天之间')
+        if target_start <= datetime.now().strftime('%Y-%m-%d'):
+            raise ValueError('目标日期必须晚于今天')
+        if -days < offset < days:
+            raise ValueError('目标日期范围不能与源日期范围重叠')
+        
+        result, menu_ids = execute_write(lambda conn: self._clone_menus(
+            conn, source_start, source_end, offset, canteen_id))
+        
+        bump('menus', *[f'menu:{menu_id}' for menu_id in menu_ids],
+             *[f'stock:{menu_id}' for menu_id in menu_ids])
+        return result
+    
+    def _clone_menus(self, conn, source_start, source_end, offset, canteen_id):
+        """复制菜单（在写事务内执行），返回 (结果, 目标菜单ID列表)"""
+        cursor = conn.cursor()
+        now = get_current_datetime()
+        shift = f'{offset:+d} days'
+        
+        # 源菜单通常是已过去的日期，已关闭的菜单同样可以复制
+        where = "s.menu_date BETWEEN ? AND ? AND s.status IN ('active', 'closed')"
+        params = [source_start, source_end]
+        if canteen_id:
+            where += ' AND s.canteen_id = ?'
+            params.append(canteen_id)
+        
+        cursor.execute(f'''
+            INSERT INTO menus (canteen_id, menu_date, meal_type, status, created_at, updated_at)
+            SELECT s.canteen_id, date(s.menu_date, ?), s.meal_type, 'active', ?, ?
+            FROM menus s
+            WHERE {where}
+            ON CONFLICT (canteen_id, menu_date, meal_type) DO NOTHING
+        ''', [shift, now, now] + params)
+        
+        cursor.execute(f'''
+            INSERT INTO menu_items (menu_id, dish_id, quantity, available_quantity, created_at, updated_at)
+            SELECT t.id, mi.dish_id, mi.quantity, mi.quantity, ?, ?
+            FROM menus s
+            JOIN menus t ON t.menu_date = date(s.menu_date, ?)
+                        AND t.canteen_id = s.canteen_id AND t.meal_type = s.meal_type
+            JOIN menu_items mi ON mi.menu_id = s.id
+            JOIN dishes d ON d.id = mi.dish_id
+            WHERE {where} AND d.status = 'active'
+            ON CONFLICT (menu_id, dish_id) DO UPDATE SET
+                available_quantity = available_quantity + excluded.quantity - quantity,
+                quantity = excluded.quantity,
+                updated_at = excluded.updated_at
+        ''', [now, now, shift] + params)
+        item_count = cursor.rowcount
+        
+        cursor.execute(f'''
+            SELECT t.id
+            FROM menus s
+            JOIN menus t ON t.menu_date = date(s.menu_date, ?)
+                        AND t.canteen_id = s.canteen_id AND t.meal_type = s.meal_type
+            WHERE {where}
+        ''', [shift] + params)
+        menu_ids = [row['id'] for row in cursor.fetchall()]
+        
+        if menu_ids:
+            placeholders = ','.join('?' * len(menu_ids))
+            cursor.execute(f'''
+                SELECT 1 FROM menu_items WHERE menu_id IN ({placeholders}) AND available_quantity < 0 LIMIT 1
+            ''', menu_ids)
+            if cursor.fetchone():
+                raise ValueError('新数量不能小于已使用数量')
+        
+        return {'menus': len(menu_ids), 'items': item_count}, menu_ids
     
     def update_stock(self, menu_item_id, quantity_change):
         """
@@ -308,36 +801,43 @@ class MenuService:
         Raises:
             ValueError: 当库存不足时
         """
-        conn = get_db_connection()
+        menu_id = execute_write(lambda conn: self._update_stock(conn, menu_item_id, quantity_change))
+        bump(f'stock:{menu_id}')
+    
+    def _update_stock(self, conn, menu_item_id, quantity_change):
+        """更新库存（在写事务内执行）"""
         cursor = conn.cursor()
         
         now = get_current_datetime()
         
-        try:
-            cursor.execute('''
-                SELECT available_quantity FROM menu_items WHERE id = ?
-            ''', (menu_item_id,))
-            
-            item = cursor.fetchone()
-            if not item:
-                conn.close()
-                raise ValueError('菜单项不存在')
-            
-            new_available = item['available_quantity'] + quantity_change
-            
-            if new_available < 0:
-                conn.close()
-                raise ValueError('库存不足')
-            
-            cursor.execute('''
-                UPDATE menu_items
-                SET available_quantity = ?, updated_at = ?
-                WHERE id = ?
-            ''', (new_available, now, menu_item_id))
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+        cursor.execute('''
+            SELECT mi.menu_id, mi.dish_id, mi.available_quantity, m.menu_date
+            FROM menu_items mi
+            LEFT JOIN menus m ON mi.menu_id = m.id
+            WHERE mi.id = ?
+        ''', (menu_item_id,))
+        
+        item = cursor.fetchone()
+        if not item:
+            raise ValueError('菜单项不存在')
+        
+        ledger = get_ledger()
+        if ledger and ledger.tracks(item['menu_id'], item['menu_date']):
+            if quantity_change < 0:
+                ledger.reserve(item['menu_id'], {item['dish_id']: -quantity_change})
+            else:
+                ledger.release(item['menu_id'], {item['dish_id']: quantity_change})
+            return item['menu_id']
+        
+        new_available = item['available_quantity'] + quantity_change
+        
+        if new_available < 0:
+            raise ValueError('库存不足')
+        
+        cursor.execute('''
+            UPDATE menu_items
+            SET available_quantity = ?, updated_at = ?
+            WHERE id = ?
+        ''', (new_available, now, menu_item_id))
+        
+        return item['menu_id']
@@ -5,13 +5,24 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from utils.helpers import (get_db_connection, get_current_datetime, generate_order_no,
-                           check_time_limit, dict_from_row, list_from_rows)
+                           check_time_limit, ended_meals, dict_from_row, list_from_rows,
+                           encode_cursor, decode_cursor)
+from utils.storage import execute_write
+from utils.versions import bump
+from utils.stock_ledger import get_ledger
+from utils import archive
+from services.stock_service import StockService
+from services.meal_stats_service import MealStatsService
 import config
 
 
 class OrderService:
     """订单服务类"""
     
+    def __init__(self):
+        self.stock_service = StockService()
+        self.meal_stats_service = MealStatsService()
+    
     def create_order(self, user_id, canteen_id, menu_id, meal_type, order_date, items):
         """
         创建订单
@@ -34,99 +45,138 @@ class OrderService:
         if not check_time_limit(meal_type, order_date):
             raise ValueError('已超过点餐时间')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # 当日菜单先在内存账本中预占库存，库存不足时无需进入写事务
+        ledger_ops = []
+        ledger = get_ledger()
+        if ledger and ledger.tracks(menu_id, order_date):
+            quantities = self.stock_service.merge_items(items)
+            ledger.reserve(menu_id, quantities)
+            ledger_ops.append((menu_id, {}, quantities))
         
+        events = []
         try:
-            # 检查是否已有订单
-            cursor.execute('''
-                SELECT id FROM orders
-                WHERE user_id = ? AND order_date = ? AND meal_type = ? 
-                  AND status IN ('placed', 'completed')
-            ''', (user_id, order_date, meal_type))
-            
-            existing = cursor.fetchone()
-            if existing:
-                conn.close()
-                raise ValueError('该餐次已有订单，不能重复下单')
-            
-            # 检查菜单项库存
-            for item in items:
-                cursor.execute('''
-                    SELECT mi.available_quantity, d.name, d.price
-                    FROM menu_items mi
-                    LEFT JOIN dishes d ON mi.dish_id = d.id
-                    WHERE mi.menu_id = ? AND mi.dish_id = ?
-                ''', (menu_id, item['dish_id']))
-                
-                menu_item = cursor.fetchone()
-                if not menu_item:
-                    conn.close()
-                    raise ValueError(f'菜品ID {item["dish_id"]} 不在菜单中')
-                
-                if menu_item['available_quantity'] < item['quantity']:
-                    conn.close()
-                    raise ValueError(f'菜品 {menu_item["name"]} 库存不足')
-            
-            # 创建订单
-            order_no = generate_order_no()
-            now = get_current_datetime()
-            total_amount = 0
-            
-            cursor.execute('''
-                INSERT INTO orders (order_no, user_id, canteen_id, menu_id, meal_type, 
-                                   order_date, status, total_amount, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, 'placed', 0, ?, ?)
-            ''', (order_no, user_id, canteen_id, menu_id, meal_type, order_date, now, now))
-            
-            order_id = cursor.lastrowid
-            
-            # 创建订单项并扣减库存
-            for item in items:
-                # 获取菜品信息
-                cursor.execute('''
-                    SELECT d.name, d.price, mi.id as menu_item_id
-                    FROM dishes d
-                    LEFT JOIN menu_items mi ON d.id = mi.dish_id
-                    WHERE d.id = ? AND mi.menu_id = ?
-                ''', (item['dish_id'], menu_id))
-                
-                dish = cursor.fetchone()
-                subtotal = dish['price'] * item['quantity']
-                total_amount += subtotal
-                
-                # 插入订单项
-                cursor.execute('''
-                    INSERT INTO order_items (order_id, dish_id, dish_name, dish_price, quantity, subtotal, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (order_id, item['dish_id'], dish['name'], dish['price'], 
-                     item['quantity'], subtotal, now))
-                
-                # 扣减库存
-                cursor.execute('''
-                    UPDATE menu_items
-                    SET available_quantity = available_quantity - ?, updated_at = ?
-                    WHERE id = ?
-                ''', (item['quantity'], now, dish['menu_item_id']))
-            
-            # 更新订单总金额
-            cursor.execute('''
-                UPDATE orders SET total_amount = ? WHERE id = ?
-            ''', (total_amount, order_id))
-            
-            conn.commit()
-            conn.close()
-            
-            return order_id
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            order_id = execute_write(lambda conn: self._create_order(
+                conn, user_id, canteen_id, menu_id, meal_type, order_date, items,
+                events, reserved=bool(ledger_ops)
+            ))
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        
+        bump(f'stock:{menu_id}')
+        self._publish(events)
+        return order_id
+    
+    def _create_order(self, conn, user_id, canteen_id, menu_id, meal_type, order_date, items,
+                      events, reserved=False):
+        """创建订单（在写事务内执行，reserved表示库存已由账本预占，统计变更追加到events）"""
+        cursor = conn.cursor()
+        
+        # 检查是否已有订单
+        cursor.execute('''
+            SELECT id FROM orders
+            WHERE user_id = ? AND order_date = ? AND meal_type = ? 
+              AND status IN ('placed', 'completed')
+        ''', (user_id, order_date, meal_type))
+        
+        existing = cursor.fetchone()
+        if existing:
+            raise ValueError('该餐次已有订单，不能重复下单')
+        
+        # 一次性校验并扣减所有菜品库存
+        if reserved:
+            dishes = self.stock_service.get_menu_dishes(
+                cursor, menu_id, list(self.stock_service.merge_items(items)))
+        else:
+            dishes = self.stock_service.reserve(cursor, menu_id, items)
+        
+        order_no = generate_order_no()
+        now = get_current_datetime()
+        order_items = self._build_order_items(items, dishes, now)
+        total_amount = sum(row[4] for row in order_items)
+        
+        # 创建订单
+        cursor.execute('''
+            INSERT INTO orders (order_no, user_id, canteen_id, menu_id, meal_type, 
+                               order_date, status, total_amount, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'placed', ?, ?, ?)
+        ''', (order_no, user_id, canteen_id, menu_id, meal_type, order_date, total_amount, now, now))
+        
+        order_id = cursor.lastrowid
+        self._insert_order_items(cursor, order_id, order_items)
+        
+        # 同一事务内累加餐次统计
+        change = self.meal_stats_service.apply_order_change(
+            cursor, canteen_id, order_date, meal_type,
+            [], [(row[0], row[1], row[3]) for row in order_items], 1)
+        
+        # 备餐看板需要展示下单员工
+        cursor.execute('SELECT employee_id, full_name FROM users WHERE id = ?', (user_id,))
+        user = cursor.fetchone()
+        change['order'] = {
+            'action': 'placed',
+            'order_no': order_no,
+            'employee_id': user['employee_id'] if user else None,
+            'full_name': user['full_name'] if user else None,
+            'created_at': now
+        }
+        events.append(change)
+        
+        return order_id
+    
+    def _build_order_items(self, items, dishes, now):
+        """
+        根据菜品信息生成订单项
+        
+        Returns:
+            list: (dish_id, dish_name, dish_price, quantity, subtotal, created_at) 列表
+        """
+        rows = []
+        for item in items:
+            dish = dishes[int(item['dish_id'])]
+            subtotal = dish['price'] * item['quantity']
+            rows.append((dish['dish_id'], dish['name'], dish['price'], item['quantity'], subtotal, now))
+        return rows
+    
+    def _ledger_exchange(self, order, old_items, new_items, ledger_ops):
+        """
+        订单所在菜单由内存账本管理时，在账本中退回旧订单项并预占新订单项
+        
+        Returns:
+            bool: 是否已由账本处理
+        """
+        ledger = get_ledger()
+        if not ledger or not ledger.tracks(order['menu_id'], order['order_date']):
+            return False
+        
+        old_quantities = self.stock_service.merge_items(old_items)
+        new_quantities = self.stock_service.merge_items(new_items)
+        ledger.exchange(order['menu_id'], old_quantities, new_quantities)
+        ledger_ops.append((order['menu_id'], old_quantities, new_quantities))
+        return True
+    
+    def _revert_ledger(self, ledger_ops):
+        """写事务失败时撤销已在账本中完成的库存变更"""
+        ledger = get_ledger()
+        for menu_id, released, reserved in reversed(ledger_ops):
+            ledger.exchange(menu_id, reserved, released, check=False)
+        ledger_ops.clear()
+    
+    def _publish(self, events):
+        """写事务提交后推送餐次统计变更"""
+        for change in events:
+            self.meal_stats_service.publish(change)
+    
+    def _insert_order_items(self, cursor, order_id, order_items):
+        """批量插入订单项"""
+        cursor.executemany('''
+            INSERT INTO order_items (order_id, dish_id, dish_name, dish_price, quantity, subtotal, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(order_id,) + row for row in order_items])
     
     def get_order_by_id(self, order_id):
         """
-        获取订单详情
+        获取订单详情（热库中没有时再查归档库）
         
         Args:
             order_id (int): 订单ID
@@ -138,15 +188,17 @@ class OrderService:
         cursor = conn.cursor()
         
         # 获取订单基本信息
-        cursor.execute('''
-            SELECT o.*, u.full_name as user_name, u.employee_id, c.name as canteen_name
-            FROM orders o
-            LEFT JOIN users u ON o.user_id = u.id
-            LEFT JOIN canteens c ON o.canteen_id = c.id
-            WHERE o.id = ?
-        ''', (order_id,))
-        
-        order = cursor.fetchone()
+        for schema in archive.schemas():
+            cursor.execute(f'''
+                SELECT o.*, u.full_name as user_name, u.employee_id, c.name as canteen_name
+                FROM {schema}.orders o
+                LEFT JOIN users u ON o.user_id = u.id
+                LEFT JOIN canteens c ON o.canteen_id = c.id
+                WHERE o.id = ?
+            ''', (order_id,))
+            order = cursor.fetchone()
+            if order:
+                break
         
         if not order:
             conn.close()
@@ -155,8 +207,8 @@ class OrderService:
         order_dict = dict_from_row(order)
         
         # 获取订单项
-        cursor.execute('''
-            SELECT * FROM order_items WHERE order_id = ? ORDER BY id
+        cursor.execute(f'''
+            SELECT * FROM {schema}.order_items WHERE order_id = ? ORDER BY id
         ''', (order_id,))
         
         items = cursor.fetchall()
@@ -166,83 +218,162 @@ class OrderService:
         
         return order_dict
     
-    def get_user_orders(self, user_id, status=None):
+    def get_user_orders(self, user_id, status=None, limit=None, cursor=None, with_total=False):
         """
-        获取用户订单列表
+        获取用户订单列表（按游标分页，最新的在前）
         
         Args:
             user_id (int): 用户ID
             status (str): 状态过滤
+            limit (int): 每页条数，默认config.ORDER_PAGE_SIZE
+            cursor (str): 上一页返回的next_cursor，不传时从第一页开始
+            with_total (bool): 是否统计符合条件的总数
         
         Returns:
-            list: 订单列表
+            dict: {'orders': 订单列表, 'next_cursor': 下一页游标（没有更多时为None）, 'total': 总数或None}
+        
+        Raises:
+            ValueError: 游标无效
         """
+        limit = limit or config.ORDER_PAGE_SIZE
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor_obj = conn.cursor()
         
-        query = '''
-            SELECT o.*, c.name as canteen_name
-            FROM orders o
-            LEFT JOIN canteens c ON o.canteen_id = c.id
-            WHERE o.user_id = ?
-        '''
+        where = 'o.user_id = ?'
         params = [user_id]
         
         if status:
-            query += ' AND o.status = ?'
+            where += ' AND o.status = ?'
             params.append(status)
         
-        query += ' ORDER BY o.order_date DESC, o.meal_type DESC, o.created_at DESC'
+        total = self._count_orders(cursor_obj, where, params) if with_total else None
         
-        cursor.execute(query, params)
-        orders = cursor.fetchall()
+        if cursor:
+            where += ' AND (o.order_date, o.meal_type, o.created_at, o.id) < (?, ?, ?, ?)'
+            params = params + decode_cursor(cursor, 4)
+        
+        orders = self._fetch_orders(cursor_obj, '''
+            SELECT o.*, c.name as canteen_name
+            FROM {schema}.orders o
+            LEFT JOIN canteens c ON o.canteen_id = c.id
+        ''', where, params, 'o.order_date DESC, o.meal_type DESC, o.created_at DESC, o.id DESC', limit)
         conn.close()
         
-        return list_from_rows(orders)
+        return self._order_page(orders, limit, total)
     
-    def get_canteen_orders(self, canteen_id, order_date=None, meal_type=None, status=None):
+    def get_canteen_orders(self, canteen_id, order_date=None, meal_type=None, status=None,
+                           start_date=None, end_date=None, limit=None, cursor=None, with_total=False):
         """
-        获取食堂订单列表
+        获取食堂订单列表（按游标分页，日期倒序、同一餐次按下单时间先后）
         
         Args:
             canteen_id (int): 食堂ID
             order_date (str): 日期过滤
             meal_type (str): 餐次过滤
             status (str): 状态过滤
+            start_date (str): 开始日期（含）
+            end_date (str): 结束日期（含）
+            limit (int): 每页条数，默认config.ORDER_PAGE_SIZE
+            cursor (str): 上一页返回的next_cursor，不传时从第一页开始
+            with_total (bool): 是否统计符合条件的总数
         
         Returns:
-            list: 订单列表
+            dict: {'orders': 订单列表, 'next_cursor': 下一页游标（没有更多时为None）, 'total': 总数或None}
+        
+        Raises:
+            ValueError: 游标无效
         """
+        limit = limit or config.ORDER_PAGE_SIZE
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor_obj = conn.cursor()
         
-        query = '''
-            SELECT o.*, u.full_name as user_name, u.employee_id
-            FROM orders o
-            LEFT JOIN users u ON o.user_id = u.id
-            WHERE o.canteen_id = ?
-        '''
+        where = 'o.canteen_id = ?'
         params = [canteen_id]
         
         if order_date:
-            query += ' AND o.order_date = ?'
+            where += ' AND o.order_date = ?'
             params.append(order_date)
         
+        if start_date:
+            where += ' AND o.order_date >= ?'
+            params.append(start_date)
+        
+        if end_date:
+            where += ' AND o.order_date <= ?'
+            params.append(end_date)
+        
         if meal_type:
-            query += ' AND o.meal_type = ?'
+            where += ' AND o.meal_type = ?'
             params.append(meal_type)
         
         if status:
-            query += ' AND o.status = ?'
+            where += ' AND o.status = ?'
             params.append(status)
         
-        query += ' ORDER BY o.order_date DESC, o.meal_type, o.created_at'
+        # 查询的最早日期，据此判断是否需要合并归档库
+        start = max(filter(None, [order_date, start_date]), default=None)
+        total = self._count_orders(cursor_obj, where, params, start) if with_total else None
+        
+        if cursor:
+            # 日期倒序、其余正序，拆成两段比较；order_date <= ? 让索引直接定位到游标所在日期
+            last_date, last_meal, last_created, last_id = decode_cursor(cursor, 4)
+            where += (' AND o.order_date <= ? AND (o.order_date < ? OR '
+                      '(o.meal_type, o.created_at, o.id) > (?, ?, ?))')
+            params = params + [last_date, last_date, last_meal, last_created, last_id]
         
-        cursor.execute(query, params)
-        orders = cursor.fetchall()
+        orders = self._fetch_orders(cursor_obj, '''
+            SELECT o.*, u.full_name as user_name, u.employee_id
+            FROM {schema}.orders o
+            LEFT JOIN users u ON o.user_id = u.id
+        ''', where, params, 'o.order_date DESC, o.meal_type, o.created_at, o.id', limit, start)
         conn.close()
         
-        return list_from_rows(orders)
+        return self._order_page(orders, limit, total)
+    
+    def _fetch_orders(self, cursor, query, where, params, order_by, limit, start_date=None):
+        """
+        查询一页订单（多查一条）
+        
+        先只查热库；这一页取不满或已到归档水位时，归档订单可能排在这一页内，
+        改为合并热库与归档库查询。
+        
+        Args:
+            cursor: 数据库游标
+            query (str): SELECT ... FROM 部分，库名写作 {schema}
+            where (str): 条件
+            params (list): 条件参数
+            order_by (str): 排序，日期倒序在前
+            limit (int): 每页条数
+            start_date (str): 查询的最早日期
+        
+        Returns:
+            list: 最多limit+1行
+        """
+        cursor.execute(f"{query.format(schema='main')} WHERE {where} ORDER BY {order_by} LIMIT ?",
+                       params + [limit + 1])
+        rows = cursor.fetchall()
+        if archive.page_complete(rows, limit, start_date):
+            return rows
+        cursor.execute(f'{archive.union_query(query, where, order_by)} LIMIT ?', params + params + [limit + 1])
+        return cursor.fetchall()
+    
+    def _count_orders(self, cursor, where, params, start_date=None):
+        """统计符合条件的订单数（查询范围涉及归档订单时加上归档库中的）"""
+        cursor.execute(f'SELECT COUNT(*) FROM orders o WHERE {where}', params)
+        total = cursor.fetchone()[0]
+        if archive.reaches(start_date):
+            cursor.execute(f'SELECT COUNT(*) FROM archive.orders o WHERE {where} AND {archive.NOT_IN_HOT}', params)
+            total += cursor.fetchone()[0]
+        return total
+    
+    def _order_page(self, rows, limit, total):
+        """组装一页订单，多查出的一条用于判断是否还有下一页"""
+        orders = list_from_rows(rows[:limit])
+        next_cursor = None
+        if len(rows) > limit:
+            last = orders[-1]
+            next_cursor = encode_cursor([last['order_date'], last['meal_type'], last['created_at'], last['id']])
+        return {'orders': orders, 'next_cursor': next_cursor, 'total': total}
     
     def update_order(self, order_id, user_id, items):
         """
@@ -256,103 +387,77 @@ class OrderService:
         Raises:
             ValueError: 各种业务逻辑错误
         """
-        conn = get_db_connection()
+        ledger_ops = []
+        events = []
+        try:
+            menu_id = execute_write(lambda conn: self._update_order(
+                conn, order_id, user_id, items, ledger_ops, events))
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        
+        bump(f'stock:{menu_id}')
+        self._publish(events)
+    
+    def _update_order(self, conn, order_id, user_id, items, ledger_ops, events):
+        """修改订单（在写事务内执行）"""
         cursor = conn.cursor()
         
-        try:
-            # 获取订单信息
-            cursor.execute('''
-                SELECT * FROM orders WHERE id = ? AND user_id = ?
-            ''', (order_id, user_id))
-            
-            order = cursor.fetchone()
-            if not order:
-                conn.close()
-                raise ValueError('订单不存在')
-            
-            if order['status'] != config.ORDER_STATUS_PLACED:
-                conn.close()
-                raise ValueError('只能修改已下单状态的订单')
-            
-            # 检查时间限制
-            if not check_time_limit(order['meal_type'], order['order_date']):
-                conn.close()
-                raise ValueError('已超过修改时间')
-            
-            now = get_current_datetime()
-            
-            # 获取原订单项并退回库存
-            cursor.execute('SELECT * FROM order_items WHERE order_id = ?', (order_id,))
-            old_items = cursor.fetchall()
-            
-            for old_item in old_items:
-                cursor.execute('''
-                    UPDATE menu_items mi
-                    SET available_quantity = available_quantity + ?, updated_at = ?
-                    WHERE mi.menu_id = ? AND mi.dish_id = ?
-                ''', (old_item['quantity'], now, order['menu_id'], old_item['dish_id']))
+        # 获取订单信息
+        cursor.execute('''
+            SELECT * FROM orders WHERE id = ? AND user_id = ?
+        ''', (order_id, user_id))
+        
+        order = cursor.fetchone()
+        if not order:
+            raise ValueError('订单不存在')
+        
+        if order['status'] != config.ORDER_STATUS_PLACED:
+            raise ValueError('只能修改已下单状态的订单')
+        
+        # 检查时间限制
+        if not check_time_limit(order['meal_type'], order['order_date']):
+            raise ValueError('已超过修改时间')
+        
+        now = get_current_datetime()
+        
+        # 获取原订单项并退回库存
+        cursor.execute('SELECT dish_id, dish_name, quantity FROM order_items WHERE order_id = ?', (order_id,))
+        old_items = cursor.fetchall()
+        
+        if self._ledger_exchange(order, old_items, items, ledger_ops):
+            cursor.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
+            dishes = self.stock_service.get_menu_dishes(
+                cursor, order['menu_id'], list(self.stock_service.merge_items(items)))
+        else:
+            self.stock_service.release(cursor, order['menu_id'], old_items)
             
             # 删除原订单项
             cursor.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
             
-            # 检查新订单项库存
-            for item in items:
-                cursor.execute('''
-                    SELECT mi.available_quantity, d.name
-                    FROM menu_items mi
-                    LEFT JOIN dishes d ON mi.dish_id = d.id
-                    WHERE mi.menu_id = ? AND mi.dish_id = ?
-                ''', (order['menu_id'], item['dish_id']))
-                
-                menu_item = cursor.fetchone()
-                if not menu_item:
-                    conn.close()
-                    raise ValueError(f'菜品ID {item["dish_id"]} 不在菜单中')
-                
-                if menu_item['available_quantity'] < item['quantity']:
-                    conn.close()
-                    raise ValueError(f'菜品 {menu_item["name"]} 库存不足')
-            
-            # 创建新订单项并扣减库存
-            total_amount = 0
-            for item in items:
-                cursor.execute('''
-                    SELECT d.name, d.price, mi.id as menu_item_id
-                    FROM dishes d
-                    LEFT JOIN menu_items mi ON d.id = mi.dish_id
-                    WHERE d.id = ? AND mi.menu_id = ?
-                ''', (item['dish_id'], order['menu_id']))
-                
-                dish = cursor.fetchone()
-                subtotal = dish['price'] * item['quantity']
-                total_amount += subtotal
-                
-                cursor.execute('''
-                    INSERT INTO order_items (order_id, dish_id, dish_name, dish_price, quantity, subtotal, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (order_id, item['dish_id'], dish['name'], dish['price'], 
-                     item['quantity'], subtotal, now))
-                
-                cursor.execute('''
-                    UPDATE menu_items
-                    SET available_quantity = available_quantity - ?, updated_at = ?
-                    WHERE id = ?
-                ''', (item['quantity'], now, dish['menu_item_id']))
-            
-            # 更新订单
-            cursor.execute('''
-                UPDATE orders
-                SET total_amount = ?, updated_at = ?
-                WHERE id = ?
-            ''', (total_amount, now, order_id))
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+            # 校验并扣减新订单项库存
+            dishes = self.stock_service.reserve(cursor, order['menu_id'], items)
+        
+        order_items = self._build_order_items(items, dishes, now)
+        total_amount = sum(row[4] for row in order_items)
+        self._insert_order_items(cursor, order_id, order_items)
+        
+        change = self.meal_stats_service.apply_order_change(
+            cursor, order['canteen_id'], order['order_date'], order['meal_type'],
+            [(row['dish_id'], row['dish_name'], row['quantity']) for row in old_items],
+            [(row[0], row[1], row[3]) for row in order_items], 0)
+        if change:
+            change['order'] = {'action': 'updated', 'order_no': order['order_no']}
+            events.append(change)
+        
+        # 更新订单
+        cursor.execute('''
+            UPDATE orders
+            SET total_amount = ?, updated_at = ?
+            WHERE id = ?
+        ''', (total_amount, now, order_id))
+        
+        return order['menu_id']
     
     def cancel_order(self, order_id, user_id):
         """
@@ -365,61 +470,103 @@ class OrderService:
         Raises:
             ValueError: 各种业务逻辑错误
         """
-        conn = get_db_connection()
+        ledger_ops = []
+        events = []
+        try:
+            menu_id = execute_write(lambda conn: self._cancel_order(
+                conn, order_id, user_id, ledger_ops, events))
+        except Exception:
+            self._revert_ledger(ledger_ops)
+            raise
+        
+        bump(f'stock:{menu_id}')
+        self._publish(events)
+    
+    def _cancel_order(self, conn, order_id, user_id, ledger_ops, events):
+        """取消订单（在写事务内执行）"""
         cursor = conn.cursor()
         
-        try:
-            # 获取订单信息
-            cursor.execute('''
-                SELECT * FROM orders WHERE id = ? AND user_id = ?
-            ''', (order_id, user_id))
-            
-            order = cursor.fetchone()
-            if not order:
-                conn.close()
-                raise ValueError('订单不存在')
-            
-            if order['status'] != config.ORDER_STATUS_PLACED:
-                conn.close()
-                raise ValueError('只能取消已下单状态的订单')
-            
-            # 检查时间限制
-            if not check_time_limit(order['meal_type'], order['order_date']):
-                conn.close()
-                raise ValueError('已超过取消时间')
-            
-            now = get_current_datetime()
-            
-            # 获取订单项并退回库存
-            cursor.execute('SELECT * FROM order_items WHERE order_id = ?', (order_id,))
-            items = cursor.fetchall()
-            
-            for item in items:
-                cursor.execute('''
-                    UPDATE menu_items mi
-                    SET available_quantity = available_quantity + ?, updated_at = ?
-                    WHERE mi.menu_id = ? AND mi.dish_id = ?
-                ''', (item['quantity'], now, order['menu_id'], item['dish_id']))
-            
-            # 更新订单状态
-            cursor.execute('''
-                UPDATE orders
-                SET status = 'cancelled', updated_at = ?
-                WHERE id = ?
-            ''', (now, order_id))
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            raise e
+        # 获取订单信息
+        cursor.execute('''
+            SELECT * FROM orders WHERE id = ? AND user_id = ?
+        ''', (order_id, user_id))
+        
+        order = cursor.fetchone()
+        if not order:
+            raise ValueError('订单不存在')
+        
+        if order['status'] != config.ORDER_STATUS_PLACED:
+            raise ValueError('只能取消已下单状态的订单')
+        
+        # 检查时间限制
+        if not check_time_limit(order['meal_type'], order['order_date']):
+            raise ValueError('已超过取消时间')
+        
+        now = get_current_datetime()
+        
+        # 获取订单项并退回库存
+        cursor.execute('SELECT dish_id, dish_name, quantity FROM order_items WHERE order_id = ?', (order_id,))
+        items = cursor.fetchall()
+        if not self._ledger_exchange(order, items, [], ledger_ops):
+            self.stock_service.release(cursor, order['menu_id'], items)
+        
+        change = self.meal_stats_service.apply_order_change(
+            cursor, order['canteen_id'], order['order_date'], order['meal_type'],
+            [(row['dish_id'], row['dish_name'], row['quantity']) for row in items], [], -1)
+        change['order'] = {'action': 'cancelled', 'order_no': order['order_no']}
+        events.append(change)
+        
+        # 更新订单状态
+        cursor.execute('''
+            UPDATE orders
+            SET status = 'cancelled', updated_at = ?
+            WHERE id = ?
+        ''', (now, order_id))
+        
+        return order['menu_id']
+    
+    def complete_ended_orders(self, now=None):
+        """
+        将已结束餐次的有效订单标记为已完成
+        
+        按 config.MEAL_CLOSE_BATCH_SIZE 分批更新，每批一个短事务。
+        已完成订单仍计入餐次统计，库存和汇总表不变。
+        
+        Args:
+            now (datetime): 以该时刻判断餐次是否结束，默认当前时间
+        
+        Returns:
+            int: 完成的订单数
+        """
+        today, meal_types = ended_meals(now)
+        # 今天之前的餐次全部结束；今天只有已结束的餐次（列表为空时匹配不到今天的订单）
+        placeholders = ','.join('?' * len(meal_types)) or 'NULL'
+        
+        def complete(conn):
+            return conn.execute(f'''
+                UPDATE orders SET status = ?, updated_at = ?
+                WHERE id IN (
+                    SELECT id FROM orders
+                    WHERE status = 'placed' AND order_date <= ?
+                      AND (order_date < ? OR meal_type IN ({placeholders}))
+                    LIMIT ?
+                )
+            ''', [config.ORDER_STATUS_COMPLETED, get_current_datetime(), today, today, *meal_types,
+                  config.MEAL_CLOSE_BATCH_SIZE]).rowcount
+        
+        total = 0
+        while True:
+            completed = execute_write(complete)
+            total += completed
+            if completed < config.MEAL_CLOSE_BATCH_SIZE:
+                return total
     
     def get_meal_statistics(self, canteen_id, order_date, meal_type):
         """
         获取餐次统计
         
+        菜品份数和订单数读取增量维护的汇总表，只有员工名单需要查询订单。
+        
         Args:
             canteen_id (int): 食堂ID
             order_date (str): 日期
@@ -428,47 +575,31 @@ class OrderService:
         Returns:
             dict: 统计信息
         """
+        totals = self.meal_stats_service.get_totals(canteen_id, order_date, meal_type)
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # 按菜品统计
-        cursor.execute('''
-            SELECT oi.dish_name, SUM(oi.quantity) as total_quantity, COUNT(DISTINCT o.id) as order_count
-            FROM orders o
-            LEFT JOIN order_items oi ON o.id = oi.order_id
-            WHERE o.canteen_id = ? AND o.order_date = ? AND o.meal_type = ? 
-              AND o.status IN ('placed', 'completed')
-            GROUP BY oi.dish_id, oi.dish_name
-            ORDER BY total_quantity DESC
-        ''', (canteen_id, order_date, meal_type))
-        
-        dish_stats = cursor.fetchall()
-        
-        # 按员工统计
-        cursor.execute('''
+        # 按员工统计（已归档的餐次合并归档库）
+        query = '''
             SELECT u.employee_id, u.full_name, o.order_no, o.created_at
-            FROM orders o
+            FROM {schema}.orders o
             LEFT JOIN users u ON o.user_id = u.id
-            WHERE o.canteen_id = ? AND o.order_date = ? AND o.meal_type = ? 
-              AND o.status IN ('placed', 'completed')
-            ORDER BY o.created_at
-        ''', (canteen_id, order_date, meal_type))
+        '''
+        where = "o.canteen_id = ? AND o.order_date = ? AND o.meal_type = ? AND o.status IN ('placed', 'completed')"
+        params = [canteen_id, order_date, meal_type]
+        if archive.reaches(order_date):
+            cursor.execute(archive.union_query(query, where, 'o.created_at'), params + params)
+        else:
+            cursor.execute(f"{query.format(schema='main')} WHERE {where} ORDER BY o.created_at", params)
         
         user_stats = cursor.fetchall()
-        
-        # 总订单数
-        cursor.execute('''
-            SELECT COUNT(*) as total_orders
-            FROM orders
-            WHERE canteen_id = ? AND order_date = ? AND meal_type = ? 
-              AND status IN ('placed', 'completed')
-        ''', (canteen_id, order_date, meal_type))
-        
-        total = cursor.fetchone()
         conn.close()
         
         return {
-            'dish_statistics': list_from_rows(dish_stats),
+            'dish_statistics': totals['dish_statistics'],
             'user_statistics': list_from_rows(user_stats),
-            'total_orders': total['total_orders']
+            'total_orders': totals['total_orders'],
+            'total_quantity': totals['total_quantity'],
+            'version': totals['version']
         }
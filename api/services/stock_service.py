@@ -0,0 +1,132 @@
+# 库存预占服务
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.helpers import get_current_datetime
+
+
+class StockService:
+    """
+    库存预占服务类
+
+    所有方法都在调用方的写事务（BEGIN IMMEDIATE）内执行，
+    一次订单无论包含多少菜品，只需固定次数的SQL往返。
+    """
+
+    def merge_items(self, items):
+        """
+        合并订单项中重复的菜品
+
+        Args:
+            items (list): 订单项列表 [{'dish_id': 1, 'quantity': 2}, ...]
+
+        Returns:
+            dict: 菜品ID -> 总数量（保持首次出现的顺序）
+
+        Raises:
+            ValueError: 当数量无效时
+        """
+        quantities = {}
+        for item in items:
+            dish_id = int(item['dish_id'])
+            quantity = item['quantity']
+            if not isinstance(quantity, int) or quantity <= 0:
+                raise ValueError(f'菜品ID {dish_id} 的数量必须为正整数')
+            quantities[dish_id] = quantities.get(dish_id, 0) + quantity
+        return quantities
+
+    def get_menu_dishes(self, cursor, menu_id, dish_ids):
+        """
+        一次查询获取菜单中多个菜品的名称、价格和可用库存
+
+        Args:
+            cursor: 数据库游标
+            menu_id (int): 菜单ID
+            dish_ids (list): 菜品ID列表
+
+        Returns:
+            dict: 菜品ID -> sqlite3.Row(menu_item_id, dish_id, available_quantity, name, price)
+        """
+        placeholders = ','.join('?' * len(dish_ids))
+        cursor.execute(f'''
+            SELECT mi.id as menu_item_id, mi.dish_id, mi.available_quantity, d.name, d.price
+            FROM menu_items mi
+            LEFT JOIN dishes d ON mi.dish_id = d.id
+            WHERE mi.menu_id = ? AND mi.dish_id IN ({placeholders})
+        ''', [menu_id] + list(dish_ids))
+
+        return {row['dish_id']: row for row in cursor.fetchall()}
+
+    def reserve(self, cursor, menu_id, items):
+        """
+        预占库存：一条带条件的批量UPDATE扣减所有菜品
+
+        Args:
+            cursor: 数据库游标
+            menu_id (int): 菜单ID
+            items (list): 订单项列表
+
+        Returns:
+            dict: 菜品ID -> 菜品信息（同get_menu_dishes）
+
+        Raises:
+            ValueError: 菜品不在菜单中或库存不足
+        """
+        quantities = self.merge_items(items)
+        dishes = self.get_menu_dishes(cursor, menu_id, list(quantities))
+
+        for dish_id, quantity in quantities.items():
+            dish = dishes.get(dish_id)
+            if not dish:
+                raise ValueError(f'菜品ID {dish_id} 不在菜单中')
+            if dish['available_quantity'] < quantity:
+                raise ValueError(f'菜品 {dish["name"]} 库存不足')
+
+        case_sql, case_params = self._quantity_case(quantities)
+        placeholders = ','.join('?' * len(quantities))
+        cursor.execute(f'''
+            UPDATE menu_items
+            SET available_quantity = available_quantity - {case_sql}, updated_at = ?
+            WHERE menu_id = ? AND dish_id IN ({placeholders})
+              AND available_quantity >= {case_sql}
+        ''', case_params + [get_current_datetime(), menu_id] + list(quantities) + case_params)
+
+        # 条件扣减：任何一行不满足库存条件，受影响行数就会少于菜品数
+        if cursor.rowcount != len(quantities):
+            raise ValueError('菜品库存不足')
+
+        return dishes
+
+    def release(self, cursor, menu_id, items):
+        """
+        退回库存：一条批量UPDATE加回所有菜品
+
+        Args:
+            cursor: 数据库游标
+            menu_id (int): 菜单ID
+            items (list): 订单项列表（可以是order_items行）
+        """
+        quantities = {}
+        for item in items:
+            quantities[item['dish_id']] = quantities.get(item['dish_id'], 0) + item['quantity']
+
+        if not quantities:
+            return
+
+        case_sql, case_params = self._quantity_case(quantities)
+        placeholders = ','.join('?' * len(quantities))
+        cursor.execute(f'''
+            UPDATE menu_items
+            SET available_quantity = available_quantity + {case_sql}, updated_at = ?
+            WHERE menu_id = ? AND dish_id IN ({placeholders})
+        ''', case_params + [get_current_datetime(), menu_id] + list(quantities))
+
+    def _quantity_case(self, quantities):
+        """生成 CASE dish_id WHEN ? THEN ? ... END 表达式"""
+        sql = 'CASE dish_id' + ' WHEN ? THEN ?' * len(quantities) + ' END'
+        params = []
+        for dish_id, quantity in quantities.items():
+            params.extend([dish_id, quantity])
+        return sql, params
@@ -0,0 +1,137 @@
+# 订单号生成器压测：单线程、多线程、多进程下的生成速度，并检查是否重复、是否递增
+#
+# 用法（在api目录下）：
+#     python tools/bench_order_no.py                          # 默认：每组100万个
+#     python tools/bench_order_no.py --count 2000000 --threads 8 --processes 8
+#
+# 多进程测试中每个进程使用不同的节点号（与server.py分配方式相同）。
+# 出现重复订单号或进程内不递增时返回码为1。
+
+import argparse
+import os
+import sys
+import threading
+import time
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.order_no import OrderNoGenerator, format_order_no
+
+
+def single_thread(count):
+    """
+    单线程生成
+
+    Returns:
+        tuple: (耗时秒数, ID列表)
+    """
+    generator = OrderNoGenerator(node=0)
+    next_id = generator.next_id
+    start = time.perf_counter()
+    ids = [next_id() for _ in range(count)]
+    return time.perf_counter() - start, ids, generator
+
+
+def multi_thread(count, threads):
+    """
+    多线程共用一个生成器
+
+    Returns:
+        tuple: (耗时秒数, 各线程的ID列表)
+    """
+    generator = OrderNoGenerator(node=0)
+    per_thread = count // threads
+    results = [None] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def run(index):
+        next_id = generator.next_id
+        barrier.wait()
+        results[index] = [next_id() for _ in range(per_thread)]
+
+    workers = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, results, generator
+
+
+def _process_worker(node, count, queue):
+    generator = OrderNoGenerator(node=node)
+    next_id = generator.next_id
+    start = time.perf_counter()
+    ids = [next_id() for _ in range(count)]
+    queue.put((node, time.perf_counter() - start, ids))
+
+
+def multi_process(count, processes):
+    """
+    多进程各用一个节点号生成
+
+    Returns:
+        tuple: (各进程耗时的最大值, 各进程的ID列表)
+    """
+    context = get_context('fork')
+    queue = context.Queue()
+    per_process = count // processes
+    workers = [context.Process(target=_process_worker, args=(node, per_process, queue))
+               for node in range(processes)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return max(elapsed for _, elapsed, _ in results), [ids for _, _, ids in results]
+
+
+def is_increasing(ids):
+    return all(a < b for a, b in zip(ids, ids[1:]))
+
+
+def report(name, elapsed, batches, generator=None):
+    """
+    输出一组结果
+
+    Returns:
+        bool: 是否无重复（且每个批次内递增）
+    """
+    total = sum(len(ids) for ids in batches)
+    unique = len(set().union(*batches))
+    increasing = all(is_increasing(ids) for ids in batches)
+    line = (f'{name:<12} {total:>10,} 个  {elapsed:7.3f} 秒  {total / elapsed / 1e6:6.2f} 百万/秒  '
+            f'重复 {total - unique}  递增 {"是" if increasing else "否"}')
+    if generator is not None:
+        line += f'  时钟回拨 {generator.clock_backwards}'
+    print(line)
+    return unique == total and increasing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='订单号生成器压测')
+    parser.add_argument('--count', type=int, default=1000000, help='每组生成的订单号总数')
+    parser.add_argument('--threads', type=int, default=8, help='多线程测试的线程数')
+    parser.add_argument('--processes', type=int, default=min(8, os.cpu_count() or 1), help='多进程测试的进程数')
+    args = parser.parse_args()
+
+    ok = True
+    elapsed, ids, generator = single_thread(args.count)
+    ok &= report('单线程', elapsed, [ids], generator)
+    print(f'{"":<12} 示例: {format_order_no(ids[0])} ... {format_order_no(ids[-1])}')
+
+    elapsed, batches, generator = multi_thread(args.count, args.threads)
+    # 多线程时每个线程内的ID也必须递增（生成器整体单调）
+    ok &= report(f'{args.threads}线程', elapsed, batches, generator)
+
+    elapsed, batches = multi_process(args.count, args.processes)
+    ok &= report(f'{args.processes}进程', elapsed, batches)
+
+    print('结果: ' + ('无重复' if ok else '存在重复或不递增'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+# 查询计划检查：在大数据量的临时库上执行服务层的全部查询，发现全表扫描即失败
+#
+# 用法（在api目录下）：
+#     python tools/check_query_plans.py
+#
+# 返回码为0表示所有查询都命中了索引，可在提交涉及SQL或索引的改动前运行。
+#
+# 每条语句检查两次：按写入数据后ANALYZE的统计信息，以及清空统计信息后只凭索引结构
+# 选择的查询计划。已部署的数据库不会定期ANALYZE，热点查询不能依赖统计信息才避开全表扫描
+# （如按日期范围查询菜单，有统计信息时走唯一约束的跳跃扫描，没有时扫描整个菜单表）。
+
+import os
+import re
+import secrets
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from utils import storage
+from utils.migrations import migrate
+
+# 数据量很小的基础表，全表扫描可以接受
+SMALL_TABLES = {'canteens', 'dish_categories', 'departments', 'dishes', 'canteen_staff_relations'}
+
+SEED_USERS = 5000
+SEED_DAYS = 120
+SEED_DISHES_PER_CANTEEN = 40
+SEED_ITEMS_PER_MENU = 15
+SEED_ORDERS = 100000
+
+
+def create_database(db_path):
+    """根据init-db.sql建库并执行迁移"""
+    sql_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                            'init-db.sql')
+    conn = sqlite3.connect(db_path)
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        conn.executescript(f.read())
+    conn.close()
+    migrate(db_path)
+
+
+def seed_database(db_path):
+    """
+    写入大量测试数据
+
+    Returns:
+        dict: 工作负载需要的ID（用户、菜单、菜品等）
+    """
+    conn = sqlite3.connect(db_path)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    today = datetime.now().date()
+
+    canteen_ids = [row[0] for row in conn.execute('SELECT id FROM canteens')]
+    category_ids = [row[0] for row in conn.execute('SELECT id FROM dish_categories')]
+
+    conn.executemany('''
+        INSERT INTO users (employee_id, password, full_name, role, is_active, created_at, updated_at)
+        VALUES (?, '', ?, 'employee', 1, ?, ?)
+    ''', [(f'LOAD{i:06d}', f'用户{i}', now, now) for i in range(SEED_USERS)])
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'employee'")]
+
+    dishes = {}
+    for canteen_id in canteen_ids:
+        conn.executemany('''
+            INSERT INTO dishes (name, category_id, price, status, canteen_id, created_at, updated_at)
+            VALUES (?, ?, 10, 'active', ?, ?, ?)
+        ''', [(f'菜品{canteen_id}-{i}', category_ids[i % len(category_ids)], canteen_id, now, now)
+              for i in range(SEED_DISHES_PER_CANTEEN)])
+        dishes[canteen_id] = [row[0] for row in conn.execute(
+            'SELECT id FROM dishes WHERE canteen_id = ?', (canteen_id,))]
+
+    menus = []
+    for offset in range(-SEED_DAYS, 7):
+        menu_date = (today + timedelta(days=offset)).strftime('%Y-%m-%d')
+        for canteen_id in canteen_ids:
+            for meal_type in config.MEAL_TIME_LIMITS:
+                menus.append((canteen_id, menu_date, meal_type, now, now))
+    conn.executemany('''
+        INSERT OR IGNORE INTO menus (canteen_id, menu_date, meal_type, status, created_at, updated_at)
+        VALUES (?, ?, ?, 'active', ?, ?)
+    ''', menus)
+
+    menu_rows = conn.execute('SELECT id, canteen_id, menu_date, meal_type FROM menus').fetchall()
+    items = []
+    for menu_id, canteen_id, _, _ in menu_rows:
+        for dish_id in dishes[canteen_id][:SEED_ITEMS_PER_MENU]:
+            items.append((menu_id, dish_id, 1000, 1000, now, now))
+    conn.executemany('''
+        INSERT OR IGNORE INTO menu_items (menu_id, dish_id, quantity, available_quantity, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', items)
+
+    orders = []
+    for i in range(SEED_ORDERS):
+        menu_id, canteen_id, menu_date, meal_type = menu_rows[i % len(menu_rows)]
+        status = ('completed', 'cancelled', 'placed')[i % 3]
+        orders.append((f'SEED{i:010d}', user_ids[i % len(user_ids)], canteen_id, menu_id,
+                       meal_type, menu_date, status, now, now))
+    conn.executemany('''
+        INSERT INTO orders (order_no, user_id, canteen_id, menu_id, meal_type, order_date,
+                            status, total_amount, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 10, ?, ?)
+    ''', orders)
+    conn.execute('''
+        INSERT INTO order_items (order_id, dish_id, dish_name, dish_price, quantity, subtotal, created_at)
+        SELECT o.id, mi.dish_id, '菜品', 10, 1, 10, o.created_at
+        FROM orders o JOIN menu_items mi ON mi.menu_id = o.menu_id
+        WHERE o.order_no LIKE 'SEED%' AND mi.dish_id % 5 = 0
+    ''')
+    conn.execute('ANALYZE')
+    conn.commit()
+
+    tomorrow = (today + timedelta(days=1)).strftime('%Y-%m-%d')
+    future_menu = conn.execute(
+        "SELECT id, canteen_id FROM menus WHERE menu_date = ? AND meal_type = 'lunch'", (tomorrow,)
+    ).fetchone()
+    future_dishes = [row[0] for row in conn.execute(
+        'SELECT dish_id FROM menu_items WHERE menu_id = ? LIMIT 2', (future_menu[0],))]
+    # 选一个明天午餐还没有订单的用户下单，避免触发重复下单检查
+    fresh_user = conn.execute('''
+        SELECT id FROM users WHERE role = 'employee' AND id NOT IN (
+            SELECT user_id FROM orders WHERE order_date = ? AND meal_type = 'lunch')
+        LIMIT 1
+    ''', (tomorrow,)).fetchone()[0]
+    menu_item_id = conn.execute('SELECT id FROM menu_items WHERE menu_id = ? LIMIT 1',
+                                (future_menu[0],)).fetchone()[0]
+    conn.close()
+
+    return {
+        'today': today.strftime('%Y-%m-%d'),
+        'tomorrow': tomorrow,
+        'canteen_id': future_menu[1],
+        'menu_id': future_menu[0],
+        'dish_ids': future_dishes,
+        'menu_item_id': menu_item_id,
+        'user_id': fresh_user,
+        'busy_user_id': user_ids[0],
+        'today_menu_ids': [row[0] for row in menu_rows if row[2] == today.strftime('%Y-%m-%d')],
+    }
+
+
+def run_workload(ids):
+    """通过服务层执行有代表性的读写操作"""
+    from services.auth_service import AuthService
+    from services.canteen_service import CanteenService
+    from services.dish_service import DishService
+    from services.export_service import ExportService
+    from services.menu_service import MenuService
+    from services.order_service import OrderService
+    from utils.auth_token import issue_token, verify_token, revoke_token, revoke_user_tokens
+    from utils.helpers import get_user_role
+    from utils import idempotency
+    from utils.stock_ledger import StockLedger
+    from utils.scheduler import Scheduler
+    from utils import archive
+
+    auth_service = AuthService()
+    canteen_service = CanteenService()
+    dish_service = DishService()
+    menu_service = MenuService()
+    order_service = OrderService()
+
+    auth_service.login('ADMIN001', 'admin123')
+    auth_service.get_user_info(ids['user_id'])
+    get_user_role(ids['user_id'])
+    revoke_token(verify_token(issue_token(ids['user_id'], 'employee')[0]))
+    revoke_user_tokens(ids['user_id'])
+    verify_token(issue_token(ids['user_id'], 'employee')[0])
+    idempotency._store((ids['user_id'], 'plan-check'), ('hash', 200, '{}'))
+    idempotency._cache.clear()
+    idempotency._lookup((ids['user_id'], 'plan-check'))
+    idempotency.Sweeper(batch_size=10).sweep()
+    canteen_service.get_canteen_list('active')
+    canteen_service.get_canteen_by_id(ids['canteen_id'])
+    canteen_service.get_staff_canteens(2)
+
+    dish_service.get_dish_list(canteen_id=ids['canteen_id'], status='active')
+    dish_service.get_dish_by_id(ids['dish_ids'][0])
+    dish_service.get_categories()
+    dish_id = dish_service.create_dish('临时菜品', 1, ids['canteen_id'])
+    dish_service.update_dish_status(dish_id, 'inactive')
+    dish_service.delete_dish(dish_id)
+
+    menu_service.get_menu_list(ids['canteen_id'], ids['tomorrow'], 'lunch')
+    menu_service.get_menu_list(menu_date=ids['tomorrow'])
+    menu_service.get_menu_by_id(ids['menu_id'])
+    menu_service.get_calendar(ids['busy_user_id'], ids['today'], 7)
+    menu_service.get_calendar(ids['busy_user_id'], ids['today'], 7, ids['canteen_id'])
+    menu_service.update_menu_item_quantity(ids['menu_item_id'], 2000)
+    menu_service.bulk_upsert_menus([
+        {'canteen_id': ids['canteen_id'], 'menu_date': ids['tomorrow'], 'meal_type': 'dinner',
+         'items': [{'dish_id': dish_id, 'quantity': 500} for dish_id in ids['dish_ids']]},
+    ])
+    next_week = (datetime.strptime(ids['tomorrow'], '%Y-%m-%d') + timedelta(days=30)).strftime('%Y-%m-%d')
+    menu_service.clone_menus(ids['today'], ids['tomorrow'], next_week, ids['canteen_id'])
+    menu_service.update_stock(ids['menu_item_id'], -1)
+
+    items = [{'dish_id': dish_id, 'quantity': 1} for dish_id in ids['dish_ids']]
+    order_id = order_service.create_order(ids['user_id'], ids['canteen_id'], ids['menu_id'],
+                                          'lunch', ids['tomorrow'], items)
+    order_service.get_order_by_id(order_id)
+    page = order_service.get_user_orders(ids['busy_user_id'], limit=5, with_total=True)
+    order_service.get_user_orders(ids['busy_user_id'], limit=5, cursor=page['next_cursor'])
+    order_service.get_user_orders(ids['busy_user_id'], 'placed')
+    order_service.get_canteen_orders(ids['canteen_id'], ids['today'], 'lunch', 'placed')
+    page = order_service.get_canteen_orders(ids['canteen_id'], with_total=True)
+    order_service.get_canteen_orders(ids['canteen_id'], cursor=page['next_cursor'])
+    order_service.get_canteen_orders(ids['canteen_id'], status='placed', start_date=ids['today'],
+                                     end_date=ids['tomorrow'])
+    order_service.get_meal_statistics(ids['canteen_id'], ids['today'], 'lunch')
+    order_service.update_order(order_id, ids['user_id'], items[:1])
+    order_service.cancel_order(order_id, ids['user_id'])
+
+    export_service = ExportService()
+    for _ in export_service.iter_order_items(ids['canteen_id'], ids['today'], ids['tomorrow'], 'placed'):
+        pass
+    for _ in export_service.iter_meal_statistics(ids['canteen_id'], ids['today'], ids['tomorrow']):
+        pass
+
+    ledger = StockLedger()
+    ledger.load_menus(ids['today_menu_ids'])
+    ledger.recover()
+
+    # 餐次结束任务放在最后，避免改变上面查询所见的数据
+    order_service.complete_ended_orders()
+    menu_service.close_ended_menus()
+    scheduler = Scheduler()
+    scheduler.register('noop', lambda: None, lambda now: now)
+    scheduler.run_job('noop')
+    scheduler.history()
+    scheduler.history('noop')
+
+    # 归档旧订单后，查询范围涉及归档库的历史查询
+    archive.init_archive()
+    config.ARCHIVE_RETENTION_DAYS = SEED_DAYS // 2
+    archive.archive_orders()
+    old_date = (datetime.strptime(ids['today'], '%Y-%m-%d') - timedelta(days=SEED_DAYS - 10)).strftime('%Y-%m-%d')
+    archived_id = conn_value('SELECT MIN(id) FROM archive.orders')
+    order_service.get_order_by_id(archived_id)
+    page = order_service.get_user_orders(ids['busy_user_id'], limit=2, with_total=True)
+    while page['next_cursor']:
+        page = order_service.get_user_orders(ids['busy_user_id'], limit=20, cursor=page['next_cursor'])
+    page = order_service.get_canteen_orders(ids['canteen_id'], start_date=old_date, with_total=True)
+    order_service.get_canteen_orders(ids['canteen_id'], start_date=old_date, cursor=page['next_cursor'])
+    order_service.get_canteen_orders(ids['canteen_id'], old_date, 'lunch', with_total=True)
+    order_service.get_meal_statistics(ids['canteen_id'], old_date, 'lunch')
+    for _ in export_service.iter_order_items(ids['canteen_id'], old_date, ids['today']):
+        pass
+
+
+def conn_value(sql):
+    """在新连接上查询单个值"""
+    conn = storage.open_connection()
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def table_aliases(sql):
+    """解析语句中的表别名：别名 -> 表名"""
+    aliases = {}
+    for table, alias in re.findall(r'(?:FROM|JOIN|UPDATE|INTO)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?',
+                                   sql, re.I):
+        aliases[table] = table
+        if alias and alias.upper() not in ('WHERE', 'SET', 'ON', 'LEFT', 'JOIN', 'INNER', 'GROUP',
+                                          'ORDER', 'VALUES', 'USING', 'LIMIT'):
+            aliases[alias] = table
+    return aliases
+
+
+def clear_stats(db_path):
+    """清空统计信息（sqlite_stat1），之后打开的连接只凭索引结构选择查询计划"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('DELETE FROM sqlite_stat1')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def check_statements(db_path, statements):
+    """
+    检查全部读写语句的查询计划
+
+    Returns:
+        tuple: (检查的语句数, [(语句, 全表扫描描述)])
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute('ATTACH DATABASE ? AS archive', (config.ARCHIVE_DB_PATH,))
+    checked = set()
+    failures = []
+    for sql in statements:
+        keyword = sql.lstrip().split(None, 1)[0].upper()
+        if keyword not in ('SELECT', 'UPDATE', 'DELETE', 'WITH') or sql in checked:
+            continue
+        checked.add(sql)
+        problems = check_statement(conn, sql)
+        if problems:
+            failures.append((sql, problems))
+    conn.close()
+    return len(checked), failures
+
+
+def check_statement(conn, sql):
+    """
+    检查单条语句的查询计划
+
+    Returns:
+        list: 发现的全表扫描描述
+    """
+    aliases = table_aliases(sql)
+    problems = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+        detail = row[3]
+        match = re.match(r'SCAN (\w+)', detail)
+        if not match or match.group(1) == 'CONSTANT':
+            continue
+        table = aliases.get(match.group(1), match.group(1))
+        if table not in SMALL_TABLES:
+            problems.append(detail)
+    return problems
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, 'plan_check.db')
+    try:
+        print('创建测试数据库...')
+        create_database(db_path)
+        ids = seed_database(db_path)
+        config.DB_PATH = db_path
+        config.ARCHIVE_DB_PATH = os.path.join(tmp_dir, 'plan_check_archive.db')
+        config.STOCK_LEDGER_ENABLED = False
+        # 临时数据库：未设置令牌密钥时使用本次运行的随机密钥
+        for key_id, secret in config.TOKEN_SECRET_KEYS.items():
+            config.TOKEN_SECRET_KEYS[key_id] = secret or secrets.token_urlsafe(32)
+
+        statements = []
+        open_connection = storage.open_connection
+
+        def traced_connection(*args, **kwargs):
+            conn = open_connection(*args, **kwargs)
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        # 记录服务层在所有连接（含写线程）上执行的语句，参数已展开为字面值
+        storage.open_connection = traced_connection
+        try:
+            run_workload(ids)
+        finally:
+            storage.open_connection = open_connection
+
+        checked, failures = check_statements(db_path, statements)
+        clear_stats(db_path)
+        _, unanalyzed_failures = check_statements(db_path, statements)
+        failures += [(sql, [f'{detail}（无统计信息）' for detail in problems])
+                     for sql, problems in unanalyzed_failures]
+
+        print(f'共检查 {checked} 条语句')
+        for sql, problems in failures:
+            print('-' * 60)
+            print(' '.join(sql.split()))
+            for detail in problems:
+                print(f'  !! {detail}')
+
+        if failures:
+            print(f'发现 {len(failures)} 条语句存在全表扫描')
+            return 1
+        print('未发现全表扫描')
+        return 0
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,411 @@
+# 点餐截止前的并发压测：在临时库上模拟大量员工集中浏览、下单、修改、取消，
+# 输出延迟分位数、吞吐量、锁错误和超卖检查结果（JSON）
+#
+# 用法（在api目录下）：
+#     python tools/loadtest.py                              # 500名员工，进程内调用
+#     python tools/loadtest.py --mode http                  # 在本机端口上启动服务，经HTTP调用
+#     python tools/loadtest.py --users 1000 --stock 80 --output baseline.json
+#     python tools/loadtest.py --cutoff-after 20            # 20秒后到达截止时间（按分钟取整）
+#
+# 同一 --seed 下每个虚拟用户的操作序列相同，可用于对比性能改动前后的结果。
+# 存在超卖、库存不一致、重复订单或统计汇总偏差时返回码为1。
+
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import secrets
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+LOAD_PASSWORD = 'load123'
+SLO_MS = 500  # 质量规范：API响应时间 < 500毫秒
+
+
+def create_database(db_path, args):
+    """
+    根据init-db.sql建库，写入压测员工和当日餐次菜单
+
+    Returns:
+        dict: 压测需要的数据（员工工号、菜单ID、菜品ID等）
+    """
+    from utils.helpers import hash_password
+    from utils.migrations import migrate
+
+    sql_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                            'init-db.sql')
+    conn = sqlite3.connect(db_path)
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        conn.executescript(f.read())
+
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    today = datetime.now().strftime('%Y-%m-%d')
+    password = hash_password(LOAD_PASSWORD)
+    employee_ids = [f'LOAD{i:06d}' for i in range(args.users)]
+    conn.executemany('''
+        INSERT INTO users (employee_id, password, full_name, role, is_active, created_at, updated_at)
+        VALUES (?, ?, ?, 'employee', 1, ?, ?)
+    ''', [(employee_id, password, f'压测{employee_id[4:]}', now, now) for employee_id in employee_ids])
+
+    canteen_id = conn.execute("SELECT id FROM canteens WHERE status = 'active' ORDER BY id LIMIT 1").fetchone()[0]
+    dish_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM dishes WHERE canteen_id = ? AND status = 'active' ORDER BY id LIMIT ?",
+        (canteen_id, args.dishes))]
+
+    # 当日该餐次的菜单：每个菜品库存相同，总需求超过库存时考验防超卖
+    conn.execute('''
+        INSERT INTO menus (canteen_id, menu_date, meal_type, status, created_at, updated_at)
+        VALUES (?, ?, ?, 'active', ?, ?)
+        ON CONFLICT (canteen_id, menu_date, meal_type) DO NOTHING
+    ''', (canteen_id, today, args.meal, now, now))
+    menu_id = conn.execute('SELECT id FROM menus WHERE canteen_id = ? AND menu_date = ? AND meal_type = ?',
+                           (canteen_id, today, args.meal)).fetchone()[0]
+    conn.execute('DELETE FROM menu_items WHERE menu_id = ?', (menu_id,))
+    conn.executemany('''
+        INSERT INTO menu_items (menu_id, dish_id, quantity, available_quantity, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(menu_id, dish_id, args.stock, args.stock, now, now) for dish_id in dish_ids])
+    conn.commit()
+    conn.close()
+    migrate(db_path)
+
+    return {
+        'employee_ids': employee_ids,
+        'canteen_id': canteen_id,
+        'menu_id': menu_id,
+        'dish_ids': dish_ids,
+        'order_date': today,
+    }
+
+
+def set_cutoff(args):
+    """
+    把压测餐次的截止时间设置为当前时间之后
+
+    Returns:
+        str: 截止时间 (HH:MM)
+    """
+    seconds = args.cutoff_after if args.cutoff_after is not None else 3600
+    cutoff = datetime.now() + timedelta(seconds=seconds)
+    # 截止时间精确到分钟，向上取整
+    if cutoff.second or cutoff.microsecond:
+        cutoff = cutoff.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    if cutoff.date() != datetime.now().date():
+        raise SystemExit('截止时间跨过了午夜，请稍后再运行或减小 --cutoff-after')
+    config.MEAL_TIME_LIMITS[args.meal] = cutoff.strftime('%H:%M')
+    return config.MEAL_TIME_LIMITS[args.meal]
+
+
+class InProcessClient:
+    """通过Flask测试客户端在进程内调用API"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self._client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """经本机HTTP调用API（每个虚拟用户一个连接）"""
+
+    def __init__(self, host, port):
+        self._conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        payload = json.dumps(body) if body is not None else None
+        try:
+            self._conn.request(method, path, body=payload, headers=headers)
+            response = self._conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            raise
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+
+
+class Recorder:
+    """线程安全地记录每次请求的耗时和结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # 操作 -> [耗时ms]
+        self.outcomes = {}  # 操作 -> {结果: 次数}
+        self.lock_errors = 0
+        self.http_errors = 0
+
+    def call(self, client, op, method, path, token=None, body=None):
+        """
+        执行一次请求并记录
+
+        Returns:
+            dict: 响应JSON，请求失败时为None
+        """
+        start = time.perf_counter()
+        try:
+            status, data = client.request(method, path, token, body)
+        except (OSError, http.client.HTTPException) as e:
+            status, data = None, {'code': None, 'message': str(e)}
+        elapsed = (time.perf_counter() - start) * 1000
+
+        code = data.get('code') if isinstance(data, dict) else None
+        message = (data or {}).get('message') or ''
+        with self._lock:
+            self.samples.setdefault(op, []).append(elapsed)
+            outcome = self.outcomes.setdefault(op, {})
+            key = str(code) if status == 200 else f'http_{status}'
+            outcome[key] = outcome.get(key, 0) + 1
+            if status != 200:
+                self.http_errors += 1
+            if 'locked' in message or 'busy' in message:
+                self.lock_errors += 1
+        return data if status == 200 else None
+
+
+def login(client, recorder, employee_id):
+    """
+    虚拟用户登录
+
+    Returns:
+        str: 令牌，登录失败时为None
+    """
+    data = recorder.call(client, 'login', 'POST', '/api/auth/login',
+                         body={'employee_id': employee_id, 'password': LOAD_PASSWORD})
+    return data['data']['token'] if data and data.get('code') == 0 else None
+
+
+def run_user(client, recorder, rng, token, ids, args):
+    """一个虚拟用户：在截止前浏览菜单并下单，部分用户随后修改或取消"""
+    if not token:
+        return
+
+    menu_query = f"menu_date={ids['order_date']}&meal_type={args.meal}&canteen_id={ids['canteen_id']}"
+    for _ in range(args.rounds):
+        time.sleep(rng.uniform(0, args.think_time))
+        recorder.call(client, 'calendar', 'GET', '/api/calendar?days=7', token)
+        recorder.call(client, 'menu_list', 'GET', f'/api/menus?{menu_query}', token)
+        recorder.call(client, 'menu_detail', 'GET', f"/api/menus/{ids['menu_id']}", token)
+
+        items = [{'dish_id': dish_id, 'quantity': rng.randint(1, 2)}
+                 for dish_id in rng.sample(ids['dish_ids'], rng.randint(1, min(3, len(ids['dish_ids']))))]
+        data = recorder.call(client, 'create_order', 'POST', '/api/orders', token, {
+            'canteen_id': ids['canteen_id'],
+            'menu_id': ids['menu_id'],
+            'meal_type': args.meal,
+            'order_date': ids['order_date'],
+            'items': items
+        })
+        order_id = data['data']['order_id'] if data and data.get('code') == 0 else None
+
+        if order_id and rng.random() < args.update_ratio:
+            time.sleep(rng.uniform(0, args.think_time))
+            items = [{'dish_id': rng.choice(ids['dish_ids']), 'quantity': rng.randint(1, 3)}]
+            recorder.call(client, 'update_order', 'PUT', f'/api/orders/{order_id}', token, {'items': items})
+
+        if order_id and rng.random() < args.cancel_ratio:
+            time.sleep(rng.uniform(0, args.think_time))
+            recorder.call(client, 'cancel_order', 'POST', f'/api/orders/{order_id}/cancel', token)
+
+        recorder.call(client, 'my_orders', 'GET', '/api/orders/my?limit=20', token)
+
+
+def percentile(sorted_values, p):
+    """最近秩法分位数"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return round(sorted_values[index], 2)
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 2) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': round(values[-1], 2) if values else None,
+    }
+
+
+def check_consistency(ids, args):
+    """
+    压测结束后核对库存与订单
+
+    Returns:
+        dict: 超卖、库存不一致、重复订单和统计汇总偏差
+    """
+    from utils import stock_ledger
+    from utils.storage import execute_write
+    from services.meal_stats_service import MealStatsService
+
+    # 账本中的库存先写回数据库
+    ledger = stock_ledger.get_ledger()
+    if ledger:
+        ledger.flush()
+
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    items = conn.execute('''
+        SELECT mi.dish_id, mi.quantity, mi.available_quantity,
+               COALESCE((SELECT SUM(oi.quantity) FROM order_items oi
+                         JOIN orders o ON o.id = oi.order_id
+                         WHERE o.menu_id = mi.menu_id AND oi.dish_id = mi.dish_id
+                           AND o.status IN ('placed', 'completed')), 0) as ordered
+        FROM menu_items mi
+        WHERE mi.menu_id = ?
+    ''', (ids['menu_id'],)).fetchall()
+    duplicates = conn.execute('''
+        SELECT COUNT(*) FROM (
+            SELECT user_id FROM orders
+            WHERE order_date = ? AND meal_type = ? AND status IN ('placed', 'completed')
+            GROUP BY user_id HAVING COUNT(*) > 1
+        )
+    ''', (ids['order_date'], args.meal)).fetchone()[0]
+    active_orders = conn.execute('''
+        SELECT COUNT(*) FROM orders WHERE menu_id = ? AND status IN ('placed', 'completed')
+    ''', (ids['menu_id'],)).fetchone()[0]
+    conn.close()
+
+    drift = execute_write(lambda conn: MealStatsService().check_drift(conn, ids['order_date']))
+
+    return {
+        'active_orders': active_orders,
+        'sold': sum(item['ordered'] for item in items),
+        'stock': sum(item['quantity'] for item in items),
+        'oversold': [item['dish_id'] for item in items if item['ordered'] > item['quantity']],
+        'stock_mismatch': [item['dish_id'] for item in items
+                           if item['quantity'] - item['available_quantity'] != item['ordered']],
+        'duplicate_orders': duplicates,
+        'meal_stats_drift': len(drift),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='点餐截止前的并发压测')
+    parser.add_argument('--users', type=int, default=500, help='员工数（每人一个虚拟用户）')
+    parser.add_argument('--concurrency', type=int, help='同时运行的虚拟用户数，默认等于员工数')
+    parser.add_argument('--mode', choices=('inprocess', 'http'), default='inprocess',
+                        help='inprocess: 测试客户端直接调用；http: 在本机端口启动服务后经HTTP调用')
+    parser.add_argument('--meal', choices=list(config.MEAL_TIME_LIMITS), default='lunch', help='压测餐次')
+    parser.add_argument('--dishes', type=int, default=6, help='菜单中的菜品数')
+    parser.add_argument('--stock', type=int, default=100, help='每个菜品的库存')
+    parser.add_argument('--rounds', type=int, default=1, help='每个虚拟用户重复的次数')
+    parser.add_argument('--think-time', type=float, default=0.5, help='操作间隔的最大随机等待（秒）')
+    parser.add_argument('--update-ratio', type=float, default=0.3, help='下单后修改订单的比例')
+    parser.add_argument('--cancel-ratio', type=float, default=0.15, help='下单后取消订单的比例')
+    parser.add_argument('--cutoff-after', type=int, help='距截止时间的秒数，默认在压测结束之后')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--output', help='结果JSON写入该文件，默认输出到标准输出')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config.DB_PATH = os.path.join(tmp_dir, 'loadtest.db')
+        # 临时数据库上的压测：未设置密钥时使用本次运行的随机密钥
+        for key_id, secret in config.TOKEN_SECRET_KEYS.items():
+            config.TOKEN_SECRET_KEYS[key_id] = secret or secrets.token_urlsafe(32)
+        ids = create_database(config.DB_PATH, args)
+        cutoff = set_cutoff(args)
+
+        # 数据库准备好后再启动应用的后台服务（会恢复当日菜单的库存账本）
+        from app import app, init_services
+        init_services()
+
+        server = None
+        if args.mode == 'http':
+            from werkzeug.serving import make_server
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)  # 不输出每个请求的访问日志
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            make_client = lambda: HttpClient('127.0.0.1', server.server_port)
+        else:
+            make_client = lambda: InProcessClient(app)
+
+        recorder = Recorder()
+        concurrency = args.concurrency or args.users
+        clients = [make_client() for _ in ids['employee_ids']]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # 先全部登录，再同时开始，模拟截止前的集中访问
+            tokens = list(executor.map(lambda pair: login(pair[0], recorder, pair[1]),
+                                       zip(clients, ids['employee_ids'])))
+            started = time.perf_counter()
+            futures = [
+                executor.submit(run_user, client, recorder, random.Random(args.seed * 100003 + index),
+                                token, ids, args)
+                for index, (client, token) in enumerate(zip(clients, tokens))
+            ]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - started
+
+        if server:
+            server.shutdown()
+
+        workload = {op: values for op, values in recorder.samples.items() if op != 'login'}
+        all_samples = [value for values in workload.values() for value in values]
+        overall = summarize(all_samples)
+        consistency = check_consistency(ids, args)
+
+        report = {
+            'config': {
+                'mode': args.mode,
+                'users': args.users,
+                'concurrency': concurrency,
+                'meal': args.meal,
+                'dishes': len(ids['dish_ids']),
+                'stock': args.stock,
+                'rounds': args.rounds,
+                'cutoff': cutoff,
+                'seed': args.seed,
+            },
+            'duration_s': round(elapsed, 3),
+            'requests': len(all_samples),
+            'throughput_rps': round(len(all_samples) / elapsed, 1) if elapsed else None,
+            'latency_ms': dict({'all': overall}, **{op: summarize(values) for op, values in sorted(
+                recorder.samples.items())}),
+            'slo': {'target_ms': SLO_MS, 'p95_ok': overall['p95'] is not None and overall['p95'] < SLO_MS},
+            'outcomes': recorder.outcomes,
+            'lock_errors': recorder.lock_errors,
+            'http_errors': recorder.http_errors,
+            'consistency': consistency,
+        }
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        print(text)
+
+        failed = (consistency['oversold'] or consistency['stock_mismatch']
+                  or consistency['duplicate_orders'] or consistency['meal_stats_drift'])
+        return 1 if failed else 0
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
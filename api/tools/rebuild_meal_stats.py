@@ -0,0 +1,45 @@
+# 餐次统计汇总重建：根据订单明细重新计算 meal_dish_totals / meal_order_totals
+#
+# 用法（在api目录下）：
+#     python tools/rebuild_meal_stats.py --check              # 只检查汇总是否与订单一致
+#     python tools/rebuild_meal_stats.py                      # 全量重建
+#     python tools/rebuild_meal_stats.py --date 2026-01-15    # 只重建某一天
+#
+# --check 发现不一致时返回码为1。
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.migrations import migrate
+from utils.storage import execute_write
+from services.meal_stats_service import MealStatsService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='重建或检查餐次统计汇总')
+    parser.add_argument('--date', help='只处理该日期 (YYYY-MM-DD)')
+    parser.add_argument('--check', action='store_true', help='只检查，不修改')
+    args = parser.parse_args()
+
+    migrate()
+    service = MealStatsService()
+
+    # 在写事务中执行，读取到的订单与汇总是同一个快照
+    drift = execute_write(lambda conn: service.check_drift(conn, args.date))
+    for item in drift:
+        print(f"{item['table']} {item['key']}: 汇总={item['stored']} 实际={item['expected']}")
+    print(f'发现 {len(drift)} 处不一致')
+
+    if args.check:
+        return 1 if drift else 0
+
+    rows = execute_write(lambda conn: service.rebuild(conn, args.date))
+    print(f'重建完成，菜品汇总 {rows} 行')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
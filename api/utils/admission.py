@@ -0,0 +1,174 @@
+# 准入控制：按分组限制同时执行的请求数（有界排队），按用户令牌桶限流；超限时快速返回429/503
+
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import jsonify
+import config
+from utils.helpers import error_response
+from utils.metrics import ADMISSION_REJECTED
+
+
+class ConcurrencyLimiter:
+    """
+    并发上限加有界等待队列
+
+    执行中的请求达到上限后，新请求排队等待；排队数也达到上限时立即拒绝，
+    不让线程和等待时间无限堆积。
+    """
+
+    def __init__(self, limit, queue_size, timeout):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        获取执行名额
+
+        Returns:
+            str: 成功时为None，否则为拒绝原因（queue_full 或 timeout）
+        """
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return None
+            if self.waiting >= self.queue_size:
+                return 'queue_full'
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.active < self.limit, self.timeout):
+                    return 'timeout'
+                self.active += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        """归还执行名额"""
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        return {'active': self.active, 'waiting': self.waiting, 'limit': self.limit,
+                'queue_size': self.queue_size}
+
+
+class RateLimiter:
+    """
+    按键（用户）的令牌桶
+
+    每个桶以rate个/秒补充令牌，最多积累burst个；桶数超过上限时淘汰最久未访问的，
+    被淘汰的用户下次按满桶重新开始。
+    """
+
+    def __init__(self, rate, burst, maxsize=None):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize or config.RATE_LIMIT_MAX_USERS
+        self._buckets = OrderedDict()  # 键 -> [剩余令牌, 上次更新时间]
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        取一个令牌
+
+        Args:
+            key: 用户ID
+
+        Returns:
+            float: 成功时为0，否则为距下一个令牌可用的秒数
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+    def stats(self):
+        return {'users': len(self._buckets), 'rate': self.rate, 'burst': self.burst}
+
+
+_limiters = {group: ConcurrencyLimiter(limits['concurrency'], limits['queue'], limits['timeout'])
+             for group, limits in config.ADMISSION_LIMITS.items()}
+_rate_limiters = {group: RateLimiter(*limits) for group, limits in config.RATE_LIMITS.items()}
+
+
+def _reject(status_code, code, message, retry_after):
+    response = jsonify(error_response(code, message))
+    response.status_code = status_code
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def admit(group):
+    """
+    准入控制装饰器（放在require_role/require_auth和idempotent之后）
+
+    先按当前用户的令牌桶限流，超出时返回429；再获取分组的执行名额，
+    排队已满或等待超时返回503。两者都带 Retry-After 响应头。
+
+    Args:
+        group (str): 分组名，对应 config.ADMISSION_LIMITS 和 config.RATE_LIMITS
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not config.ADMISSION_ENABLED:
+                return f(*args, **kwargs)
+
+            rate_limiter = _rate_limiters.get(group)
+            user_id = kwargs.get('current_user_id')
+            if rate_limiter and user_id is not None:
+                wait = rate_limiter.acquire(user_id)
+                if wait:
+                    ADMISSION_REJECTED.inc((group, 'rate_limited'))
+                    return _reject(429, config.ERROR_RATE_LIMITED, '请求过于频繁，请稍后再试', wait)
+
+            limiter = _limiters.get(group)
+            if limiter is None:
+                return f(*args, **kwargs)
+            reason = limiter.acquire()
+            if reason:
+                ADMISSION_REJECTED.inc((group, reason))
+                # 随机抖动，避免被拒绝的客户端在同一时刻集中重试
+                retry_after = config.ADMISSION_RETRY_AFTER * (1 + random.random())
+                return _reject(503, config.ERROR_SERVER_BUSY, '服务繁忙，请稍后再试', retry_after)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                limiter.release()
+
+        return decorated_function
+    return decorator
+
+
+def admission_stats():
+    """
+    获取准入控制状态
+
+    Returns:
+        dict: 各分组的执行中/排队请求数和令牌桶数量
+    """
+    return {
+        'enabled': config.ADMISSION_ENABLED,
+        'concurrency': {group: limiter.stats() for group, limiter in _limiters.items()},
+        'rate_limits': {group: limiter.stats() for group, limiter in _rate_limiters.items()}
+    }
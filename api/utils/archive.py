@@ -0,0 +1,259 @@
+# 订单冷热分离：保留期之前已结束的订单移入归档库（每个连接ATTACH为archive），热库只保留近期订单
+
+import sqlite3
+import threading
+from datetime import datetime, time, timedelta
+import config
+from utils.db_pool import get_pool
+from utils.storage import execute_write, open_connection
+from utils.versions import bump, get_version
+
+ARCHIVED_TABLES = ('orders', 'order_items')
+
+# 归档库的索引：与热库中订单列表、导出、统计使用的索引相同
+ARCHIVE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS archive.idx_orders_user_date_meal_created '
+    'ON orders(user_id, order_date, meal_type, created_at)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_orders_canteen_date_meal_created '
+    'ON orders(canteen_id, order_date DESC, meal_type, created_at)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_orders_date_meal ON orders(order_date, meal_type)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_orders_menu_id ON orders(menu_id)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_order_items_order_id ON order_items(order_id)',
+]
+
+# 归档库中的订单仍在热库时（复制后、删除前中断）以热库为准，查询归档库时跳过（订单表别名为o）
+NOT_IN_HOT = 'NOT EXISTS (SELECT 1 FROM main.orders h WHERE h.id = o.id)'
+
+_columns = {}
+_watermark = (None, None)  # (归档版本号, 水位)
+_watermark_lock = threading.Lock()
+
+
+def init_archive():
+    """
+    创建或补齐归档库的表结构，并设置归档库的journal_mode
+
+    归档表与热库同名同列（按热库当前的列顺序，热库新增的列在此补上），
+    只保留主键，不带外键和唯一约束。可重复调用。
+    """
+    if not config.ARCHIVE_ENABLED:
+        return
+    conn = open_connection(isolation_level=None)
+    try:
+        conn.execute(f'PRAGMA archive.journal_mode = {config.DB_JOURNAL_MODE}')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in ARCHIVED_TABLES:
+                hot = conn.execute(f'PRAGMA main.table_info({table})').fetchall()
+                existing = {row['name'] for row in conn.execute(f'PRAGMA archive.table_info({table})')}
+                if not existing:
+                    definitions = ', '.join(
+                        f"{row['name']} {row['type']}" + (' PRIMARY KEY' if row['pk'] else '') for row in hot)
+                    conn.execute(f'CREATE TABLE archive.{table} ({definitions})')
+                for row in hot:
+                    if existing and row['name'] not in existing:
+                        conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {row['name']} {row['type']}")
+            for sql in ARCHIVE_INDEXES:
+                conn.execute(sql)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    bump('archive')
+
+
+def columns(table):
+    """热库表的列名（按表中顺序）"""
+    if table not in _columns:
+        conn = get_pool().acquire()
+        try:
+            _columns[table] = [row['name'] for row in conn.execute(f'PRAGMA main.table_info({table})')]
+        finally:
+            conn.close()
+    return _columns[table]
+
+
+def watermark():
+    """
+    归档水位：归档库中最新的订单日期
+
+    按版本号 'archive' 缓存，每批归档后失效。
+
+    Returns:
+        str: 日期，未启用归档或归档库为空时为None
+    """
+    global _watermark
+    if not config.ARCHIVE_ENABLED:
+        return None
+    version = get_version('archive')
+    cached_version, value = _watermark
+    if cached_version == version:
+        return value
+    with _watermark_lock:
+        conn = get_pool().acquire()
+        try:
+            value = conn.execute('SELECT MAX(order_date) FROM archive.orders').fetchone()[0]
+        except sqlite3.OperationalError:
+            # 归档库尚未初始化（如只执行了迁移的工具脚本）
+            value = None
+        finally:
+            conn.close()
+        _watermark = (version, value)
+    return value
+
+
+def reaches(start_date=None):
+    """
+    日期下界为start_date的查询是否可能涉及归档订单
+
+    Args:
+        start_date (str): 查询的最早日期，None表示不限
+
+    Returns:
+        bool: 需要合并归档库时为True
+    """
+    mark = watermark()
+    return mark is not None and (start_date is None or start_date <= mark)
+
+
+def page_complete(rows, limit, start_date=None):
+    """
+    只查热库得到的一页（多查一条，按日期倒序）是否已经完整
+
+    取满且最后一条比归档水位新时，归档订单都排在这一页之后。
+
+    Args:
+        rows (list): 热库查询结果
+        limit (int): 每页条数
+        start_date (str): 查询的最早日期
+
+    Returns:
+        bool: 不需要再合并归档库时为True
+    """
+    if not reaches(start_date):
+        return True
+    return len(rows) > limit and rows[-1]['order_date'] > watermark()
+
+
+def schemas():
+    """按顺序需要查询的库：热库，有归档数据时再加归档库"""
+    return ('main', 'archive') if watermark() is not None else ('main',)
+
+
+def union_query(query, where, order_by):
+    """
+    热库与归档库的同一查询合并为 UNION ALL
+
+    Args:
+        query (str): SELECT ... FROM 部分，库名写作 {schema}，订单表别名为o
+        where (str): 条件
+        order_by (str): 排序
+
+    Returns:
+        str: 合并查询，参数为条件参数重复两次
+    """
+    hot = f"{query.format(schema='main')} WHERE {where}"
+    cold = f"{query.format(schema='archive')} WHERE {where} AND {NOT_IN_HOT}"
+    # 外层按结果列名排序；SQLite将其展开为带排序的复合查询，两边各自按索引顺序读取后归并
+    return f"SELECT * FROM ({hot} UNION ALL {cold}) ORDER BY {order_by.replace('o.', '')}"
+
+
+def source(table):
+    """
+    包含归档数据的表（用于重新计算统计等需要全部历史的查询）
+
+    Args:
+        table (str): orders 或 order_items
+
+    Returns:
+        str: 没有归档数据时为表名本身，否则为合并两个库的子查询
+    """
+    if watermark() is None:
+        return table
+    return (f'(SELECT * FROM main.{table} UNION ALL SELECT * FROM archive.{table} a '
+            f'WHERE NOT EXISTS (SELECT 1 FROM main.{table} h WHERE h.id = a.id))')
+
+
+def archive_orders(now=None):
+    """
+    将保留期之前已完成、已取消的订单及订单项移入归档库
+
+    按 config.ARCHIVE_BATCH_SIZE 分批，每批两个写事务：先复制到归档库并提交，
+    再从热库删除已在归档库中的订单。两个库各自提交，中途中断时订单可能同时
+    存在于两个库（查询以热库为准），下次执行时重新复制并删除，不会丢失。
+
+    Args:
+        now (datetime): 以该时刻计算保留期，默认当前时间
+
+    Returns:
+        dict: 归档截止日期（不含）和移动的订单数
+    """
+    cutoff = ((now or datetime.now()).date() - timedelta(days=config.ARCHIVE_RETENTION_DAYS)).strftime('%Y-%m-%d')
+    order_columns = ', '.join(columns('orders'))
+    item_columns = ', '.join(columns('order_items'))
+
+    def copy(conn):
+        ids = [row[0] for row in conn.execute('''
+            SELECT id FROM main.orders
+            WHERE order_date < ? AND status IN (?, ?)
+            LIMIT ?
+        ''', (cutoff, config.ORDER_STATUS_COMPLETED, config.ORDER_STATUS_CANCELLED, config.ARCHIVE_BATCH_SIZE))]
+        if ids:
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.orders ({order_columns})
+                SELECT {order_columns} FROM main.orders WHERE id IN ({placeholders})
+            ''', ids)
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.order_items ({item_columns})
+                SELECT {item_columns} FROM main.order_items WHERE order_id IN ({placeholders})
+            ''', ids)
+        return ids
+
+    def delete(conn, ids):
+        placeholders = ','.join('?' * len(ids))
+        archived = f'SELECT id FROM archive.orders WHERE id IN ({placeholders})'
+        conn.execute(f'DELETE FROM main.order_items WHERE order_id IN ({archived})', ids)
+        return conn.execute(f'DELETE FROM main.orders WHERE id IN ({archived})', ids).rowcount
+
+    total = 0
+    while True:
+        ids = execute_write(copy)
+        if not ids:
+            break
+        # 先使水位失效再删除，其他进程删除后查询时已能看到归档库中的订单
+        bump('archive')
+        total += execute_write(lambda conn: delete(conn, ids))
+        if len(ids) < config.ARCHIVE_BATCH_SIZE:
+            break
+    return {'cutoff': cutoff, 'archived': total}
+
+
+def next_archive_run(now):
+    """
+    下次执行归档的时间：每天 config.ARCHIVE_RUN_AT
+
+    Args:
+        now (datetime): 当前时间
+
+    Returns:
+        datetime: 下次执行时间
+    """
+    run_at = datetime.combine(now.date(), time.fromisoformat(config.ARCHIVE_RUN_AT))
+    return run_at if run_at > now else run_at + timedelta(days=1)
+
+
+def archive_stats():
+    """
+    获取归档状态
+
+    Returns:
+        dict: 是否启用、保留天数和归档水位
+    """
+    return {
+        'enabled': config.ARCHIVE_ENABLED,
+        'retention_days': config.ARCHIVE_RETENTION_DAYS,
+        'watermark': watermark()
+    }
@@ -0,0 +1,222 @@
+# 无状态签名令牌（HMAC-SHA256）
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+import config
+from utils.db_pool import get_pool
+from utils.storage import execute_write
+from utils.versions import get_version, bump
+
+
+class TokenError(ValueError):
+    """令牌无效、过期或已吊销"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(key_id, payload):
+    secret = config.TOKEN_SECRET_KEYS.get(key_id)
+    if not secret:
+        raise TokenError('令牌密钥未配置')
+    key = secret.encode()
+    message = f'{key_id}.{payload}'.encode()
+    return _b64encode(hmac.new(key, message, hashlib.sha256).digest())
+
+
+def check_secret_keys(allow_dev=False):
+    """
+    启动前检查令牌签名密钥
+
+    令牌中的角色不经数据库校验，密钥泄露即可伪造管理员令牌，未配置密钥时拒绝启动。
+    仅开发模式允许以 config.TOKEN_DEV_SECRET 代替。
+
+    Args:
+        allow_dev (bool): 是否允许使用开发密钥
+
+    Raises:
+        RuntimeError: 存在未配置的密钥
+    """
+    missing = [key_id for key_id, secret in config.TOKEN_SECRET_KEYS.items() if not secret]
+    if not missing:
+        return
+    if not allow_dev:
+        raise RuntimeError('未配置令牌签名密钥，请设置环境变量 ORDERING_TOKEN_SECRET')
+    for key_id in missing:
+        config.TOKEN_SECRET_KEYS[key_id] = config.TOKEN_DEV_SECRET
+    print('警告: 未设置 ORDERING_TOKEN_SECRET，使用公开的开发密钥签发令牌，切勿用于生产环境', flush=True)
+
+
+# 已吊销的令牌：jti -> 过期时间；按用户吊销：user_id -> 吊销时间
+# 内存中的吊销列表是 token_revocations 表的副本，版本号变化时重新加载，
+# 多进程部署时一个进程吊销的令牌在其他进程同样失效
+_revoked_tokens = {}
+_revoked_users = {}
+_revoke_lock = threading.Lock()
+_synced_version = None
+
+
+def issue_token(user_id, role, ttl=None):
+    """
+    签发令牌
+
+    令牌格式为 key_id.payload.signature，payload中包含用户ID、角色和过期时间，
+    校验时无需访问数据库。
+
+    Args:
+        user_id (int): 用户ID
+        role (str): 用户角色
+        ttl (int): 有效期（秒），默认config.TOKEN_TTL
+
+    Returns:
+        tuple: (令牌字符串, 过期时间戳)
+    """
+    now = time.time()
+    expires_at = int(now + (ttl or config.TOKEN_TTL))
+    claims = {
+        'uid': int(user_id),
+        'role': role,
+        'iat': now,
+        'exp': expires_at,
+        'jti': uuid.uuid4().hex
+    }
+    key_id = config.TOKEN_ACTIVE_KEY_ID
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f'{key_id}.{payload}.{_sign(key_id, payload)}', expires_at
+
+
+def verify_token(token):
+    """
+    校验令牌
+
+    Args:
+        token (str): 令牌字符串
+
+    Returns:
+        dict: 令牌声明（uid、role、iat、exp、jti）
+
+    Raises:
+        TokenError: 令牌无效、过期或已吊销
+    """
+    try:
+        key_id, payload, signature = token.split('.')
+    except ValueError:
+        raise TokenError('令牌格式错误')
+
+    if not config.TOKEN_SECRET_KEYS.get(key_id):
+        raise TokenError('令牌密钥已失效')
+
+    # 按字节比较：str参数含非ASCII字符时compare_digest会抛出TypeError
+    if not hmac.compare_digest(signature.encode('utf-8'), _sign(key_id, payload).encode('utf-8')):
+        raise TokenError('令牌签名无效')
+
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise TokenError('令牌格式错误')
+
+    if claims['exp'] <= time.time():
+        raise TokenError('登录已过期')
+
+    _sync_revocations()
+    if claims['jti'] in _revoked_tokens:
+        raise TokenError('令牌已吊销')
+
+    revoked_at = _revoked_users.get(claims['uid'])
+    if revoked_at is not None and claims['iat'] <= revoked_at:
+        raise TokenError('令牌已吊销')
+
+    return claims
+
+
+def revoke_token(claims):
+    """
+    吊销单个令牌（退出登录）
+
+    Args:
+        claims (dict): verify_token返回的令牌声明
+    """
+    now = time.time()
+    with _revoke_lock:
+        # 顺便清理已自然过期的吊销记录
+        for jti in [jti for jti, exp in _revoked_tokens.items() if exp <= now]:
+            del _revoked_tokens[jti]
+        _revoked_tokens[claims['jti']] = claims['exp']
+    _persist_revocation('token', claims['jti'], now, claims['exp'])
+
+
+def revoke_user_tokens(user_id):
+    """
+    吊销用户此前签发的全部令牌（角色或启用状态变更后调用）
+
+    Args:
+        user_id (int): 用户ID
+    """
+    now = time.time()
+    with _revoke_lock:
+        # 早于最长有效期的记录已无意义
+        for uid in [uid for uid, at in _revoked_users.items() if at + config.TOKEN_TTL <= now]:
+            del _revoked_users[uid]
+        _revoked_users[int(user_id)] = now
+    _persist_revocation('user', str(int(user_id)), now, now + config.TOKEN_TTL)
+
+
+def _persist_revocation(kind, subject, revoked_at, expires_at):
+    """写入吊销记录并递增版本号，其他进程据此重新加载"""
+    def write(conn):
+        conn.execute('DELETE FROM token_revocations WHERE expires_at <= ?', (revoked_at,))
+        conn.execute('''
+            INSERT INTO token_revocations (kind, subject, revoked_at, expires_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (kind, subject) DO UPDATE SET
+                revoked_at = excluded.revoked_at,
+                expires_at = excluded.expires_at
+        ''', (kind, subject, revoked_at, expires_at))
+
+    execute_write(write)
+    bump('token_revocations')
+
+
+def _sync_revocations():
+    """吊销记录的版本号变化后（含进程启动后首次校验）从数据库重新加载"""
+    global _synced_version
+    version = get_version('token_revocations')
+    if version == _synced_version:
+        return
+
+    conn = get_pool().acquire()
+    try:
+        rows = conn.execute('''
+            SELECT kind, subject, revoked_at, expires_at FROM token_revocations WHERE expires_at > ?
+        ''', (time.time(),)).fetchall()
+    finally:
+        conn.close()
+
+    with _revoke_lock:
+        for kind, subject, revoked_at, expires_at in rows:
+            if kind == 'token':
+                _revoked_tokens[subject] = expires_at
+            else:
+                uid = int(subject)
+                _revoked_users[uid] = max(_revoked_users.get(uid, 0), revoked_at)
+        _synced_version = version
+
+
+def revocation_stats():
+    """
+    获取吊销列表大小
+
+    Returns:
+        dict: 吊销的令牌数和用户数
+    """
+    return {'tokens': len(_revoked_tokens), 'users': len(_revoked_users)}
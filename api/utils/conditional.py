@@ -0,0 +1,86 @@
+# 条件请求（ETag / If-None-Match / If-Modified-Since）
+
+import hashlib
+import uuid
+from functools import wraps
+from email.utils import formatdate, parsedate_to_datetime
+from flask import request, make_response
+import config
+from utils.versions import get_versions, last_modified
+
+# 进程启动标识：版本计数器只在进程内有效，重启后旧ETag必须全部失效
+BOOT_ID = uuid.uuid4().hex
+
+
+def compute_etag(names):
+    """
+    根据请求地址和数据版本号计算强ETag
+
+    Args:
+        names (list): 版本名称列表
+
+    Returns:
+        str: 带引号的ETag
+    """
+    key = f'{BOOT_ID}|{request.full_path}|{get_versions(*names)}'
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+def _not_modified(etag, modified_at):
+    """判断客户端缓存是否仍然有效"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # If-None-Match 优先于 If-Modified-Since
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in tags or '*' in tags
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP日期只精确到秒
+        return int(modified_at) <= since
+
+    return False
+
+
+def conditional(*names, max_age=None):
+    """
+    条件GET装饰器
+
+    响应的ETag由请求地址和相关数据的版本号决定，客户端缓存仍然有效时
+    直接返回304，不执行视图函数，也就不查询数据库、不序列化。
+    版本名称中可以使用路由参数，如 'menu:{menu_id}'。
+
+    Args:
+        *names: 响应所依赖数据的版本名称
+        max_age (int): 允许客户端直接使用缓存的秒数；为None时每次都需重新验证
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            resolved = [name.format(**kwargs) for name in names]
+            etag = compute_etag(resolved)
+            modified_at = last_modified(*resolved)
+
+            if _not_modified(etag, modified_at):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                # 只缓存成功的业务响应，错误信息每次都重新获取
+                body = response.get_json(silent=True)
+                if response.status_code != 200 or not body or body.get('code') != config.ERROR_SUCCESS:
+                    response.headers['Cache-Control'] = 'no-store'
+                    return response
+
+            response.headers['ETag'] = etag
+            response.headers['Last-Modified'] = formatdate(modified_at, usegmt=True)
+            if max_age:
+                response.headers['Cache-Control'] = f'public, max-age={max_age}'
+            else:
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return decorated_function
+    return decorator
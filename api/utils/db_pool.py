@@ -0,0 +1,253 @@
+# 数据库连接池
+
+import queue
+import sqlite3
+import threading
+import time
+from flask import g, has_app_context
+import config
+from utils.storage import open_connection
+
+
+class PooledConnection:
+    """
+    连接池中借出的连接句柄
+
+    对外行为与sqlite3.Connection一致；close()不会真正关闭连接，
+    而是回滚未提交的事务并将连接归还连接池。
+    """
+
+    def __init__(self, pool, conn, scoped=False):
+        self._pool = pool
+        self._conn = conn
+        self._scoped = scoped
+        self._released = False
+
+    def __getattr__(self, name):
+        if self._released:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def commit(self):
+        if not self._released:
+            self._conn.commit()
+
+    def rollback(self):
+        if not self._released:
+            self._conn.rollback()
+
+    def close(self):
+        """
+        释放连接
+
+        请求级连接在close()时只回滚未提交的事务，连接本身在请求结束时归还。
+        """
+        if self._released:
+            return
+        if self._conn.in_transaction:
+            self._conn.rollback()
+        if not self._scoped:
+            self.release()
+
+    def release(self):
+        """将连接归还连接池"""
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._conn)
+
+
+class ConnectionPool:
+    """SQLite连接池（有界，LIFO复用，借出时健康检查）"""
+
+    def __init__(self, db_path, size=None, timeout=None, recycle=None):
+        self.db_path = db_path
+        self.size = size or config.DB_POOL_SIZE
+        self.timeout = timeout if timeout is not None else config.DB_POOL_TIMEOUT
+        self.recycle = recycle if recycle is not None else config.DB_POOL_RECYCLE
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0
+        }
+
+    def _connect(self):
+        """创建新连接（PRAGMA初始化见storage.connection_pragmas）"""
+        return open_connection(self.db_path)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats['discarded'] += 1
+
+    def _healthy(self, conn, idle_since):
+        """空闲超过recycle秒的连接在复用前执行一次 SELECT 1"""
+        if time.monotonic() - idle_since < self.recycle:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._healthy(conn, idle_since):
+                return conn
+            self._discard(conn)
+
+        with self._lock:
+            if self._open < self.size:
+                self._open += 1
+                self._stats['created'] += 1
+                create = True
+            else:
+                self._stats['waits'] += 1
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        # 连接池已满，等待其他请求归还
+        start = time.monotonic()
+        try:
+            conn, idle_since = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise sqlite3.OperationalError('数据库连接池已耗尽')
+        finally:
+            with self._lock:
+                self._stats['wait_time'] += time.monotonic() - start
+
+        if self._healthy(conn, idle_since):
+            return conn
+        self._discard(conn)
+        return self._checkout()
+
+    def acquire(self, scoped=False):
+        """
+        借出一个连接
+
+        Args:
+            scoped (bool): 是否为请求级连接（由请求结束时统一归还）
+
+        Returns:
+            PooledConnection: 连接句柄
+        """
+        conn = self._checkout()
+        with self._lock:
+            self._stats['checkouts'] += 1
+        return PooledConnection(self, conn, scoped)
+
+    def release(self, conn):
+        """归还连接"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """
+        获取连接池统计
+
+        Returns:
+            dict: 借出次数、等待次数、当前打开连接数等
+        """
+        with self._lock:
+            result = dict(self._stats)
+            result['open'] = self._open
+        result['idle'] = self._idle.qsize()
+        result['in_use'] = result['open'] - result['idle']
+        result['size'] = self.size
+        return result
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    获取进程内的全局连接池（首次调用时创建）
+
+    Returns:
+        ConnectionPool: 连接池
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(config.DB_PATH)
+    return _pool
+
+
+def get_connection():
+    """
+    获取数据库连接
+
+    在Flask请求内返回请求级连接（同一请求内复用，请求结束时归还），
+    请求外直接从连接池借出，调用close()即归还。
+
+    Returns:
+        PooledConnection: 连接句柄
+    """
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = get_pool().acquire(scoped=True)
+            g.db_conn = conn
+        return conn
+    return get_pool().acquire()
+
+
+def release_request_connection(exception=None):
+    """请求结束时归还请求级连接（注册为teardown_appcontext）"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.close()
+        conn.release()
+
+
+def init_app(app):
+    """为Flask应用注册连接池的请求清理钩子"""
+    app.teardown_appcontext(release_request_connection)
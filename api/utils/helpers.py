@@ -1,23 +1,32 @@
 # 工具函数
 
+import base64
 import hashlib
-import sqlite3
-from datetime import datetime, time
+import json
+from datetime import datetime, time, timedelta
 from functools import wraps
 from flask import request, jsonify
 import config
+from utils.db_pool import get_connection
+from utils.cache import LRUCache
+from utils.auth_token import TokenError, verify_token, revoke_user_tokens
+from utils.versions import get_version, bump
+from utils import order_no
+
+
+# 用户身份缓存：(user_id, 版本号) -> role（用户不存在或已禁用时为None）
+# 键带版本号，多进程部署时任一进程变更用户后其他进程的缓存同时失效
+identity_cache = LRUCache(config.IDENTITY_CACHE_SIZE, config.IDENTITY_CACHE_TTL)
 
 
 def get_db_connection():
     """
-    获取数据库连接
+    获取数据库连接（来自连接池，close()即归还）
     
     Returns:
-        sqlite3.Connection: 数据库连接对象
+        PooledConnection: 数据库连接对象
     """
-    conn = sqlite3.connect(config.DB_PATH)
-    conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
-    return conn
+    return get_connection()
 
 
 def hash_password(password):
@@ -108,14 +117,62 @@ def check_time_limit(meal_type, order_date):
     return False
 
 
+def meal_close_time(meal_type, meal_date):
+    """
+    餐次结束时间：点餐截止后再过 config.MEAL_CLOSE_DELAY 分钟
+    
+    Args:
+        meal_type (str): 餐次类型
+        meal_date (date): 日期
+    
+    Returns:
+        datetime: 结束时间
+    """
+    limit_hour, limit_minute = map(int, config.MEAL_TIME_LIMITS[meal_type].split(':'))
+    return (datetime.combine(meal_date, time(limit_hour, limit_minute))
+            + timedelta(minutes=config.MEAL_CLOSE_DELAY))
+
+
+def ended_meals(now=None):
+    """
+    截至某一时刻已结束的餐次
+    
+    Args:
+        now (datetime): 时刻，默认当前时间
+    
+    Returns:
+        tuple: (日期 YYYY-MM-DD, 该日已结束的餐次列表)；该日期之前的餐次全部已结束
+    """
+    now = now or datetime.now()
+    meal_types = [meal_type for meal_type in config.MEAL_TIME_LIMITS
+                  if meal_close_time(meal_type, now.date()) <= now]
+    return now.strftime('%Y-%m-%d'), meal_types
+
+
+def next_meal_close(now=None):
+    """
+    下一个餐次结束时间
+    
+    Args:
+        now (datetime): 时刻，默认当前时间
+    
+    Returns:
+        datetime: 晚于now的最近一个餐次结束时间
+    """
+    now = now or datetime.now()
+    return min(meal_close_time(meal_type, now.date() + timedelta(days=days))
+               for days in (0, 1) for meal_type in config.MEAL_TIME_LIMITS
+               if meal_close_time(meal_type, now.date() + timedelta(days=days)) > now)
+
+
 def generate_order_no():
     """
-    生成订单号
+    生成订单号（多线程、多进程下不重复，按生成时间递增）
     
     Returns:
-        str: 订单号 (格式: ORD + 时间戳)
+        str: 订单号 (格式: ORD + 19位数字，见 utils/order_no.py)
     """
-    return f"ORD{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    return order_no.generate()
 
 
 def success_response(data=None, message='success'):
@@ -155,24 +212,113 @@ def error_response(code, message, data=None):
     }
 
 
+def get_request_token():
+    """
+    从请求头 Authorization: Bearer <token> 中读取令牌
+    
+    浏览器的 EventSource 无法设置请求头，事件流请求允许通过
+    查询参数 access_token 传递令牌。
+    
+    Returns:
+        str: 令牌字符串，不存在时返回None
+    """
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        return auth[7:].strip() or None
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return request.args.get('access_token') or None
+    return None
+
+
+def authenticate():
+    """
+    识别当前请求的用户
+    
+    优先校验签名令牌（纯CPU计算，不访问数据库）；
+    仅在config.AUTH_ALLOW_USER_ID_HEADER开启时兼容旧的X-User-Id请求头。
+    
+    Returns:
+        tuple: (user_id, role, 错误响应)，认证成功时错误响应为None
+    """
+    token = get_request_token()
+    if token:
+        try:
+            claims = verify_token(token)
+        except TokenError as e:
+            return None, None, (jsonify(error_response(config.ERROR_UNAUTHORIZED, str(e))), 401)
+        return claims['uid'], claims['role'], None
+    
+    user_id = request.headers.get('X-User-Id') if config.AUTH_ALLOW_USER_ID_HEADER else None
+    if not user_id:
+        return None, None, (jsonify(error_response(config.ERROR_UNAUTHORIZED, '未登录')), 401)
+    
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        return None, None, (jsonify(error_response(config.ERROR_UNAUTHORIZED, '未登录')), 401)
+    
+    # 查询用户角色
+    role = get_user_role(user_id)
+    if not role:
+        return None, None, (jsonify(error_response(config.ERROR_USER_NOT_FOUND, '用户不存在')), 404)
+    
+    return user_id, role, None
+
+
 def require_auth(f):
     """
     认证装饰器：要求用户登录
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # 从请求头获取用户ID（简化实现，实际应使用JWT等）
-        user_id = request.headers.get('X-User-Id')
-        if not user_id:
-            return jsonify(error_response(config.ERROR_UNAUTHORIZED, '未登录')), 401
+        user_id, role, error = authenticate()
+        if error:
+            return error
         
         # 将用户ID添加到kwargs
-        kwargs['current_user_id'] = int(user_id)
+        kwargs['current_user_id'] = user_id
         return f(*args, **kwargs)
     
     return decorated_function
 
 
+def get_user_role(user_id):
+    """
+    获取有效用户的角色（优先读取身份缓存）
+    
+    Args:
+        user_id (int): 用户ID
+    
+    Returns:
+        str: 用户角色，用户不存在或已禁用时返回None
+    """
+    key = (user_id, get_version(f'user:{user_id}'))
+    role = identity_cache.get(key, identity_cache.MISSING)
+    if role is not identity_cache.MISSING:
+        return role
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT role FROM users WHERE id = ? AND is_active = 1', (user_id,))
+    user = cursor.fetchone()
+    conn.close()
+    
+    role = user['role'] if user else None
+    identity_cache.set(key, role)
+    return role
+
+
+def invalidate_user(user_id):
+    """
+    用户角色或启用状态变更后清除其身份缓存，并吊销其已签发的令牌
+    
+    Args:
+        user_id (int): 用户ID
+    """
+    bump(f'user:{int(user_id)}')
+    revoke_user_tokens(user_id)
+
+
 def require_role(*roles):
     """
     角色权限装饰器
@@ -183,25 +329,15 @@ def require_role(*roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            user_id = request.headers.get('X-User-Id')
-            if not user_id:
-                return jsonify(error_response(config.ERROR_UNAUTHORIZED, '未登录')), 401
+            user_id, role, error = authenticate()
+            if error:
+                return error
             
-            # 查询用户角色
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT role FROM users WHERE id = ? AND is_active = 1', (user_id,))
-            user = cursor.fetchone()
-            conn.close()
-            
-            if not user:
-                return jsonify(error_response(config.ERROR_USER_NOT_FOUND, '用户不存在')), 404
-            
-            if user['role'] not in roles:
+            if role not in roles:
                 return jsonify(error_response(config.ERROR_FORBIDDEN, '无权限访问')), 403
             
-            kwargs['current_user_id'] = int(user_id)
-            kwargs['current_user_role'] = user['role']
+            kwargs['current_user_id'] = user_id
+            kwargs['current_user_role'] = role
             return f(*args, **kwargs)
         
         return decorated_function
@@ -234,3 +370,88 @@ def list_from_rows(rows):
         list: 字典列表
     """
     return [dict_from_row(row) for row in rows]
+
+
+def encode_cursor(values):
+    """
+    将分页位置编码为不透明的游标字符串
+    
+    Args:
+        values (list): 最后一条记录的排序键
+    
+    Returns:
+        str: 游标
+    """
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    解析分页游标
+    
+    Args:
+        cursor (str): encode_cursor 生成的游标
+        size (int): 排序键的个数
+    
+    Returns:
+        list: 排序键
+    
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('分页游标无效')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('分页游标无效')
+    return values
+
+
+def get_page_params():
+    """
+    读取请求中的分页参数 limit、cursor、with_total
+    
+    Returns:
+        tuple: (每页条数, 游标, 是否统计总数)
+    
+    Raises:
+        ValueError: 每页条数超出范围
+    """
+    limit = request.args.get('limit', config.ORDER_PAGE_SIZE, type=int)
+    if limit < 1 or limit > config.ORDER_PAGE_MAX:
+        raise ValueError(f'每页条数必须在1到{config.ORDER_PAGE_MAX}之间')
+    cursor = request.args.get('cursor') or None
+    with_total = request.args.get('with_total') in ('1', 'true')
+    return limit, cursor, with_total
+
+
+def get_export_params():
+    """
+    读取导出请求的参数 canteen_id、start_date、end_date、format
+    
+    Returns:
+        tuple: (食堂ID, 开始日期, 结束日期, 格式)
+    
+    Raises:
+        ValueError: 参数缺失或无效
+    """
+    canteen_id = request.args.get('canteen_id', type=int)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date') or start_date
+    fmt = request.args.get('format', 'csv')
+    
+    if not canteen_id or not start_date:
+        raise ValueError('食堂ID和开始日期不能为空')
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError('导出格式只支持csv和ndjson')
+    try:
+        days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days
+    except ValueError:
+        raise ValueError('日期格式错误')
+    if days < 0 or days >= config.EXPORT_MAX_DAYS:
+        raise ValueError(f'日期范围必须在1到{config.EXPORT_MAX_DAYS}天之间')
+    
+    return canteen_id, start_date, end_date, fmt
@@ -0,0 +1,225 @@
+# 幂等键（Idempotency-Key）：客户端重试同一请求时直接返回第一次的响应
+
+import hashlib
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify, make_response
+import config
+from utils.cache import LRUCache
+from utils.db_pool import get_pool
+from utils.storage import execute_write, worker_id
+from utils.helpers import error_response
+
+# (user_id, 幂等键) -> (请求指纹, HTTP状态码, 响应体)
+_cache = LRUCache(config.IDEMPOTENCY_CACHE_SIZE, config.IDEMPOTENCY_TTL)
+# 本进程内正在处理的幂等键 -> 完成事件
+_inflight = {}
+_inflight_lock = threading.Lock()
+# 这些错误是暂时性的，不保存，客户端重试时重新执行
+_TRANSIENT_ERRORS = (config.ERROR_SYSTEM, config.ERROR_DATABASE, config.ERROR_RATE_LIMITED,
+                     config.ERROR_SERVER_BUSY)
+
+
+def _fingerprint():
+    """请求指纹：同一幂等键只能用于方法、路径和请求体都相同的请求"""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _lookup(scope):
+    """
+    查找已保存的响应（先查内存，再查数据库）
+
+    Returns:
+        tuple: (请求指纹, 状态码, 响应体)，没有时返回None
+    """
+    record = _cache.get(scope)
+    if record is not None:
+        return record
+
+    conn = get_pool().acquire()
+    try:
+        row = conn.execute('''
+            SELECT request_hash, status_code, response FROM idempotency_keys
+            WHERE user_id = ? AND idempotency_key = ? AND expires_at > ?
+        ''', (scope[0], scope[1], time.time())).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    record = (row['request_hash'], row['status_code'], row['response'])
+    _cache.set(scope, record)
+    return record
+
+
+def _store(scope, record):
+    """
+    保存响应；其他进程已抢先保存同一幂等键时以先保存的为准
+
+    Returns:
+        tuple: 最终生效的记录
+    """
+    now = time.time()
+
+    def write(conn):
+        conn.execute('''
+            INSERT INTO idempotency_keys (user_id, idempotency_key, request_hash, status_code,
+                                          response, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, idempotency_key) DO UPDATE SET
+                request_hash = excluded.request_hash,
+                status_code = excluded.status_code,
+                response = excluded.response,
+                created_at = excluded.created_at,
+                expires_at = excluded.expires_at
+            WHERE idempotency_keys.expires_at <= excluded.created_at
+        ''', (scope[0], scope[1], *record, now, now + config.IDEMPOTENCY_TTL))
+        row = conn.execute('''
+            SELECT request_hash, status_code, response FROM idempotency_keys
+            WHERE user_id = ? AND idempotency_key = ?
+        ''', scope).fetchone()
+        return (row[0], row[1], row[2])
+
+    record = execute_write(write)
+    _cache.set(scope, record)
+    return record
+
+
+def _replay(record, fingerprint):
+    """返回已保存的响应"""
+    request_hash, status_code, body = record
+    if request_hash != fingerprint:
+        return jsonify(error_response(config.ERROR_IDEMPOTENCY_CONFLICT, '幂等键已用于其他请求')), 409
+    response = make_response(body, status_code)
+    response.mimetype = 'application/json'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(f):
+    """
+    幂等请求装饰器（放在require_role之后，按用户区分幂等键）
+
+    请求头带 Idempotency-Key 时，同一用户用同一个键重复提交只执行一次：
+    之后的请求直接返回第一次的响应，不再进入服务层。第一次请求仍在处理时，
+    本进程内的重复请求等它完成后返回同一结果。系统错误等暂时性失败不保存。
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > config.IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify(error_response(config.ERROR_INVALID_PARAM, '幂等键过长'))
+
+        scope = (kwargs['current_user_id'], key)
+        fingerprint = _fingerprint()
+
+        while True:
+            record = _lookup(scope)
+            if record is not None:
+                return _replay(record, fingerprint)
+            with _inflight_lock:
+                done = _inflight.get(scope)
+                if done is None:
+                    done = _inflight[scope] = threading.Event()
+                    break
+            if not done.wait(config.IDEMPOTENCY_WAIT_TIMEOUT):
+                return jsonify(error_response(config.ERROR_IDEMPOTENCY_CONFLICT, '相同请求正在处理中')), 409
+
+        try:
+            response = make_response(f(*args, **kwargs))
+            body = response.get_json(silent=True)
+            if response.status_code >= 500 or not body or body.get('code') in _TRANSIENT_ERRORS:
+                return response
+            record = _store(scope, (fingerprint, response.status_code, response.get_data(as_text=True)))
+            if record[0] != fingerprint or record[2] != response.get_data(as_text=True):
+                # 其他进程抢先处理了同一请求
+                return _replay(record, fingerprint)
+            return response
+        finally:
+            with _inflight_lock:
+                _inflight.pop(scope, None)
+            done.set()
+
+    return decorated_function
+
+
+class Sweeper:
+    """后台定期分批删除过期的幂等键"""
+
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = interval or config.IDEMPOTENCY_SWEEP_INTERVAL
+        self.batch_size = batch_size or config.IDEMPOTENCY_SWEEP_BATCH
+        self.runs = 0
+        self.deleted = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='idempotency-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def sweep(self):
+        """
+        删除全部过期记录，每批一个短事务，不长时间占用写线程
+
+        Returns:
+            int: 删除的行数
+        """
+        now = time.time()
+        total = 0
+        while True:
+            deleted = execute_write(lambda conn: conn.execute('''
+                DELETE FROM idempotency_keys
+                WHERE (user_id, idempotency_key) IN (
+                    SELECT user_id, idempotency_key FROM idempotency_keys
+                    WHERE expires_at <= ? LIMIT ?
+                )
+            ''', (now, self.batch_size)).rowcount)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+        self.runs += 1
+        self.deleted += total
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                pass
+
+
+_sweeper = Sweeper()
+
+
+def init_idempotency():
+    """启动过期幂等键清理线程（多进程部署时只由0号worker执行）"""
+    if worker_id() in (None, 0):
+        _sweeper.start()
+
+
+def idempotency_stats():
+    """
+    获取幂等键统计
+
+    Returns:
+        dict: 内存缓存统计、处理中的请求数和清理次数
+    """
+    return {
+        'cache': _cache.stats(),
+        'inflight': len(_inflight),
+        'sweeps': _sweeper.runs,
+        'swept': _sweeper.deleted
+    }
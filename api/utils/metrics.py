@@ -0,0 +1,275 @@
+# 运行指标：请求耗时、SQL语句耗时、事务计数，以Prometheus文本格式输出；慢语句交给slow_query记录
+
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from flask import g, request
+import config
+from utils import slow_query
+
+
+class Histogram:
+    """
+    按标签分组的累积直方图
+
+    每次观测只做一次二分查找和几次整数累加，开销在微秒级，可常开。
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=None):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets or config.METRICS_BUCKETS)
+        self._series = {}  # 标签值元组 -> [各桶计数..., 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        """
+        记录一次观测
+
+        Args:
+            labels (tuple): 标签值，顺序同label_names
+            value (float): 观测值（秒）
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(items):
+            base = _format_labels(self.label_names, labels)
+            prefix = base + ',' if base else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{_braces(base)} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{_braces(base)} {series[-1]}')
+        return lines
+
+
+class Counter:
+    """按标签分组的计数器"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_braces(_format_labels(self.label_names, labels))} {value}')
+        return lines
+
+
+def _format_labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+def _braces(labels):
+    return '{' + labels + '}' if labels else ''
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'API请求耗时',
+                            ('method', 'endpoint', 'status'))
+SQL_LATENCY = Histogram('db_statement_duration_seconds', 'SQL语句执行耗时（按归一化语句）',
+                        ('statement',))
+TRANSACTIONS = Counter('db_transactions_total', '事务结束次数', ('result',))
+WRITE_QUEUE_WAIT = Histogram('db_write_queue_wait_seconds', '写任务在写线程队列中的等待时间', ())
+WRITE_TRANSACTION = Histogram('db_write_transaction_seconds', '写事务耗时（BEGIN IMMEDIATE到提交或回滚，一批任务一次）', ())
+WRITE_BATCH_SIZE = Histogram('db_write_batch_size', '每次提交包含的写任务数', (),
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+LOCK_ERRORS = Counter('db_lock_errors_total', '等待数据库锁超时（database is locked/busy）次数')
+REQUESTS_STARTED = Counter('http_requests_started_total', '已开始处理的请求数')
+ADMISSION_REJECTED = Counter('http_admission_rejected_total', '准入控制拒绝的请求数', ('group', 'reason'))
+
+_gauges = []  # (名称, 说明, 取值函数)
+_statements = set()
+_statements_lock = threading.Lock()
+
+
+def gauge(name, help_text, fn):
+    """
+    注册一个在输出时取值的指标
+
+    Args:
+        name (str): 指标名
+        help_text (str): 说明
+        fn (callable): 返回当前值
+    """
+    _gauges.append((name, help_text, fn))
+
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """
+    归一化SQL语句：合并空白、字面值替换为?、IN列表合并为一个占位符
+
+    Args:
+        sql (str): SQL语句
+
+    Returns:
+        str: 归一化后的语句
+    """
+    sql = ' '.join(sql.split())
+    sql = _LITERAL.sub('?', sql)
+    return _PLACEHOLDER_LIST.sub('(?)', sql)
+
+
+def record_statement(sql, elapsed):
+    """
+    记录一条SQL语句的耗时
+
+    不同语句数超过 config.METRICS_MAX_STATEMENTS 后，新语句归入 other，避免标签无限增长。
+
+    Args:
+        sql (str): SQL语句
+        elapsed (float): 耗时（秒）
+    """
+    statement = normalize_sql(sql)
+    if statement not in _statements:
+        with _statements_lock:
+            if len(_statements) < config.METRICS_MAX_STATEMENTS:
+                _statements.add(statement)
+            else:
+                statement = 'other'
+    SQL_LATENCY.observe((statement,), elapsed)
+    keyword = statement[:8].upper()
+    if keyword.startswith('COMMIT') or keyword.startswith('END'):
+        TRANSACTIONS.inc(('commit',))
+    elif keyword.startswith('ROLLBACK'):
+        TRANSACTIONS.inc(('rollback',))
+
+
+def _record_error(error):
+    message = str(error)
+    if 'locked' in message or 'busy' in message:
+        LOCK_ERRORS.inc()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录每条语句耗时的游标（耗时为执行到返回首行，不含后续逐行读取）"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            _record_error(e)
+            raise
+        finally:
+            self._observe(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.OperationalError as e:
+            _record_error(e)
+            raise
+        finally:
+            self._observe(sql, seq_of_parameters[0] if seq_of_parameters else (),
+                          time.perf_counter() - start, batch_size=len(seq_of_parameters))
+
+    def _observe(self, sql, parameters, elapsed, batch_size=None):
+        if config.METRICS_ENABLED:
+            record_statement(sql, elapsed)
+        if config.SLOW_QUERY_MS and elapsed * 1000 >= config.SLOW_QUERY_MS:
+            slow_query.record(self.connection, sql, normalize_sql(sql), parameters, elapsed, batch_size)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """使用InstrumentedCursor的连接，并统计提交和回滚"""
+
+    @staticmethod
+    def enabled():
+        """是否需要为新连接启用语句计时（运行指标或慢查询日志）"""
+        return bool(config.METRICS_ENABLED or config.SLOW_QUERY_MS)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if self.in_transaction and config.METRICS_ENABLED:
+            TRANSACTIONS.inc(('commit',))
+        super().commit()
+
+    def rollback(self):
+        if self.in_transaction and config.METRICS_ENABLED:
+            TRANSACTIONS.inc(('rollback',))
+        super().rollback()
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    REQUESTS_STARTED.inc()
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        # 使用路由模板而不是实际路径，标签数量有界
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe((request.method, endpoint, str(response.status_code)),
+                                time.perf_counter() - start)
+    return response
+
+
+def init_app(app):
+    """为Flask应用注册请求计时钩子"""
+    if config.METRICS_ENABLED:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+
+
+def render():
+    """
+    以Prometheus文本格式输出全部指标
+
+    Returns:
+        str: 指标文本
+    """
+    lines = []
+    for metric in (REQUEST_LATENCY, SQL_LATENCY, WRITE_QUEUE_WAIT, WRITE_TRANSACTION, WRITE_BATCH_SIZE,
+                   TRANSACTIONS, LOCK_ERRORS, REQUESTS_STARTED, ADMISSION_REJECTED):
+        lines.extend(metric.render())
+    for name, help_text, fn in _gauges:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {fn()}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,185 @@
+# 数据库结构迁移（基于 PRAGMA user_version）
+
+import sqlite3
+import config
+
+# 迁移列表：(版本号, 说明, SQL语句列表)，版本号必须递增，已发布的迁移不可修改
+MIGRATIONS = [
+    (1, '热点查询的复合索引', [
+        # 重复下单检查、我的订单
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_date_meal_status '
+        'ON orders(user_id, order_date, meal_type, status)',
+        # 餐次统计、食堂订单列表
+        'CREATE INDEX IF NOT EXISTS idx_orders_canteen_date_meal_status '
+        'ON orders(canteen_id, order_date, meal_type, status)',
+        # 库存账本对账、删除菜单前检查、首页日历
+        'CREATE INDEX IF NOT EXISTS idx_orders_menu_status ON orders(menu_id, status)',
+        # 订单详情、修改/取消订单、统计中关联订单项
+        'CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id)',
+        # 删除菜品前检查
+        'CREATE INDEX IF NOT EXISTS idx_menu_items_dish_id ON menu_items(dish_id)',
+        # 按日期查询菜单（库存账本加载当日菜单、首页日历）
+        'CREATE INDEX IF NOT EXISTS idx_menus_date_meal ON menus(menu_date, meal_type)',
+        # 被上面的复合索引或唯一约束覆盖的单列索引
+        'DROP INDEX IF EXISTS idx_orders_user_id',
+        'DROP INDEX IF EXISTS idx_orders_canteen_id',
+        'DROP INDEX IF EXISTS idx_menus_canteen_date_meal',
+        'ANALYZE',
+    ]),
+    (2, '餐次统计汇总表', [
+        '''
+        CREATE TABLE IF NOT EXISTS meal_dish_totals (
+            canteen_id INTEGER NOT NULL,
+            order_date TEXT NOT NULL,
+            meal_type TEXT NOT NULL,
+            dish_id INTEGER NOT NULL,
+            dish_name TEXT,
+            total_quantity INTEGER NOT NULL DEFAULT 0,  -- 有效订单中的总份数
+            order_count INTEGER NOT NULL DEFAULT 0,  -- 包含该菜品的有效订单数
+            PRIMARY KEY (canteen_id, order_date, meal_type, dish_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS meal_order_totals (
+            canteen_id INTEGER NOT NULL,
+            order_date TEXT NOT NULL,
+            meal_type TEXT NOT NULL,
+            total_orders INTEGER NOT NULL DEFAULT 0,  -- 有效订单数（即下单人数）
+            total_quantity INTEGER NOT NULL DEFAULT 0,  -- 总份数
+            PRIMARY KEY (canteen_id, order_date, meal_type)
+        ) WITHOUT ROWID
+        ''',
+        # 根据已有订单初始化
+        '''
+        INSERT INTO meal_dish_totals (canteen_id, order_date, meal_type, dish_id, dish_name,
+                                      total_quantity, order_count)
+        SELECT o.canteen_id, o.order_date, o.meal_type, oi.dish_id, MAX(oi.dish_name),
+               SUM(oi.quantity), COUNT(DISTINCT o.id)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.status IN ('placed', 'completed')
+        GROUP BY o.canteen_id, o.order_date, o.meal_type, oi.dish_id
+        ''',
+        '''
+        INSERT INTO meal_order_totals (canteen_id, order_date, meal_type, total_orders, total_quantity)
+        SELECT o.canteen_id, o.order_date, o.meal_type, COUNT(*),
+               COALESCE(SUM((SELECT SUM(quantity) FROM order_items WHERE order_id = o.id)), 0)
+        FROM orders o
+        WHERE o.status IN ('placed', 'completed')
+        GROUP BY o.canteen_id, o.order_date, o.meal_type
+        ''',
+    ]),
+    (3, '餐次汇总版本号（实时推送去重）', [
+        'ALTER TABLE meal_order_totals ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (4, '订单列表分页的排序索引', [
+        # 与分页排序一致，按游标翻页时无需排序，只读取一页的索引条目；
+        # 同时覆盖原先按状态过滤的查询（同一用户/食堂同一餐次的订单很少）
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_date_meal_created '
+        'ON orders(user_id, order_date, meal_type, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_canteen_date_meal_created '
+        'ON orders(canteen_id, order_date DESC, meal_type, created_at)',
+        'DROP INDEX IF EXISTS idx_orders_user_date_meal_status',
+        'DROP INDEX IF EXISTS idx_orders_canteen_date_meal_status',
+        'ANALYZE',
+    ]),
+    (5, '令牌吊销记录（多进程共享，重启后保留）', [
+        '''
+        CREATE TABLE IF NOT EXISTS token_revocations (
+            kind TEXT NOT NULL,  -- token: 单个令牌（subject为jti），user: 用户此前的全部令牌（subject为用户ID）
+            subject TEXT NOT NULL,
+            revoked_at REAL NOT NULL,
+            expires_at REAL NOT NULL,  -- 此后记录已无意义，可以删除
+            PRIMARY KEY (kind, subject)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_token_revocations_expires ON token_revocations(expires_at)',
+    ]),
+    (6, '幂等键及其响应', [
+        '''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            user_id INTEGER NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            request_hash TEXT NOT NULL,  -- 方法、路径和请求体的SHA-256
+            status_code INTEGER NOT NULL,
+            response TEXT NOT NULL,  -- 第一次请求的响应体
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (user_id, idempotency_key)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at)',
+    ]),
+    (7, '定时任务执行记录、餐次结束用的部分索引', [
+        '''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job TEXT NOT NULL,
+            trigger TEXT NOT NULL,  -- schedule: 定时, startup: 启动补执行, manual: 手动
+            status TEXT NOT NULL,  -- success / error
+            started_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            duration_ms REAL NOT NULL,
+            result TEXT,  -- 任务返回值（JSON）
+            error TEXT,
+            worker_pid INTEGER
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_job_runs_started_at ON job_runs(started_at)',
+        # 只索引未完成的订单和未关闭的菜单，随历史数据增长保持很小
+        "CREATE INDEX IF NOT EXISTS idx_orders_placed_date_meal ON orders(order_date, meal_type) "
+        "WHERE status = 'placed'",
+        "CREATE INDEX IF NOT EXISTS idx_menus_active_date_meal ON menus(menu_date, meal_type) "
+        "WHERE status = 'active'",
+    ]),
+]
+
+
+def get_schema_version(conn):
+    """
+    获取数据库当前的结构版本
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        int: 版本号，未执行过迁移时为0
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db_path=None):
+    """
+    执行尚未应用的迁移
+
+    每个迁移连同版本号更新在同一个事务中提交，失败时整体回滚，
+    可重复调用。
+
+    Args:
+        db_path (str): 数据库路径，默认config.DB_PATH
+
+    Returns:
+        list: 本次应用的迁移版本号
+    """
+    conn = sqlite3.connect(db_path or config.DB_PATH, timeout=config.DB_BUSY_TIMEOUT / 1000,
+                           isolation_level=None)
+    applied = []
+    try:
+        for version, description, statements in MIGRATIONS:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 拿到写锁后再读版本号，避免多个进程重复执行同一迁移
+                if get_schema_version(conn) >= version:
+                    conn.execute('ROLLBACK')
+                    continue
+                for sql in statements:
+                    conn.execute(sql)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            applied.append(version)
+    finally:
+        conn.close()
+    return applied
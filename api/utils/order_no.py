@@ -0,0 +1,144 @@
+# 订单号生成：Snowflake式64位ID（毫秒时间戳 + 节点号 + 序号），按时间递增，进程内生成不访问数据库
+
+import os
+import threading
+import time
+from datetime import datetime
+import config
+
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def node_id():
+    """
+    当前进程的节点号
+
+    多进程服务中由server.py为同时存活的每个worker分配不同的编号（环境变量ORDERING_NODE_ID），
+    未设置时取 config.ORDER_NO_NODE_ID，仍未配置则由进程号推出。
+
+    Returns:
+        int: 0 ~ MAX_NODE_ID
+    """
+    value = os.environ.get('ORDERING_NODE_ID')
+    if value:
+        return int(value)
+    if config.ORDER_NO_NODE_ID is not None:
+        return config.ORDER_NO_NODE_ID
+    return os.getpid() & MAX_NODE_ID
+
+
+class OrderNoGenerator:
+    """
+    Snowflake式ID生成器
+
+    ID = (距 config.ORDER_NO_EPOCH 的毫秒数 << 22) | (节点号 << 12) | 序号。
+    同一毫秒内序号用完时借用下一毫秒，不等待；系统时钟回拨时继续沿用已发出的最大时间，
+    保证进程内严格递增。不同节点的ID互不重复。
+    """
+
+    def __init__(self, node=None, epoch=None):
+        self.node = node_id() if node is None else node
+        if not 0 <= self.node <= MAX_NODE_ID:
+            raise ValueError(f'节点号必须在0到{MAX_NODE_ID}之间')
+        self.epoch = config.ORDER_NO_EPOCH if epoch is None else epoch
+        self._node_bits = self.node << SEQUENCE_BITS
+        self._last_ms = 0  # 已发出的最大时间（可能因借用而超前于系统时钟）
+        self._last_wall_ms = 0  # 观察到的最大系统时间
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.clock_backwards = 0  # 检测到时钟回拨的次数
+        self.max_skew_ms = 0  # 最大回拨毫秒数
+
+    def next_id(self):
+        """
+        生成下一个ID
+
+        Returns:
+            int: 64位正整数
+        """
+        with self._lock:
+            # 在锁内取时间：锁外取的时间可能早于其他线程刚发出的ID，被误判为时钟回拨
+            now = time.time_ns() // 1000000 - self.epoch
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                if now < self._last_wall_ms:
+                    self.clock_backwards += 1
+                    self.max_skew_ms = max(self.max_skew_ms, self._last_wall_ms - now)
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if not self._sequence:
+                    # 本毫秒序号用完，借用下一毫秒
+                    self._last_ms += 1
+            if now > self._last_wall_ms:
+                self._last_wall_ms = now
+            return (self._last_ms << (NODE_BITS + SEQUENCE_BITS)) | self._node_bits | self._sequence
+
+    def stats(self):
+        return {'node': self.node, 'clock_backwards': self.clock_backwards, 'max_skew_ms': self.max_skew_ms}
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """当前进程的生成器（fork后的子进程重新创建，使用自己的节点号）"""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = OrderNoGenerator()
+    return _generator
+
+
+def _reset_after_fork():
+    global _generator, _generator_lock
+    _generator = None
+    _generator_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def format_order_no(value):
+    """ID转为订单号：前缀 + 19位十进制（定长，字符串顺序与时间顺序一致）"""
+    return f'{config.ORDER_NO_PREFIX}{value:019d}'
+
+
+def generate():
+    """
+    生成订单号
+
+    Returns:
+        str: 订单号
+    """
+    return format_order_no(get_generator().next_id())
+
+
+def parse_order_no(order_no):
+    """
+    解析订单号
+
+    Args:
+        order_no (str): generate()生成的订单号
+
+    Returns:
+        dict: 生成时间、节点号和序号
+
+    Raises:
+        ValueError: 不是该格式的订单号
+    """
+    digits = order_no[len(config.ORDER_NO_PREFIX):]
+    if not order_no.startswith(config.ORDER_NO_PREFIX) or len(digits) != 19 or not digits.isdigit():
+        raise ValueError('订单号格式无效')
+    value = int(digits)
+    timestamp_ms = (value >> (NODE_BITS + SEQUENCE_BITS)) + config.ORDER_NO_EPOCH
+    return {
+        'created_at': datetime.fromtimestamp(timestamp_ms / 1000),
+        'node': (value >> SEQUENCE_BITS) & MAX_NODE_ID,
+        'sequence': value & MAX_SEQUENCE
+    }
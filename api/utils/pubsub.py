@@ -0,0 +1,180 @@
+# 进程内发布/订阅（Server-Sent Events 推送）
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+import config
+from utils.versions import get_version
+
+# 事件ID带上进程启动标识，进程重启后客户端的 Last-Event-ID 自动失效
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class EventHub:
+    """
+    事件中心
+
+    发布时事件只序列化一次并写入环形缓冲区，所有订阅者读取同一份文本，
+    N个连接的推送成本与1个连接相同。缓冲区同时用于断线重连时按
+    Last-Event-ID 补发错过的事件。
+    """
+
+    def __init__(self, buffer_size=None):
+        self._events = deque(maxlen=buffer_size or config.EVENT_BUFFER_SIZE)  # (seq, topic, version, text)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.subscribers = 0
+        self.published = 0
+
+    def publish(self, topic, event, data, version=None):
+        """
+        发布事件
+
+        Args:
+            topic (str): 主题
+            event (str): 事件类型
+            data (dict): 事件数据
+            version (int): 数据版本号，订阅者据此跳过快照中已包含的事件
+        """
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._cond:
+            self._seq += 1
+            text = f'id: {self.format_id(self._seq)}\nevent: {event}\ndata: {payload}\n\n'
+            self._events.append((self._seq, topic, version, text))
+            self.published += 1
+            self._cond.notify_all()
+
+    def current_seq(self):
+        """获取最新事件序号"""
+        return self._seq
+
+    def format_id(self, seq):
+        """生成事件ID"""
+        return f'{BOOT_ID}-{seq}'
+
+    def parse_id(self, event_id):
+        """
+        解析客户端传回的 Last-Event-ID
+
+        Returns:
+            int: 事件序号；格式错误或来自其他进程时返回None
+        """
+        boot_id, _, seq = (event_id or '').partition('-')
+        if boot_id != BOOT_ID or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def can_replay(self, seq):
+        """判断序号之后的事件是否仍全部在缓冲区中"""
+        with self._cond:
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            return oldest <= seq + 1 <= self._seq + 1
+
+    def _pending(self, topic, after_seq, min_version):
+        """取出序号大于after_seq的该主题事件（调用方持有锁）"""
+        pending = []
+        for seq, event_topic, version, text in reversed(self._events):
+            if seq <= after_seq:
+                break
+            if event_topic == topic and (version is None or min_version is None or version > min_version):
+                pending.append(text)
+        pending.reverse()
+        return pending
+
+    def listen(self, topic, after_seq, min_version=None, heartbeat=None):
+        """
+        订阅主题，返回SSE文本的生成器
+
+        一段时间没有该主题的事件时发送一条注释行作为心跳，既保持连接，
+        也让服务端及时发现已断开的客户端。订阅者落后太多、缓冲区中的
+        事件已被覆盖时发送reset事件并结束，客户端重新连接获取快照。
+
+        Args:
+            topic (str): 主题
+            after_seq (int): 从该序号之后开始推送
+            min_version (int): 跳过版本号不大于它的事件（已包含在快照中）
+            heartbeat (float): 心跳间隔（秒）
+        """
+        heartbeat = heartbeat or config.SSE_HEARTBEAT_INTERVAL
+        with self._cond:
+            self.subscribers += 1
+        try:
+            last_sent = time.monotonic()
+            while True:
+                with self._cond:
+                    if self._seq <= after_seq:
+                        self._cond.wait(max(0, last_sent + heartbeat - time.monotonic()))
+                    overflow = bool(self._events) and self._events[0][0] > after_seq + 1
+                    pending = self._pending(topic, after_seq, min_version)
+                    after_seq = self._seq
+                if overflow:
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                if pending:
+                    yield ''.join(pending)
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= heartbeat:
+                    yield ': ping\n\n'
+                    last_sent = time.monotonic()
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def poll(self, topic, snapshot, seen, version, heartbeat=None, interval=None):
+        """
+        跨进程订阅：定期检查主题的版本号，有变化时重新读取并推送snapshot事件
+
+        多进程服务中事件只发布到产生变更的worker，其他worker的订阅者收不到；
+        发布时同时递增与主题同名的版本号（在共享内存中，所有worker可见），
+        订阅者据此发现变更。
+
+        Args:
+            topic (str): 主题
+            snapshot (callable): 读取最新数据，返回值含数据版本号version
+            seen (int): 读取已推送快照之前的主题版本号
+            version (int): 已推送快照的数据版本号
+            heartbeat (float): 心跳间隔（秒）
+            interval (float): 检查间隔（秒）
+        """
+        heartbeat = heartbeat or config.SSE_HEARTBEAT_INTERVAL
+        interval = interval or config.SSE_POLL_INTERVAL
+        with self._cond:
+            self.subscribers += 1
+        try:
+            last_sent = time.monotonic()
+            while True:
+                time.sleep(interval)
+                current = get_version(topic)
+                if current != seen:
+                    # 先记下版本号再读取，读取期间的变更留到下一轮
+                    seen = current
+                    data = snapshot()
+                    if data['version'] != version:
+                        version = data['version']
+                        yield f'event: snapshot\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+                        last_sent = time.monotonic()
+                        continue
+                if time.monotonic() - last_sent >= heartbeat:
+                    yield ': ping\n\n'
+                    last_sent = time.monotonic()
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def stats(self):
+        """
+        获取事件中心统计
+
+        Returns:
+            dict: 订阅者数、已发布事件数和缓冲区大小
+        """
+        return {
+            'subscribers': self.subscribers,
+            'published': self.published,
+            'buffered': len(self._events)
+        }
+
+
+hub = EventHub()
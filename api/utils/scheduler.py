@@ -0,0 +1,207 @@
+# 进程内定时任务：按各任务给出的下次执行时间运行，执行记录写入 job_runs 表
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import config
+from utils.db_pool import get_pool
+from utils.storage import execute_write, worker_id
+
+
+class Job:
+    """定时任务"""
+
+    def __init__(self, name, fn, next_run, description='', run_on_start=False):
+        """
+        Args:
+            name (str): 任务名
+            fn (callable): 任务函数，返回值（可JSON序列化）记入执行记录
+            next_run (callable): 参数为当前时间，返回下次执行的datetime
+            description (str): 说明
+            run_on_start (bool): 启动时是否先执行一次（补上停机期间错过的执行）
+        """
+        self.name = name
+        self.fn = fn
+        self.next_run = next_run
+        self.description = description
+        self.run_on_start = run_on_start
+        self.scheduled_at = None  # 下次执行时间（调度线程运行时）
+        self.last_run = None
+        self.running = False
+        self._lock = threading.Lock()
+
+
+class Scheduler:
+    """定时任务调度器（一个后台线程，任务依次执行）"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, name, fn, next_run, description='', run_on_start=False):
+        """注册任务，参数见Job"""
+        self._jobs[name] = Job(name, fn, next_run, description, run_on_start)
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    @property
+    def started(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def run_job(self, name, trigger='manual'):
+        """
+        立即执行任务
+
+        Args:
+            name (str): 任务名
+            trigger (str): 触发方式，记入执行记录
+
+        Returns:
+            dict: 执行记录
+
+        Raises:
+            KeyError: 任务不存在
+            ValueError: 任务正在本进程中执行
+        """
+        job = self._jobs[name]
+        if not job._lock.acquire(blocking=False):
+            raise ValueError('任务正在执行')
+        try:
+            job.running = True
+            started_at = datetime.now()
+            start = time.perf_counter()
+            run = {'job': name, 'trigger': trigger, 'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S')}
+            try:
+                run.update(status='success', result=job.fn(), error=None)
+            except Exception as e:
+                run.update(status='error', result=None, error=f'{type(e).__name__}: {e}')
+            run['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            run['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            job.last_run = run
+        finally:
+            job.running = False
+            job._lock.release()
+
+        try:
+            self._save(run)
+        except Exception:
+            # 记录写入失败不影响任务本身
+            pass
+        return run
+
+    def _save(self, run):
+        cutoff = (datetime.now() - timedelta(days=config.SCHEDULER_HISTORY_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+
+        def write(conn):
+            conn.execute('''
+                INSERT INTO job_runs (job, trigger, status, started_at, finished_at, duration_ms,
+                                      result, error, worker_pid)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (run['job'], run['trigger'], run['status'], run['started_at'], run['finished_at'],
+                  run['duration_ms'], json.dumps(run['result'], ensure_ascii=False, default=str),
+                  run['error'], os.getpid()))
+            conn.execute('DELETE FROM job_runs WHERE started_at < ?', (cutoff,))
+
+        execute_write(write)
+
+    def _run(self):
+        now = datetime.now()
+        for job in self._jobs.values():
+            job.scheduled_at = now if job.run_on_start else job.next_run(now)
+
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            now = datetime.now()
+            for job in list(self._jobs.values()):
+                if job.scheduled_at is None:
+                    job.scheduled_at = now if job.run_on_start else job.next_run(now)
+                if job.scheduled_at <= now:
+                    trigger = 'startup' if job.last_run is None and job.run_on_start else 'schedule'
+                    try:
+                        self.run_job(job.name, trigger)
+                    except ValueError:
+                        pass
+                    job.scheduled_at = job.next_run(datetime.now())
+
+            pending = [job.scheduled_at for job in self._jobs.values() if job.scheduled_at]
+            delay = (min(pending) - datetime.now()).total_seconds() if pending else 60
+            # 最多等待60秒再重新计算，系统时间调整后也能按时执行
+            self._wakeup.wait(min(max(delay, 0), 60))
+
+    def jobs(self):
+        """
+        任务列表
+
+        Returns:
+            list: 各任务的名称、说明、下次执行时间、是否执行中和本进程最近一次执行记录
+        """
+        now = datetime.now()
+        result = []
+        for job in self._jobs.values():
+            next_run = job.scheduled_at if self.started else job.next_run(now)
+            result.append({
+                'name': job.name,
+                'description': job.description,
+                'next_run': next_run.strftime('%Y-%m-%d %H:%M:%S') if next_run else None,
+                'running': job.running,
+                'last_run': job.last_run
+            })
+        return result
+
+    def history(self, job=None, limit=50):
+        """
+        执行记录（所有进程，最新的在前）
+
+        Args:
+            job (str): 只看该任务
+            limit (int): 条数
+
+        Returns:
+            list: 执行记录
+        """
+        since = (datetime.now() - timedelta(days=config.SCHEDULER_HISTORY_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+        query = '''
+            SELECT job, trigger, status, started_at, finished_at, duration_ms, result, error, worker_pid
+            FROM job_runs WHERE started_at >= ?
+        '''
+        params = [since]
+        if job:
+            query += ' AND job = ?'
+            params.append(job)
+        query += ' ORDER BY started_at DESC, id DESC LIMIT ?'
+        params.append(limit)
+
+        conn = get_pool().acquire()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+        runs = []
+        for row in rows:
+            run = dict(zip(row.keys(), row))
+            run['result'] = json.loads(run['result']) if run['result'] else None
+            runs.append(run)
+        return runs
+
+
+scheduler = Scheduler()
+
+
+def init_scheduler():
+    """启动定时任务线程（多进程部署时只由0号worker执行）"""
+    if config.SCHEDULER_ENABLED and worker_id() in (None, 0):
+        scheduler.start()
@@ -0,0 +1,202 @@
+# 慢查询日志：超过阈值的SQL连同参数、调用位置和当时的执行计划写入滚动日志，并按语句汇总
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+import config
+
+# 可以执行 EXPLAIN QUERY PLAN 的语句
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+# 查找调用位置时跳过的模块和函数（存储层本身）
+_SKIP_FILES = ('metrics.py', 'slow_query.py', 'db_pool.py', 'storage.py')
+_SKIP_FUNCTIONS = ('get_db_connection',)
+_API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_logger = None
+_logger_lock = threading.Lock()
+_stats = {}  # 归一化语句 -> 汇总
+_stats_lock = threading.Lock()
+
+
+def log_path():
+    """
+    本进程的慢查询日志文件
+
+    RotatingFileHandler 的滚动不能在多个进程间共用同一文件，多进程服务中
+    每个worker写入带节点号的文件（如 slow_query.1.log），只滚动自己的文件。
+    节点号在同时存活的worker间互不相同，回收后复用，文件数不会增长。
+
+    Returns:
+        str: 文件路径
+    """
+    node = os.environ.get('ORDERING_NODE_ID')
+    if not node:
+        return config.SLOW_QUERY_LOG_PATH
+    root, ext = os.path.splitext(config.SLOW_QUERY_LOG_PATH)
+    return f'{root}.{node}{ext}'
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                path = log_path()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handler = RotatingFileHandler(path,
+                                              maxBytes=config.SLOW_QUERY_LOG_MAX_BYTES,
+                                              backupCount=config.SLOW_QUERY_LOG_BACKUPS,
+                                              encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger = logging.getLogger('slow_query')
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.handlers.clear()
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def _reset_after_fork():
+    # 子进程按自己的节点号重新打开日志文件
+    global _logger, _logger_lock
+    _logger = None
+    _logger_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _call_site():
+    """调用SQL的业务代码位置（跳过存储层自身和项目以外的栈帧）"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.abspath(code.co_filename)
+        if (filename.startswith(_API_DIR + os.sep) and os.path.basename(filename) not in _SKIP_FILES
+                and code.co_name not in _SKIP_FUNCTIONS):
+            return f'{os.path.relpath(filename, _API_DIR)}:{frame.f_lineno} {code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _format_params(parameters):
+    """参数转为可写入日志的值，长字符串截断"""
+    if isinstance(parameters, dict):
+        return {key: _format_params(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_format_params(value) for value in parameters]
+    if isinstance(parameters, bytes):
+        return f'<{len(parameters)} bytes>'
+    if isinstance(parameters, str) and len(parameters) > 200:
+        return parameters[:200] + '...'
+    return parameters
+
+
+def _explain(conn, sql, parameters):
+    """
+    在同一连接上获取语句的执行计划
+
+    使用基础游标执行，不会再次进入计时和慢查询记录。
+
+    Returns:
+        list: 执行计划各行的detail，无法获取时为None
+    """
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        cursor = sqlite3.Connection.cursor(conn, sqlite3.Cursor)
+        rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+        cursor.close()
+    except sqlite3.Error:
+        return None
+    return [row[3] for row in rows]
+
+
+def has_full_scan(plan):
+    """执行计划中是否有未使用索引的全表扫描"""
+    return any(detail.startswith('SCAN ') and ' USING ' not in detail for detail in plan or ())
+
+
+def record(conn, sql, statement, parameters, elapsed, batch_size=None):
+    """
+    记录一条慢查询
+
+    Args:
+        conn: 执行该语句的连接
+        sql (str): 原始SQL
+        statement (str): 归一化后的SQL（用于汇总）
+        parameters: 参数（executemany时为第一组）
+        elapsed (float): 耗时（秒）
+        batch_size (int): executemany的参数组数
+    """
+    plan = _explain(conn, sql, parameters)
+    entry = {
+        'time': datetime.now().isoformat(timespec='milliseconds'),
+        'duration_ms': round(elapsed * 1000, 3),
+        'statement': statement,
+        'params': _format_params(parameters) if config.SLOW_QUERY_LOG_PARAMS else None,
+        'call_site': _call_site(),
+        'plan': plan,
+        'full_scan': has_full_scan(plan)
+    }
+    if batch_size is not None:
+        entry['batch_size'] = batch_size
+
+    with _stats_lock:
+        stats = _stats.get(statement)
+        if stats is None:
+            if len(_stats) >= config.SLOW_QUERY_MAX_STATEMENTS:
+                stats = None
+            else:
+                stats = _stats[statement] = {'statement': statement, 'count': 0, 'total_ms': 0.0,
+                                             'max_ms': 0.0}
+        if stats is not None:
+            stats['count'] += 1
+            stats['total_ms'] += entry['duration_ms']
+            if entry['duration_ms'] >= stats['max_ms']:
+                # 保留最慢一次的现场
+                stats.update(max_ms=entry['duration_ms'], params=entry['params'],
+                             call_site=entry['call_site'], plan=plan, full_scan=entry['full_scan'],
+                             last_seen=entry['time'])
+            else:
+                stats['last_seen'] = entry['time']
+
+    try:
+        _get_logger().info(json.dumps(entry, ensure_ascii=False, default=str))
+    except OSError:
+        pass
+
+
+def top(limit=20, sort='total'):
+    """
+    按语句汇总的最慢SQL
+
+    Args:
+        limit (int): 返回条数
+        sort (str): total（累计耗时）、max（单次最长）或 count（次数）
+
+    Returns:
+        list: 汇总记录，含次数、累计/平均/最长耗时，以及最慢一次的参数、调用位置和执行计划
+    """
+    key = {'total': 'total_ms', 'max': 'max_ms', 'count': 'count'}.get(sort)
+    if key is None:
+        raise ValueError('排序方式无效')
+    with _stats_lock:
+        items = [dict(stats) for stats in _stats.values()]
+    items.sort(key=lambda stats: stats[key], reverse=True)
+    for stats in items[:limit]:
+        stats['total_ms'] = round(stats['total_ms'], 3)
+        stats['avg_ms'] = round(stats['total_ms'] / stats['count'], 3)
+    return items[:limit]
+
+
+def reset():
+    """清空汇总（日志文件不受影响）"""
+    with _stats_lock:
+        _stats.clear()
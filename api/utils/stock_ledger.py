@@ -0,0 +1,394 @@
+# 当日菜单热点库存账本（内存扣减 + 批量回写）
+
+import threading
+from datetime import datetime
+import config
+from utils.storage import execute_write
+from utils.versions import bump
+
+
+class StockLedger:
+    """
+    当日菜单的内存库存账本
+
+    以 (menu_id, dish_id) 为键保存可用数量，下单时在分段锁内原子地检查并扣减，
+    变更只标记为脏数据，由后台线程批量回写 menu_items.available_quantity。
+    账本加载时以 quantity - 有效订单项数量 为准，与 order_items 对账。
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or config.STOCK_LEDGER_FLUSH_INTERVAL
+        self._entries = {}  # (menu_id, dish_id) -> {'name', 'quantity', 'available'}
+        self._menus = {}  # menu_id -> menu_date
+        self._dirty = set()
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._meta_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'reserves': 0, 'rejects': 0, 'releases': 0, 'flushes': 0, 'flushed_rows': 0}
+
+    # ------------------------------------------------------------
+    # 加载与对账
+    # ------------------------------------------------------------
+
+    def _today(self):
+        return datetime.now().strftime('%Y-%m-%d')
+
+    def tracks(self, menu_id, menu_date):
+        """
+        判断菜单是否由账本管理（当日菜单首次访问时自动加载）
+
+        Args:
+            menu_id (int): 菜单ID
+            menu_date (str): 菜单日期 (YYYY-MM-DD)
+
+        Returns:
+            bool: True表示库存以账本为准
+        """
+        # 已加载的菜单必须始终经由账本扣减，否则回写会覆盖数据库中的变更
+        if menu_id in self._menus:
+            return True
+        if menu_date != self._today():
+            return False
+        self.load_menus([menu_id])
+        return menu_id in self._menus
+
+    def recover(self):
+        """
+        启动时加载当日未关闭的菜单
+
+        Returns:
+            int: 加载的菜单数
+        """
+        def load(conn):
+            rows = conn.execute("SELECT id FROM menus WHERE menu_date = ? AND status = 'active'",
+                                (self._today(),)).fetchall()
+            return [row['id'] for row in rows]
+
+        menu_ids = execute_write(load)
+        self.load_menus(menu_ids)
+        return len(menu_ids)
+
+    def load_menus(self, menu_ids):
+        """
+        从数据库加载菜单库存并与订单项对账
+
+        在写线程中执行，与进程内所有订单写事务串行，读到的库存和订单项是一致的快照。
+
+        Args:
+            menu_ids (list): 菜单ID列表
+        """
+        menu_ids = [menu_id for menu_id in menu_ids if menu_id not in self._menus]
+        if not menu_ids:
+            return
+        execute_write(lambda conn: self._load(conn, menu_ids))
+
+    def _load(self, conn, menu_ids):
+        placeholders = ','.join('?' * len(menu_ids))
+        items = conn.execute(f'''
+            SELECT m.id as menu_id, m.menu_date, mi.dish_id, mi.quantity,
+                   mi.available_quantity, d.name
+            FROM menus m
+            JOIN menu_items mi ON mi.menu_id = m.id
+            LEFT JOIN dishes d ON mi.dish_id = d.id
+            WHERE m.id IN ({placeholders})
+        ''', menu_ids).fetchall()
+
+        ordered = conn.execute(f'''
+            SELECT o.menu_id, oi.dish_id, SUM(oi.quantity) as ordered
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.menu_id IN ({placeholders}) AND o.status IN ('placed', 'completed')
+            GROUP BY o.menu_id, oi.dish_id
+        ''', menu_ids).fetchall()
+        ordered = {(row['menu_id'], row['dish_id']): row['ordered'] for row in ordered}
+
+        menus = {}
+        with self._meta_lock:
+            for item in items:
+                key = (item['menu_id'], item['dish_id'])
+                if item['menu_id'] in self._menus:
+                    continue
+                available = item['quantity'] - ordered.get(key, 0)
+                self._entries[key] = {
+                    'name': item['name'],
+                    'quantity': item['quantity'],
+                    'available': available
+                }
+                if available != item['available_quantity']:
+                    self._dirty.add(key)
+                menus[item['menu_id']] = item['menu_date']
+            self._menus.update(menus)
+        # 对账后的可用数量可能与数据库不同，使已缓存的库存失效
+        bump(*[f'stock:{menu_id}' for menu_id in menus])
+
+    def drop_menu(self, menu_id):
+        """
+        将菜单移出账本（先回写未落库的数据）
+
+        Args:
+            menu_id (int): 菜单ID
+        """
+        if menu_id not in self._menus:
+            return
+        self.flush()
+        self._forget(menu_id)
+
+    def reload_menu(self, menu_id):
+        """
+        从数据库重新加载菜单，丢弃账本中尚未提交的调整
+
+        加载时与订单项对账，不需要先回写。
+
+        Args:
+            menu_id (int): 菜单ID
+        """
+        self._forget(menu_id)
+        self.load_menus([menu_id])
+
+    def _forget(self, menu_id):
+        with self._meta_lock:
+            self._menus.pop(menu_id, None)
+            for key in [key for key in self._entries if key[0] == menu_id]:
+                del self._entries[key]
+                self._dirty.discard(key)
+
+    # ------------------------------------------------------------
+    # 预占与退回
+    # ------------------------------------------------------------
+
+    def _lock_keys(self, keys):
+        """按固定顺序获取分段锁，避免死锁"""
+        stripes = sorted({hash(key) % self.LOCK_STRIPES for key in keys})
+        locks = [self._locks[i] for i in stripes]
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    def _apply(self, menu_id, deltas, check=True):
+        """
+        原子地应用库存变化
+
+        Args:
+            menu_id (int): 菜单ID
+            deltas (dict): 菜品ID -> 数量变化（负数为扣减）
+            check (bool): 是否检查库存不为负
+
+        Raises:
+            ValueError: 菜品不在菜单中或库存不足
+        """
+        keys = [(menu_id, dish_id) for dish_id in deltas]
+        locks = self._lock_keys(keys)
+        try:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    raise ValueError(f'菜品ID {key[1]} 不在菜单中')
+                if check and entry['available'] + deltas[key[1]] < 0:
+                    self._stats['rejects'] += 1
+                    raise ValueError(f'菜品 {entry["name"]} 库存不足')
+            for key in keys:
+                self._entries[key]['available'] += deltas[key[1]]
+        finally:
+            for lock in locks:
+                lock.release()
+        with self._meta_lock:
+            self._dirty.update(keys)
+
+    def reserve(self, menu_id, quantities):
+        """
+        预占库存
+
+        Args:
+            menu_id (int): 菜单ID
+            quantities (dict): 菜品ID -> 数量
+        """
+        self._apply(menu_id, {dish_id: -quantity for dish_id, quantity in quantities.items()})
+        self._stats['reserves'] += 1
+
+    def release(self, menu_id, quantities):
+        """
+        退回库存
+
+        Args:
+            menu_id (int): 菜单ID
+            quantities (dict): 菜品ID -> 数量
+        """
+        self._apply(menu_id, dict(quantities), check=False)
+        self._stats['releases'] += 1
+
+    def exchange(self, menu_id, old_quantities, new_quantities, check=True):
+        """
+        原子地退回旧数量并预占新数量（用于修改订单）
+
+        Args:
+            menu_id (int): 菜单ID
+            old_quantities (dict): 退回的 菜品ID -> 数量
+            new_quantities (dict): 预占的 菜品ID -> 数量
+            check (bool): 是否检查库存不为负
+        """
+        deltas = dict(old_quantities)
+        for dish_id, quantity in new_quantities.items():
+            deltas[dish_id] = deltas.get(dish_id, 0) - quantity
+        self._apply(menu_id, deltas, check=check)
+
+    def adjust(self, menu_id, dish_id, delta, name=None, quantity_delta=0, check=True):
+        """
+        管理端调整库存（追加菜品、修改总量）
+
+        菜单未被账本管理时直接忽略；菜品不存在则新增条目。
+
+        Args:
+            menu_id (int): 菜单ID
+            dish_id (int): 菜品ID
+            delta (int): 可用数量变化
+            name (str): 菜品名称（新增条目时使用）
+            quantity_delta (int): 总数量变化
+            check (bool): 是否检查可用数量不为负
+
+        Raises:
+            ValueError: 调整后可用数量为负
+        """
+        if menu_id not in self._menus:
+            return
+        key = (menu_id, dish_id)
+        locks = self._lock_keys([key])
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = {'name': name, 'quantity': quantity_delta, 'available': delta}
+            else:
+                if check and entry['available'] + delta < 0:
+                    raise ValueError('新数量不能小于已使用数量')
+                entry['available'] += delta
+                entry['quantity'] += quantity_delta
+        finally:
+            for lock in locks:
+                lock.release()
+        with self._meta_lock:
+            self._dirty.add(key)
+
+    def discard(self, menu_id, dish_id):
+        """删除菜单项时移除条目"""
+        with self._meta_lock:
+            self._entries.pop((menu_id, dish_id), None)
+            self._dirty.discard((menu_id, dish_id))
+
+    def get_available(self, menu_id):
+        """
+        获取菜单内各菜品的可用数量
+
+        Args:
+            menu_id (int): 菜单ID
+
+        Returns:
+            dict: 菜品ID -> 可用数量；菜单未被账本管理时返回None
+        """
+        if menu_id not in self._menus:
+            return None
+        return {key[1]: entry['available'] for key, entry in list(self._entries.items())
+                if key[0] == menu_id}
+
+    # ------------------------------------------------------------
+    # 批量回写
+    # ------------------------------------------------------------
+
+    def flush(self):
+        """
+        将脏数据批量回写 menu_items.available_quantity
+
+        Returns:
+            int: 回写行数
+        """
+        with self._meta_lock:
+            keys = list(self._dirty)
+            self._dirty.clear()
+        if not keys:
+            return 0
+
+        rows = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None:
+                rows.append((entry['available'], key[0], key[1]))
+
+        def write(conn):
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            conn.executemany('''
+                UPDATE menu_items
+                SET available_quantity = ?, updated_at = ?
+                WHERE menu_id = ? AND dish_id = ?
+            ''', [(available, now, menu_id, dish_id) for available, menu_id, dish_id in rows])
+
+        try:
+            execute_write(write)
+        except Exception:
+            with self._meta_lock:
+                self._dirty.update(keys)
+            raise
+
+        self._stats['flushes'] += 1
+        self._stats['flushed_rows'] += len(rows)
+        return len(rows)
+
+    def start(self):
+        """启动后台回写线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stock-ledger-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程并回写剩余数据"""
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def stats(self):
+        """
+        获取账本统计
+
+        Returns:
+            dict: 菜单数、条目数、待回写数及操作计数
+        """
+        result = dict(self._stats)
+        result.update({
+            'menus': len(self._menus),
+            'entries': len(self._entries),
+            'dirty': len(self._dirty)
+        })
+        return result
+
+
+_ledger = None
+
+
+def get_ledger():
+    """
+    获取进程内的库存账本
+
+    Returns:
+        StockLedger: 账本；未启用时返回None
+    """
+    return _ledger
+
+
+def init_ledger():
+    """启用库存账本：从数据库恢复当日菜单并启动回写线程"""
+    global _ledger
+    if not config.STOCK_LEDGER_ENABLED or _ledger is not None:
+        return _ledger
+    ledger = StockLedger()
+    ledger.recover()
+    ledger.start()
+    _ledger = ledger
+    return _ledger
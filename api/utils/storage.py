@@ -0,0 +1,362 @@
+# 存储配置层：WAL、PRAGMA调优、定期检查点和专用写线程
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+import config
+from utils import metrics
+from utils.migrations import migrate
+
+
+def connection_pragmas():
+    """
+    每个连接需要执行的PRAGMA（由config.py驱动）
+
+    Returns:
+        dict: PRAGMA名称 -> 值
+    """
+    pragmas = dict(config.DB_PRAGMAS)
+    pragmas.update({
+        'synchronous': config.DB_SYNCHRONOUS,
+        'busy_timeout': config.DB_BUSY_TIMEOUT,
+        'mmap_size': config.DB_MMAP_SIZE,
+        'cache_size': config.DB_CACHE_SIZE
+    })
+    return pragmas
+
+
+def open_connection(db_path=None, isolation_level=''):
+    """
+    打开一个已完成PRAGMA初始化的连接
+
+    Args:
+        db_path (str): 数据库路径，默认config.DB_PATH
+        isolation_level: 传给sqlite3.connect，None表示由调用方自行管理事务
+
+    Returns:
+        sqlite3.Connection: 数据库连接
+    """
+    # 开启运行指标或慢查询日志时，使用记录每条语句耗时的连接
+    factory = metrics.InstrumentedConnection if metrics.InstrumentedConnection.enabled() else sqlite3.Connection
+    conn = sqlite3.connect(db_path or config.DB_PATH,
+                           timeout=config.DB_BUSY_TIMEOUT / 1000,
+                           isolation_level=isolation_level,
+                           check_same_thread=False,
+                           factory=factory)
+    conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
+    for name, value in connection_pragmas().items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    if config.ARCHIVE_ENABLED:
+        # 归档库：文件不存在时自动创建，表结构由 archive.init_archive 建立；
+        # 订单先复制到归档库提交后才从热库删除，归档库每次提交都需落盘
+        conn.execute('ATTACH DATABASE ? AS archive', (config.ARCHIVE_DB_PATH,))
+        conn.execute(f'PRAGMA archive.synchronous = {config.ARCHIVE_SYNCHRONOUS}')
+    return conn
+
+
+def configure_database(db_path=None):
+    """
+    设置数据库级别的持久化选项（journal_mode）
+
+    Returns:
+        str: 生效的journal_mode
+    """
+    conn = sqlite3.connect(db_path or config.DB_PATH, timeout=config.DB_BUSY_TIMEOUT / 1000)
+    try:
+        mode = conn.execute(f'PRAGMA journal_mode = {config.DB_JOURNAL_MODE}').fetchone()[0]
+    finally:
+        conn.close()
+    return mode
+
+
+class Checkpointer:
+    """后台定期执行WAL检查点，避免WAL文件无限增长"""
+
+    def __init__(self, interval=None, mode=None):
+        self.interval = interval or config.DB_CHECKPOINT_INTERVAL
+        self.mode = mode or config.DB_CHECKPOINT_MODE
+        self.last_result = None
+        self.runs = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='db-checkpointer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def checkpoint(self):
+        """
+        立即执行一次检查点
+
+        Returns:
+            tuple: (busy, wal页数, 已写回页数)
+        """
+        conn = open_connection()
+        try:
+            row = conn.execute(f'PRAGMA wal_checkpoint({self.mode})').fetchone()
+            self.last_result = tuple(row)
+            self.runs += 1
+            return self.last_result
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.checkpoint()
+            except sqlite3.Error:
+                pass
+
+
+class DatabaseWriter:
+    """
+    专用写线程
+
+    所有写事务排队交给同一个线程、同一个连接执行，
+    进程内写操作互不竞争数据库锁，读连接在WAL模式下不受阻塞。
+    排队的任务按批合并为一个事务提交，高峰期每次提交分摊到多个任务。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, fn):
+        """
+        提交写任务
+
+        Args:
+            fn (callable): fn(conn)，在 BEGIN IMMEDIATE 事务内执行
+
+        Returns:
+            Future: 任务结果
+        """
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # 写线程内嵌套调用，直接在当前事务内执行
+            try:
+                future.set_result(fn(self._conn))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self.start()
+        self._queue.put((fn, future, time.perf_counter()))
+        return future
+
+    def execute(self, fn):
+        """提交写任务并等待结果（异常原样抛出）"""
+        return self.submit(fn).result()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._execute_batch(batch)
+            except BaseException as e:
+                # 任何意外都不能让写线程退出：同批未完成的任务以该异常结束，换一个新连接继续
+                self._fail(batch, e)
+                self._reset_connection()
+
+    def _next_batch(self):
+        """
+        取出一批写任务：阻塞等待第一个，再取出队列中已有的任务
+
+        最多取 config.DB_WRITE_BATCH_SIZE 个；DB_WRITE_BATCH_WAIT 大于0时，
+        队列为空也会再等待这么久以凑成更大的批次。
+
+        Returns:
+            list: [(fn, future)]，已取消的任务不包含在内
+        """
+        tasks = [self._queue.get()]
+        deadline = time.perf_counter() + config.DB_WRITE_BATCH_WAIT
+        while len(tasks) < config.DB_WRITE_BATCH_SIZE:
+            timeout = deadline - time.perf_counter()
+            try:
+                tasks.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        now = time.perf_counter()
+        batch = []
+        for fn, future, queued_at in tasks:
+            if future.set_running_or_notify_cancel():
+                batch.append((fn, future))
+                if config.METRICS_ENABLED:
+                    metrics.WRITE_QUEUE_WAIT.observe((), now - queued_at)
+        return batch
+
+    def _execute_batch(self, batch):
+        """
+        在同一个事务中执行一批写任务（组提交）
+
+        每个任务在各自的保存点内执行，任务抛出异常时只回滚该任务，
+        不影响同批其他任务；全部执行完后只提交一次，提交成功后才把
+        结果交给各调用方。提交失败时同批任务全部以该异常结束。
+        """
+        started_at = time.perf_counter()
+        if config.METRICS_ENABLED:
+            metrics.WRITE_BATCH_SIZE.observe((), len(batch))
+        try:
+            if self._conn is None:
+                self._conn = open_connection(isolation_level=None)
+            self._conn.execute('BEGIN IMMEDIATE')
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        applied = []  # (future, 结果)
+        for index, (fn, future) in enumerate(batch):
+            try:
+                self._conn.execute('SAVEPOINT write_task')
+                result = fn(self._conn)
+                self._conn.execute('RELEASE write_task')
+                applied.append((future, result))
+            except BaseException as e:
+                future.set_exception(e)
+                if not self._rollback_task():
+                    # 事务已被SQLite整体回滚（如磁盘已满），同批已执行的任务一并失败，其余任务重新开始
+                    error = sqlite3.OperationalError('写事务已中止，请重试')
+                    for applied_future, _ in applied:
+                        applied_future.set_exception(error)
+                    if index + 1 < len(batch):
+                        self._execute_batch(batch[index + 1:])
+                    return
+
+        try:
+            self._conn.execute('COMMIT')
+        except BaseException as e:
+            self._abort()
+            for future, _ in applied:
+                future.set_exception(e)
+        else:
+            for future, result in applied:
+                future.set_result(result)
+        if config.METRICS_ENABLED:
+            metrics.WRITE_TRANSACTION.observe((), time.perf_counter() - started_at)
+
+    def _rollback_task(self):
+        """
+        回滚到当前任务的保存点
+
+        Returns:
+            bool: 事务仍然有效时返回True
+        """
+        try:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK TO write_task')
+                self._conn.execute('RELEASE write_task')
+                return True
+        except sqlite3.Error:
+            self._abort()
+        return False
+
+    def _abort(self):
+        """回滚整个事务；ROLLBACK本身失败时丢弃连接，下一批重新打开"""
+        try:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+        except sqlite3.Error:
+            self._reset_connection()
+
+    def _reset_connection(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    @staticmethod
+    def _fail(batch, error):
+        """尚未完成的任务以error结束"""
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
+_writer = DatabaseWriter()
+_checkpointer = Checkpointer()
+
+
+def get_writer():
+    """获取进程内的专用写线程"""
+    return _writer
+
+
+def execute_write(fn):
+    """
+    在专用写线程中以 BEGIN IMMEDIATE 事务执行fn(conn)
+
+    fn正常返回则提交，抛出异常则回滚并将异常抛给调用方。
+
+    Args:
+        fn (callable): 写事务函数，参数为数据库连接
+
+    Returns:
+        fn的返回值
+    """
+    return _writer.execute(fn)
+
+
+def worker_id():
+    """
+    当前进程在多进程服务中的worker编号（由server.py通过环境变量ORDERING_WORKER_ID传入）
+
+    Returns:
+        int: worker编号，单进程运行时为None
+    """
+    value = os.environ.get('ORDERING_WORKER_ID')
+    return int(value) if value else None
+
+
+def init_storage():
+    """
+    初始化存储层：执行结构迁移、设置journal_mode并启动检查点线程
+
+    多进程部署时只由0号worker执行检查点。
+
+    Returns:
+        str: 生效的journal_mode
+    """
+    migrate()
+    mode = configure_database()
+    if mode.upper() == 'WAL' and config.DB_CHECKPOINT_INTERVAL and worker_id() in (None, 0):
+        _checkpointer.start()
+    return mode
+
+
+def storage_stats():
+    """
+    获取存储层状态
+
+    Returns:
+        dict: 写队列长度、检查点次数及最近一次结果
+    """
+    return {
+        'journal_mode': config.DB_JOURNAL_MODE,
+        'write_queue': _writer._queue.qsize(),
+        'checkpoints': _checkpointer.runs,
+        'last_checkpoint': _checkpointer.last_result
+    }
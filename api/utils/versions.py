@@ -0,0 +1,101 @@
+# 数据版本计数器（缓存键与ETag的失效依据）
+
+import multiprocessing
+import threading
+import time
+import zlib
+from multiprocessing.sharedctypes import RawArray
+import config
+
+_versions = {}
+_modified = {}
+_lock = threading.Lock()
+_shared = None  # 多进程模式：(版本号数组, 修改时间数组, 跨进程锁)
+
+# 进程启动时间：从未变更过的数据以此作为最后修改时间
+BOOT_TIME = time.time()
+
+
+def get_version(name):
+    """
+    获取数据版本号
+
+    Args:
+        name (str): 版本名称，如表名 'dishes' 或单个对象 'menu:1'
+
+    Returns:
+        int: 版本号，从未变更过时为0
+    """
+    if _shared:
+        return _shared[0][_slot(name)]
+    return _versions.get(name, 0)
+
+
+def get_versions(*names):
+    """
+    获取多个版本号
+
+    Returns:
+        tuple: 与names一一对应的版本号
+    """
+    if _shared:
+        return tuple(_shared[0][_slot(name)] for name in names)
+    return tuple(_versions.get(name, 0) for name in names)
+
+
+def last_modified(*names):
+    """
+    获取多个数据中最近一次变更的时间
+
+    Returns:
+        float: 时间戳，均未变更过时为进程启动时间
+    """
+    if _shared:
+        return max([_shared[1][_slot(name)] for name in names] + [BOOT_TIME])
+    return max([_modified.get(name, BOOT_TIME) for name in names] + [BOOT_TIME])
+
+
+def bump(*names):
+    """
+    数据变更后递增版本号，使依赖它的缓存键全部失效
+
+    Args:
+        *names: 版本名称
+    """
+    now = time.time()
+    if _shared:
+        versions, modified, lock = _shared
+        with lock:
+            for name in names:
+                slot = _slot(name)
+                versions[slot] += 1
+                modified[slot] = now
+        return
+    with _lock:
+        for name in names:
+            _versions[name] = _versions.get(name, 0) + 1
+            _modified[name] = now
+
+
+def shared():
+    """版本号是否在进程间共享（多进程服务）"""
+    return _shared is not None
+
+
+def share_between_processes(slots=None):
+    """
+    改为在共享内存中保存版本号（多进程服务在派生worker之前调用）
+
+    版本名称按哈希映射到固定数量的槽位，任一进程递增后所有进程立即可见；
+    不同名称落在同一槽位时只会多失效一些缓存，不影响正确性。
+
+    Args:
+        slots (int): 槽位数，默认config.VERSION_SLOTS
+    """
+    global _shared
+    slots = slots or config.VERSION_SLOTS
+    _shared = (RawArray('Q', slots), RawArray('d', slots), multiprocessing.Lock())
+
+
+def _slot(name):
+    return zlib.crc32(name.encode()) % len(_shared[0])
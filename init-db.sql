@@ -93,7 +93,7 @@ CREATE TABLE IF NOT EXISTS menus (
     canteen_id INTEGER NOT NULL,
     menu_date TEXT NOT NULL,  -- YYYY-MM-DD
     meal_type TEXT NOT NULL,  -- breakfast: 早餐, lunch: 午餐, dinner: 晚餐
-    status TEXT DEFAULT 'active',  -- active: 启用, inactive: 禁用
+    status TEXT DEFAULT 'active',  -- active: 启用, inactive: 禁用, closed: 餐次已结束
     created_at TEXT NOT NULL,
     updated_at TEXT NOT NULL,
     FOREIGN KEY (canteen_id) REFERENCES canteens(id),
@@ -9,8 +9,8 @@ echo "========================================"
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 cd "$SCRIPT_DIR"
 
-# 创建pids目录
-mkdir -p pids
+# 创建pids和日志目录
+mkdir -p pids logs
 
 # 激活Conda环境
 echo "激活Conda环境: ordering-system"
@@ -34,11 +34,26 @@ if [ ! -f "./data/ordering_system.db" ]; then
     cd ..
 fi
 
-# 启动API服务
+# 令牌签名密钥：未设置环境变量时使用 data/token_secret 中的随机密钥（首次启动时生成）
+if [ -z "$ORDERING_TOKEN_SECRET" ]; then
+    if [ ! -f "./data/token_secret" ]; then
+        echo "生成令牌签名密钥: data/token_secret"
+        (umask 077 && python -c "import secrets; print(secrets.token_urlsafe(32))" > ./data/token_secret)
+    fi
+    export ORDERING_TOKEN_SECRET=$(cat ./data/token_secret)
+fi
+
+# 启动API服务（运行模式见config.py的SERVER_MODE，可用环境变量ORDERING_SERVER_MODE覆盖）
 echo "----------------------------------------"
-echo "启动API服务 (端口: 8082)..."
 cd api
-nohup python app.py > ../logs/api.log 2>&1 &
+SERVER_MODE=$(python -c "import config; print(config.SERVER_MODE)")
+if [ "$SERVER_MODE" = "prefork" ]; then
+    echo "启动API服务 (端口: 8082, 多进程模式)..."
+    nohup python server.py > ../logs/api.log 2>&1 &
+else
+    echo "启动API服务 (端口: 8082, 开发模式)..."
+    nohup python app.py > ../logs/api.log 2>&1 &
+fi
 API_PID=$!
 echo $API_PID > ../pids/api.pid
 echo "API服务已启动 (PID: $API_PID)"
@@ -76,6 +91,7 @@ echo "员工端:      http://localhost:8081"
 echo "========================================"
 echo "查看日志:"
 echo "  API日志:      tail -f logs/api.log"
+echo "  慢查询日志:   tail -f logs/slow_query.log"
 echo "  管理端日志:   tail -f logs/admin-web.log"
 echo "  员工端日志:   tail -f logs/user-web.log"
 echo "========================================"
@@ -9,11 +9,15 @@ echo "========================================"
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 cd "$SCRIPT_DIR"
 
-# 停止API服务
+# 停止API服务（多进程模式下主进程会等待worker处理完进行中的请求）
 if [ -f "./pids/api.pid" ]; then
     API_PID=$(cat ./pids/api.pid)
     if ps -p $API_PID > /dev/null 2>&1; then
         kill $API_PID
+        for i in $(seq 1 40); do
+            ps -p $API_PID > /dev/null 2>&1 || break
+            sleep 1
+        done
         echo "API服务已停止 (PID: $API_PID)"
     else
         echo "API服务未运行"
@@ -10,6 +10,27 @@ let cart = {};
 const $ = (selector) => document.querySelector(selector);
 const $$ = (selector) => document.querySelectorAll(selector);
 
+// 生成幂等键：同一次提交的重试复用同一个键，服务端只执行一次
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// 尚未得到服务端答复的提交（网络错误、超时）：请求体相同则沿用上次的幂等键
+const pendingKeys = {};
+
+function idempotencyKeyFor(action, body) {
+    const pending = pendingKeys[action];
+    if (pending && pending.body === body) {
+        return pending.key;
+    }
+    const key = newIdempotencyKey();
+    pendingKeys[action] = { body, key };
+    return key;
+}
+
 // API请求封装
 async function apiRequest(url, options = {}) {
     const headers = {
@@ -18,7 +39,7 @@ async function apiRequest(url, options = {}) {
     };
     
     if (currentUser) {
-        headers['X-User-Id'] = currentUser.id;
+        headers['Authorization'] = `Bearer ${currentUser.token}`;
     }
     
     try {
@@ -30,7 +51,14 @@ async function apiRequest(url, options = {}) {
         const data = await response.json();
         
         if (data.code !== 0) {
-            throw new Error(data.message);
+            const error = new Error(data.message);
+            error.code = data.code;
+            // 限流或服务繁忙：请求未执行，稍后可原样重试
+            if (response.status === 429 || response.status === 503) {
+                error.retryAfter = Number(response.headers.get('Retry-After')) || 1;
+                error.message = `${data.message}（请${error.retryAfter}秒后重试）`;
+            }
+            throw error;
         }
         
         return data.data;
@@ -72,6 +100,14 @@ $('#loginForm').addEventListener('submit', async (e) => {
 
 // 退出登录
 $('#logoutBtn').addEventListener('click', () => {
+    // 吊销服务端令牌（失败不影响本地退出）
+    if (currentUser) {
+        fetch(`${API_BASE_URL}/auth/logout`, {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${currentUser.token}` }
+        }).catch(() => {});
+    }
+    
     currentUser = null;
     selectedCanteen = null;
     cart = {};
@@ -141,32 +177,47 @@ async function loadHomePage() {
     }
 }
 
-// 加载日历视图
+// 加载日历视图（一次请求获取7天各餐次的可订情况）
 async function loadCalendarView() {
-    const dates = [];
-    const today = new Date();
+    const mealNames = {'breakfast': '早餐', 'lunch': '午餐', 'dinner': '晚餐'};
     
-    // 显示今天和未来6天
-    for (let i = 0; i < 7; i++) {
-        const date = new Date(today);
-        date.setDate(today.getDate() + i);
-        dates.push(date);
-    }
-    
-    const html = dates.map(date => {
-        const dateStr = date.toISOString().split('T')[0];
-        const dayStr = date.toLocaleDateString('zh-CN', { month: '2-digit', day: '2-digit' });
-        const weekday = ['日', '一', '二', '三', '四', '五', '六'][date.getDay()];
+    try {
+        const days = await apiRequest('/calendar?days=7');
         
-        return `
-            <div class="calendar-item" onclick="selectDate('${dateStr}')">
-                <div class="date">${dayStr} 周${weekday}</div>
-                <div class="meals">可预订餐次</div>
-            </div>
-        `;
-    }).join('');
-    
-    $('#calendarView').innerHTML = html;
+        const html = days.map(day => {
+            const date = new Date(`${day.date}T00:00:00`);
+            const dayStr = date.toLocaleDateString('zh-CN', { month: '2-digit', day: '2-digit' });
+            const weekday = ['日', '一', '二', '三', '四', '五', '六'][date.getDay()];
+            
+            const meals = Object.keys(mealNames).map(mealType => {
+                const meal = day.meals[mealType];
+                let status;
+                if (meal.order) {
+                    status = '已预订';
+                } else if (meal.menus.length === 0) {
+                    status = '无菜单';
+                } else if (!meal.can_order) {
+                    status = '已截止';
+                } else if (meal.available_quantity <= 0) {
+                    status = '已售罄';
+                } else {
+                    status = `余${meal.available_quantity}份`;
+                }
+                return `<div>${mealNames[mealType]}: ${status}</div>`;
+            }).join('');
+            
+            return `
+                <div class="calendar-item" onclick="selectDate('${day.date}')">
+                    <div class="date">${dayStr} 周${weekday}</div>
+                    <div class="meals">${meals}</div>
+                </div>
+            `;
+        }).join('');
+        
+        $('#calendarView').innerHTML = html;
+    } catch (error) {
+        // 错误已处理
+    }
 }
 
 // 选择食堂
@@ -307,17 +358,23 @@ $('#submitOrderBtn').addEventListener('click', async () => {
     const orderDate = $('#orderDate').value;
     const mealType = $('#mealType').value;
     
+    const body = JSON.stringify({
+        canteen_id: selectedCanteen.id,
+        menu_id: selectedMenuId,
+        meal_type: mealType,
+        order_date: orderDate,
+        items
+    });
+    const submitBtn = $('#submitOrderBtn');
+    submitBtn.disabled = true;
+    
     try {
         await apiRequest('/orders', {
             method: 'POST',
-            body: JSON.stringify({
-                canteen_id: selectedCanteen.id,
-                menu_id: selectedMenuId,
-                meal_type: mealType,
-                order_date: orderDate,
-                items
-            })
+            headers: { 'Idempotency-Key': idempotencyKeyFor('createOrder', body) },
+            body
         });
+        delete pendingKeys.createOrder;
         
         alert('下单成功！');
         
@@ -333,7 +390,12 @@ $('#submitOrderBtn').addEventListener('click', async () => {
         
         loadMyOrders();
     } catch (error) {
-        // 错误已处理
+        // 错误已处理；服务端已执行并答复的业务错误（如库存不足）下次提交使用新键
+        if (error.code !== undefined && error.retryAfter === undefined) {
+            delete pendingKeys.createOrder;
+        }
+    } finally {
+        submitBtn.disabled = false;
     }
 });
 
@@ -348,66 +410,94 @@ $$('.filter-btn').forEach(btn => {
     });
 });
 
-// 加载我的订单
+// 加载我的订单（按游标分页，点击“加载更多”追加下一页）
+let ordersStatus = '';
+let ordersCursor = null;
+
+function renderOrderCards(orders) {
+    const mealTypeMap = {
+        'breakfast': '早餐',
+        'lunch': '午餐',
+        'dinner': '晚餐'
+    };
+    
+    const statusMap = {
+        'placed': '已下单',
+        'cancelled': '已取消',
+        'completed': '已完成'
+    };
+    
+    return orders.map(order => {
+        const canCancel = order.status === 'placed';
+        
+        return `
+            <div class="order-card">
+                <div class="order-header-info">
+                    <span class="order-no">订单号: ${order.order_no}</span>
+                    <span class="order-status status-${order.status}">${statusMap[order.status]}</span>
+                </div>
+                <div class="order-details">
+                    <p>📍 ${order.canteen_name}</p>
+                    <p>📅 ${order.order_date} ${mealTypeMap[order.meal_type]}</p>
+                    <p>💰 金额: ¥${order.total_amount.toFixed(2)}</p>
+                    <p>🕐 下单时间: ${order.created_at}</p>
+                </div>
+                ${canCancel ? `
+                    <div class="order-actions">
+                        <button onclick="viewOrderDetail(${order.id})">查看详情</button>
+                        <button class="btn-cancel" onclick="cancelOrder(${order.id})">取消订单</button>
+                    </div>
+                ` : `
+                    <div class="order-actions">
+                        <button onclick="viewOrderDetail(${order.id})">查看详情</button>
+                    </div>
+                `}
+            </div>
+        `;
+    }).join('');
+}
+
 async function loadMyOrders(status = '') {
+    ordersStatus = status;
+    $('#ordersMore').style.display = 'none';
+    
     try {
         let url = '/orders/my';
         if (status) url += `?status=${status}`;
         
-        const orders = await apiRequest(url);
+        const page = await apiRequest(url);
+        ordersCursor = page.next_cursor;
         
-        if (orders.length === 0) {
+        if (page.orders.length === 0) {
             $('#ordersList').innerHTML = '<div class="empty-state"><p>暂无订单</p></div>';
             return;
         }
         
-        const mealTypeMap = {
-            'breakfast': '早餐',
-            'lunch': '午餐',
-            'dinner': '晚餐'
-        };
-        
-        const statusMap = {
-            'placed': '已下单',
-            'cancelled': '已取消',
-            'completed': '已完成'
-        };
-        
-        const html = orders.map(order => {
-            const canCancel = order.status === 'placed';
-            
-            return `
-                <div class="order-card">
-                    <div class="order-header-info">
-                        <span class="order-no">订单号: ${order.order_no}</span>
-                        <span class="order-status status-${order.status}">${statusMap[order.status]}</span>
-                    </div>
-                    <div class="order-details">
-                        <p>📍 ${order.canteen_name}</p>
-                        <p>📅 ${order.order_date} ${mealTypeMap[order.meal_type]}</p>
-                        <p>💰 金额: ¥${order.total_amount.toFixed(2)}</p>
-                        <p>🕐 下单时间: ${order.created_at}</p>
-                    </div>
-                    ${canCancel ? `
-                        <div class="order-actions">
-                            <button onclick="viewOrderDetail(${order.id})">查看详情</button>
-                            <button class="btn-cancel" onclick="cancelOrder(${order.id})">取消订单</button>
-                        </div>
-                    ` : `
-                        <div class="order-actions">
-                            <button onclick="viewOrderDetail(${order.id})">查看详情</button>
-                        </div>
-                    `}
-                </div>
-            `;
-        }).join('');
+        $('#ordersList').innerHTML = renderOrderCards(page.orders);
+        $('#ordersMore').style.display = ordersCursor ? 'block' : 'none';
+    } catch (error) {
+        // 错误已处理
+    }
+}
+
+async function loadMoreOrders() {
+    if (!ordersCursor) return;
+    
+    try {
+        let url = `/orders/my?cursor=${encodeURIComponent(ordersCursor)}`;
+        if (ordersStatus) url += `&status=${ordersStatus}`;
         
-        $('#ordersList').innerHTML = html;
+        const page = await apiRequest(url);
+        ordersCursor = page.next_cursor;
+        $('#ordersList').insertAdjacentHTML('beforeend', renderOrderCards(page.orders));
+        $('#ordersMore').style.display = ordersCursor ? 'block' : 'none';
     } catch (error) {
         // 错误已处理
     }
 }
 
+$('#loadMoreOrdersBtn').addEventListener('click', loadMoreOrders);
+
 // 查看订单详情
 async function viewOrderDetail(orderId) {
     try {
@@ -429,15 +519,21 @@ async function cancelOrder(orderId) {
         return;
     }
     
+    const action = `cancelOrder:${orderId}`;
     try {
         await apiRequest(`/orders/${orderId}/cancel`, {
-            method: 'POST'
+            method: 'POST',
+            headers: { 'Idempotency-Key': idempotencyKeyFor(action, '') }
         });
+        delete pendingKeys[action];
         
         alert('订单已取消');
         loadMyOrders();
     } catch (error) {
         // 错误已处理
+        if (error.code !== undefined && error.retryAfter === undefined) {
+            delete pendingKeys[action];
+        }
     }
 }
 